@@ -1,6 +1,6 @@
 import os
 from celery import Celery, Task
-from celery.signals import task_failure, task_retry
+from celery.signals import task_retry
 import logging
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "api.settings")
@@ -29,19 +29,20 @@ class CallbackTask(Task):
 
 
 # Celery beat schedule for periodic tasks
+# (webhook retries are timed by run_webhook_scheduler, not beat)
 app.conf.beat_schedule = {
-    'process-pending-webhooks': {
-        'task': 'webhooks.tasks.process_pending_webhooks',
+    'flush-webhook-stats': {
+        'task': 'webhooks.tasks.flush_webhook_stats',
+        'schedule': 10.0,  # Every 10 seconds
+    },
+    'recover-webhook-claims': {
+        'task': 'webhooks.tasks.recover_webhook_claims',
         'schedule': 60.0,  # Every minute
     },
     'cleanup-old-deliveries': {
         'task': 'webhooks.tasks.cleanup_old_deliveries',
         'schedule': 3600.0,  # Every hour
     },
-    'retry-failed-webhooks': {
-        'task': 'webhooks.tasks.retry_failed_webhooks',
-        'schedule': 300.0,  # Every 5 minutes
-    },
 }
 
 # Task routing
@@ -61,24 +62,6 @@ app.conf.worker_prefetch_multiplier = 4
 app.conf.worker_max_tasks_per_child = 1000
 
 
-@task_failure.connect
-def handle_task_failure(sender=None, task_id=None, exception=None, args=None, kwargs=None, **kw):
-    """Handle task failures and send to DLQ if needed"""
-    from webhooks.models import Delivery
-    
-    # Check if this is a webhook delivery task
-    if sender.name == 'webhooks.tasks.deliver_webhook' and args:
-        delivery_id = args[0]
-        try:
-            delivery = Delivery.objects.get(id=delivery_id)
-            if delivery.attempt >= 7:  # Max retries reached
-                # Move to DLQ
-                from webhooks.tasks import send_to_dlq
-                send_to_dlq.delay(delivery_id, str(exception))
-        except Delivery.DoesNotExist:
-            pass
-
-
 @task_retry.connect
 def handle_task_retry(sender=None, task_id=None, reason=None, **kw):
     """Log task retries"""
@@ -257,4 +257,49 @@ SUBMISSION_RATE_LIMIT_PER_MINUTE = config("SUBMISSION_RATE_LIMIT_PER_MINUTE", de
 
 # Ingest service settings
 INGEST_SERVICE_URL = config("INGEST_SERVICE_URL", default="http://localhost:8001")
+FORM_REGISTRY_REDIS_URL = config("FORM_REGISTRY_REDIS_URL", default=CELERY_BROKER_URL)
+FORM_REGISTRY_CHANNEL = "forms:registry"
+WEBHOOK_SUBSCRIPTIONS_REDIS_URL = config("WEBHOOK_SUBSCRIPTIONS_REDIS_URL", default=CELERY_BROKER_URL)
+WEBHOOK_SUBSCRIPTIONS_CHANNEL = "webhooks:subscriptions"
+
+# Webhook delivery engine (python manage.py run_webhook_engine)
+WEBHOOK_ENGINE_REDIS_URL = config("WEBHOOK_ENGINE_REDIS_URL", default=CELERY_BROKER_URL)
+WEBHOOK_TIMEOUT_SECONDS = config("WEBHOOK_TIMEOUT_SECONDS", default=30, cast=int)
+WEBHOOK_ENGINE_CONNECT_TIMEOUT_SECONDS = config("WEBHOOK_ENGINE_CONNECT_TIMEOUT_SECONDS", default=5, cast=int)
+WEBHOOK_ENGINE_MAX_IN_FLIGHT = config("WEBHOOK_ENGINE_MAX_IN_FLIGHT", default=2000, cast=int)
+WEBHOOK_ENGINE_MAX_PENDING = config("WEBHOOK_ENGINE_MAX_PENDING", default=10000, cast=int)
+WEBHOOK_ENGINE_ENDPOINT_CONCURRENCY = config("WEBHOOK_ENGINE_ENDPOINT_CONCURRENCY", default=10, cast=int)
+WEBHOOK_ENGINE_MAX_CONNECTIONS_PER_HOST = config("WEBHOOK_ENGINE_MAX_CONNECTIONS_PER_HOST", default=50, cast=int)
+WEBHOOK_ENGINE_MAX_HOSTS = config("WEBHOOK_ENGINE_MAX_HOSTS", default=1024, cast=int)
+WEBHOOK_ENGINE_MAX_RESPONSE_BYTES = config("WEBHOOK_ENGINE_MAX_RESPONSE_BYTES", default=10000, cast=int)
+WEBHOOK_ENGINE_DB_THREADS = config("WEBHOOK_ENGINE_DB_THREADS", default=16, cast=int)
+# A claimed delivery not finished within this long is handed back (engine crash)
+WEBHOOK_ENGINE_CLAIM_LEASE_SECONDS = config("WEBHOOK_ENGINE_CLAIM_LEASE_SECONDS", default=900, cast=int)
+
+# Webhook retry scheduler (python manage.py run_webhook_scheduler)
+WEBHOOK_SCHEDULER_BATCH_SIZE = config("WEBHOOK_SCHEDULER_BATCH_SIZE", default=500, cast=int)
+WEBHOOK_SCHEDULER_TICK_SECONDS = config("WEBHOOK_SCHEDULER_TICK_SECONDS", default=0.5, cast=float)
+
+# Default outbound token bucket per webhook (Webhook.rate_limit_* override it)
+WEBHOOK_RATE_LIMIT_PER_MINUTE = config("WEBHOOK_RATE_LIMIT_PER_MINUTE", default=100, cast=int)
+WEBHOOK_RATE_LIMIT_BURST = config("WEBHOOK_RATE_LIMIT_BURST", default=20, cast=int)
+
+# Delivery idempotency keys are remembered in Redis this long (webhooks/delivery.py)
+WEBHOOK_IDEMPOTENCY_TTL_SECONDS = config("WEBHOOK_IDEMPOTENCY_TTL_SECONDS", default=600, cast=int)
+
+# Circuit breaker per webhook host (webhooks/breaker.py)
+WEBHOOK_BREAKER_WINDOW_SECONDS = config("WEBHOOK_BREAKER_WINDOW_SECONDS", default=60, cast=int)
+WEBHOOK_BREAKER_BUCKET_SECONDS = config("WEBHOOK_BREAKER_BUCKET_SECONDS", default=10, cast=int)
+WEBHOOK_BREAKER_MIN_REQUESTS = config("WEBHOOK_BREAKER_MIN_REQUESTS", default=20, cast=int)
+WEBHOOK_BREAKER_FAILURE_RATE = config("WEBHOOK_BREAKER_FAILURE_RATE", default=0.5, cast=float)
+WEBHOOK_BREAKER_OPEN_SECONDS = config("WEBHOOK_BREAKER_OPEN_SECONDS", default=30, cast=int)
+WEBHOOK_BREAKER_MAX_OPEN_SECONDS = config("WEBHOOK_BREAKER_MAX_OPEN_SECONDS", default=600, cast=int)
+# Parked deliveries are queued again after this long if no probe released them
+WEBHOOK_BREAKER_RECHECK_SECONDS = config("WEBHOOK_BREAKER_RECHECK_SECONDS", default=3600, cast=int)
+
+# Delivery attempt logs (webhooks/logs.py)
+# Share of successful attempts logged in full under the "sampled" policy
+WEBHOOK_LOG_SAMPLE_RATE = config("WEBHOOK_LOG_SAMPLE_RATE", default=0.01, cast=float)
+# Compressed bodies above this size go to SECURE_STORAGE_ROOT/webhook-logs
+WEBHOOK_LOG_MAX_INLINE_BYTES = config("WEBHOOK_LOG_MAX_INLINE_BYTES", default=8192, cast=int)
 INTERNAL_API_KEY = config("INTERNAL_API_KEY", default="internal-worker-key")
\ No newline at end of file
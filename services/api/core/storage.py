@@ -147,6 +147,17 @@ class GDPRExportStorage(SecureLocalStorage):
         return saved_path, signed_url
 
 
+class WebhookLogStorage(SecureLocalStorage):
+    """Storage for compressed webhook log bodies too large to keep in the database"""
+    
+    def __init__(self):
+        location = os.path.join(settings.SECURE_STORAGE_ROOT, 'webhook-logs')
+        super().__init__(location=location)
+        
+        os.makedirs(location, mode=0o700, exist_ok=True)
+
+
 # Singleton instances
 form_upload_storage = FormUploadStorage()
-gdpr_export_storage = GDPRExportStorage()
\ No newline at end of file
+gdpr_export_storage = GDPRExportStorage()
+webhook_log_storage = WebhookLogStorage()
\ No newline at end of file
@@ -4,6 +4,9 @@ import uuid
 from core.models import BaseModel, Organization, User
 # from core.db_utils import get_array_field  # Not needed with JSONField
 
+# Answer.type for blocks the schema does not describe
+DEFAULT_ANSWER_TYPE = 'text'
+
 
 class Form(BaseModel):
     """Form model"""
@@ -105,4 +108,15 @@ class FormVersion(BaseModel):
         ]
     
     def __str__(self):
-        return f"{self.form.title} v{self.version}"
\ No newline at end of file
+        return f"{self.form.title} v{self.version}"
+    
+    def block_types(self):
+        """Map of block id to block type from the schema (flat or paged layout)"""
+        schema = self.schema if isinstance(self.schema, dict) else {}
+        containers = [schema] + [page for page in schema.get('pages') or [] if isinstance(page, dict)]
+        return {
+            str(block['id']): str(block.get('type') or DEFAULT_ANSWER_TYPE)
+            for container in containers
+            for block in container.get('blocks') or []
+            if isinstance(block, dict) and block.get('id')
+        }
\ No newline at end of file
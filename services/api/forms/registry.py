@@ -0,0 +1,61 @@
+"""
+Notify the ingest service's published-form registry about publish changes
+"""
+import json
+import logging
+
+import redis
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+
+logger = logging.getLogger(__name__)
+
+_client = None
+
+
+def _get_client():
+    global _client
+    if _client is None:
+        _client = redis.from_url(
+            settings.FORM_REGISTRY_REDIS_URL,
+            socket_connect_timeout=2,
+            socket_timeout=2
+        )
+    return _client
+
+
+def _publish(message):
+    try:
+        _get_client().publish(settings.FORM_REGISTRY_CHANNEL, json.dumps(message))
+    except Exception:
+        # Ingest entries still expire on their own TTL
+        logger.exception(f"Failed to publish form registry update for form {message.get('form_id')}")
+
+
+def published_version(form):
+    """Version ingest serves for a form: the highest published one, as ingest's own query picks"""
+    return form.versions.filter(published_at__isnull=False).aggregate(version=Max('version'))['version']
+
+
+def notify_form_published(form):
+    """Tell ingest a form is accepting submissions, for its highest published version"""
+    def send():
+        _publish({
+            'action': 'publish',
+            'form_id': str(form.id),
+            'organization_id': str(form.organization_id),
+            'version': published_version(form),
+            'plan': form.organization.plan,
+        })
+    # After commit, so the version matches what ingest reads from the database
+    transaction.on_commit(send)
+
+
+def notify_form_unpublished(form):
+    """Tell ingest to stop accepting submissions for a form"""
+    message = {
+        'action': 'unpublish',
+        'form_id': str(form.id),
+    }
+    transaction.on_commit(lambda: _publish(message))
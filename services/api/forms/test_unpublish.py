@@ -1,4 +1,5 @@
 import pytest
+from unittest.mock import patch
 from django.urls import reverse
 from django.utils import timezone
 from rest_framework import status
@@ -94,6 +95,44 @@ class TestFormUnpublishEndpoint:
         assert version.published_at is None
         assert version.canary_percentage == 0
     
+    def test_unpublish_notifies_ingest_registry(
+        self, api_client, test_user, published_form, django_capture_on_commit_callbacks
+    ):
+        """Test unpublishing tells the ingest form registry after commit"""
+        api_client.force_authenticate(user=test_user)
+        
+        url = reverse("form-unpublish", kwargs={"id": published_form.id})
+        with patch("forms.registry._publish") as mock_publish:
+            with django_capture_on_commit_callbacks(execute=True):
+                response = api_client.post(url)
+        
+        assert response.status_code == status.HTTP_200_OK
+        mock_publish.assert_called_once_with({
+            "action": "unpublish",
+            "form_id": str(published_form.id),
+        })
+    
+    def test_publish_notifies_ingest_registry_with_highest_published_version(
+        self, api_client, test_user, published_form, django_capture_on_commit_callbacks
+    ):
+        """Test publishing an older version still announces the highest published one, as ingest's query does"""
+        older = FormVersion.objects.create(form=published_form, version=0, schema={"blocks": []})
+        api_client.force_authenticate(user=test_user)
+        
+        url = reverse("form-publish", kwargs={"id": published_form.id})
+        with patch("forms.registry._publish") as mock_publish:
+            with django_capture_on_commit_callbacks(execute=True):
+                response = api_client.post(url, {"version_id": str(older.id)})
+        
+        assert response.status_code == status.HTTP_200_OK
+        mock_publish.assert_called_once_with({
+            "action": "publish",
+            "form_id": str(published_form.id),
+            "organization_id": str(published_form.organization_id),
+            "version": 1,
+            "plan": published_form.organization.plan,
+        })
+    
     def test_unpublish_all_versions(self, api_client, test_user, published_form):
         """Test unpublishing all versions of a form"""
         # Create another published version
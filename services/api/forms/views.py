@@ -11,6 +11,7 @@ from drf_spectacular.utils import extend_schema
 from .models import Form, FormVersion
 from .serializers import FormSerializer, FormVersionSerializer
 from .filters import FormFilter
+from .registry import notify_form_published, notify_form_unpublished
 from core.models import Organization
 from core.permissions import IsOrganizationMember, CanEditForm
 from core.pagination import StandardResultsSetPagination
@@ -148,6 +149,8 @@ class FormViewSet(AuditMixin, viewsets.ModelViewSet):
         form._current_user = request.user
         form.save()
         
+        notify_form_published(form)
+        
         return Response({
             "status": "published",
             "version": version.version,
@@ -200,6 +203,8 @@ class FormViewSet(AuditMixin, viewsets.ModelViewSet):
         form._current_user = request.user
         form.save()
         
+        notify_form_unpublished(form)
+        
         # Optionally unpublish all versions or just the latest
         unpublish_all = request.data.get("unpublish_all_versions", False)
         
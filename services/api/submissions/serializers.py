@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from core.models import Submission, Answer
+from forms.models import DEFAULT_ANSWER_TYPE, FormVersion
 
 
 class SubmissionAnswerSerializer(serializers.ModelSerializer):
@@ -75,14 +76,22 @@ class SubmissionCreateSerializer(serializers.ModelSerializer):
         # Create the submission
         submission = Submission.objects.create(**validated_data)
         
-        # Create answers
-        for block_id, value in answers_data.items():
-            Answer.objects.create(
+        # Type answers from the submitted version's schema
+        version = FormVersion.objects.filter(
+            form_id=submission.form_id,
+            version=submission.version
+        ).only('schema').first()
+        block_types = version.block_types() if version else {}
+        
+        Answer.objects.bulk_create([
+            Answer(
                 submission=submission,
                 block_id=block_id,
-                type='text',  # Default type, could be inferred from form schema
+                type=block_types.get(block_id, DEFAULT_ANSWER_TYPE),
                 value_json=value
             )
+            for block_id, value in answers_data.items()
+        ])
         
         return submission
 
@@ -4,7 +4,8 @@ from rest_framework.test import APITestCase
 from rest_framework import status
 from django.contrib.auth import get_user_model
 from core.models import Organization, Submission, Answer
-from forms.models import Form
+from forms.models import Form, FormVersion
+from submissions.serializers import SubmissionCreateSerializer
 
 User = get_user_model()
 
@@ -105,6 +106,28 @@ class SubmissionAPITestCase(APITestCase):
         submission = Submission.objects.get(respondent_key='new-respondent-456')
         self.assertEqual(submission.answers.count(), 2)
 
+    def test_created_answers_are_typed_from_version_schema(self):
+        """Answer types come from the submitted version's schema"""
+        FormVersion.objects.create(
+            form=self.form,
+            version=2,
+            schema={"pages": [{"id": "page1", "blocks": [
+                {"id": "field1", "type": "text"},
+                {"id": "field2", "type": "email"},
+                {"id": "field3", "type": "number"},
+            ]}]}
+        )
+        serializer = SubmissionCreateSerializer(data={
+            'respondent_key': 'typed-respondent',
+            'version': 2,
+            'answers': {'field2': 'jane@example.com', 'field3': 42, 'legacy': 'x'}
+        })
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        submission = serializer.save(form=self.form)
+        
+        types = dict(submission.answers.values_list('block_id', 'type'))
+        self.assertEqual(types, {'field2': 'email', 'field3': 'number', 'legacy': 'text'})
+
     @unittest.skip("Permission check for nested organization needs fixing")
     def test_export_submissions_csv(self):
         """Test exporting submissions as CSV"""
@@ -14,13 +14,21 @@ from rest_framework import status
 from core.models import Organization, Submission
 from forms.models import Form
 from webhooks.models import Webhook, Delivery
-from webhooks.tasks import deliver_webhook
+from webhooks.engine import DeliveryEngine, HostPools
 from integrations.models import Integration
+from asgiref.sync import async_to_sync
 # from analytics.models import AnalyticsEvent  # Analytics module doesn't have models yet
 
 User = get_user_model()
 
 
+def deliver_webhook(webhook_id, submission_id):
+    """Create a delivery for the submission and send it through the delivery engine"""
+    delivery = Delivery.objects.create(webhook_id=webhook_id, submission_id=submission_id)
+    engine = DeliveryEngine(None, HostPools(), db_thread_sensitive=True)
+    return async_to_sync(engine.deliver)(delivery.id)
+
+
 class FullSubmissionFlowTests(TransactionTestCase):
     """Test complete submission flow from edge to database"""
     
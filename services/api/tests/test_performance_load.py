@@ -7,6 +7,7 @@ import time
 import concurrent.futures
 import statistics
 from datetime import datetime, timedelta
+from unittest.mock import patch
 import pytest
 from django.test import TransactionTestCase
 from django.db import connection
@@ -480,8 +481,14 @@ class WebhookPerformanceTests(TransactionTestCase):
         # Process batch
         start = time.time()
         
-        from webhooks.tasks import process_pending_webhooks
-        processed = process_pending_webhooks(batch_size=100)
+        import fakeredis
+        from asgiref.sync import async_to_sync
+        from webhooks.scheduler import RetryScheduler, rebuild_schedule
+        server = fakeredis.FakeServer()
+        with patch('webhooks.scheduler.get_client', return_value=fakeredis.FakeRedis(server=server)):
+            rebuild_schedule()
+        scheduler = RetryScheduler(fakeredis.aioredis.FakeRedis(server=server), batch_size=100)
+        processed = async_to_sync(scheduler.pop_due)()
         
         batch_time = time.time() - start
         
@@ -1,5 +1,6 @@
 from django.contrib import admin
 from django.utils.html import format_html
+from .logs import request_body, response_body
 from .models import Webhook, Delivery, DeadLetterQueue, WebhookLog
 
 
@@ -97,9 +98,21 @@ class WebhookLogAdmin(admin.ModelAdmin):
     list_filter = ['response_status', 'timestamp']
     search_fields = ['delivery__id', 'error_message']
     readonly_fields = [
-        'delivery', 'request_headers', 'request_body',
-        'response_headers', 'response_body', 'error_message'
+        'delivery', 'request_headers', 'logged_request_body',
+        'response_headers', 'logged_response_body', 'error_message'
     ]
+    exclude = [
+        'request_body', 'request_body_zstd', 'request_body_file',
+        'response_body', 'response_body_zstd', 'response_body_file'
+    ]
+    
+    def logged_request_body(self, obj):
+        return request_body(obj)
+    logged_request_body.short_description = 'Request body'
+    
+    def logged_response_body(self, obj):
+        return response_body(obj)
+    logged_response_body.short_description = 'Response body'
     
     def has_add_permission(self, request):
         return False
\ No newline at end of file
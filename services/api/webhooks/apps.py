@@ -3,4 +3,8 @@ from django.apps import AppConfig
 
 class WebhooksConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
-    name = "webhooks"
\ No newline at end of file
+    name = "webhooks"
+    
+    def ready(self):
+        """Import signal handlers when app is ready"""
+        from . import signals  # noqa: F401
@@ -0,0 +1,301 @@
+"""
+Circuit breaker per webhook URL host, shared by every engine process in Redis
+- closed: deliveries go out; outcomes are counted in time buckets and the
+  breaker opens once the failure rate over the window crosses the threshold
+- open: deliveries are parked on a per-host list instead of burning retries
+- half_open: after the cool-down one parked delivery is released as the
+  probe; success closes the breaker and releases every parked delivery,
+  failure reopens it with a doubled cool-down
+"""
+import logging
+import time
+from typing import Any, Dict, Iterable, Optional
+
+import httpx
+from django.conf import settings
+
+from .queue import QUEUE_KEY, get_client
+
+logger = logging.getLogger(__name__)
+
+STATE_KEY = "webhooks:breaker:{host}"
+WINDOW_KEY = "webhooks:breaker:{host}:window"
+PARKED_KEY = "webhooks:breaker:{host}:parked"
+# Hosts with an open breaker, scored by when their next probe is due
+OPEN_KEY = "webhooks:breakers:open"
+
+ALLOW = 'allow'
+PROBE = 'probe'
+PARK = 'park'
+
+# Decide whether a delivery may go out
+# KEYS: state; ARGV: now, probe lease seconds, delivery id
+ACQUIRE_SCRIPT = """
+local state = redis.call('HGET', KEYS[1], 'state')
+if not state or state == 'closed' then
+    return 'allow'
+end
+local now = tonumber(ARGV[1])
+if state == 'open' and now < tonumber(redis.call('HGET', KEYS[1], 'open_until')) then
+    return 'park'
+end
+-- One probe at a time; a probe that never reports back is replaced after its lease
+if state == 'half_open' and now < tonumber(redis.call('HGET', KEYS[1], 'probe_until')) then
+    return 'park'
+end
+redis.call('HSET', KEYS[1], 'state', 'half_open', 'probe', ARGV[3], 'probe_until', now + tonumber(ARGV[2]))
+return 'probe'
+"""
+
+# Count an outcome and move between states
+# KEYS: state, window, parked, open hosts, delivery queue
+# ARGV: now, ok (1/0), host, delivery id, bucket seconds, window seconds,
+#       min requests, failure rate, open seconds, max open seconds
+RECORD_SCRIPT = """
+local now = tonumber(ARGV[1])
+local ok = ARGV[2] == '1'
+local state = redis.call('HGET', KEYS[1], 'state') or 'closed'
+
+local function open(cooldown)
+    redis.call('HSET', KEYS[1], 'state', 'open', 'open_until', now + cooldown, 'cooldown', cooldown)
+    redis.call('HDEL', KEYS[1], 'probe', 'probe_until')
+    redis.call('EXPIRE', KEYS[1], 86400)
+    redis.call('DEL', KEYS[2])
+    redis.call('ZADD', KEYS[4], now + cooldown, ARGV[3])
+end
+
+if state == 'open' then
+    -- Requests sent before the breaker opened
+    return 'open'
+end
+
+if state == 'half_open' then
+    if redis.call('HGET', KEYS[1], 'probe') ~= ARGV[4] then
+        return 'half_open'
+    end
+    if not ok then
+        local cooldown = tonumber(redis.call('HGET', KEYS[1], 'cooldown') or ARGV[9]) * 2
+        open(math.min(cooldown, tonumber(ARGV[10])))
+        return 'open'
+    end
+    redis.call('DEL', KEYS[1], KEYS[2])
+    redis.call('ZREM', KEYS[4], ARGV[3])
+    -- Oldest parked delivery first: the queue is consumed from the right
+    local parked = redis.call('LRANGE', KEYS[3], 0, -1)
+    redis.call('DEL', KEYS[3])
+    for i = #parked, 1, -1 do
+        redis.call('LPUSH', KEYS[5], parked[i])
+    end
+    return 'closed'
+end
+
+local bucket_seconds = tonumber(ARGV[5])
+local bucket = math.floor(now / bucket_seconds)
+local oldest = bucket - math.floor(tonumber(ARGV[6]) / bucket_seconds) + 1
+redis.call('HINCRBY', KEYS[2], (ok and 'ok:' or 'fail:') .. bucket, 1)
+redis.call('EXPIRE', KEYS[2], tonumber(ARGV[6]) * 2)
+if ok then
+    return 'closed'
+end
+
+local total, failed = 0, 0
+local fields = redis.call('HGETALL', KEYS[2])
+for i = 1, #fields, 2 do
+    local kind, b = string.match(fields[i], '(%a+):(%d+)')
+    if tonumber(b) < oldest then
+        redis.call('HDEL', KEYS[2], fields[i])
+    else
+        local n = tonumber(fields[i + 1])
+        total = total + n
+        if kind == 'fail' then
+            failed = failed + n
+        end
+    end
+end
+if total >= tonumber(ARGV[7]) and failed / total >= tonumber(ARGV[8]) then
+    open(tonumber(ARGV[9]))
+    return 'open'
+end
+return 'closed'
+"""
+
+# Release the oldest parked delivery of a host whose probe is due
+# KEYS: open hosts, parked, delivery queue; ARGV: host, now, probe lease seconds
+RELEASE_PROBE_SCRIPT = """
+local due = redis.call('ZSCORE', KEYS[1], ARGV[1])
+if not due or tonumber(due) > tonumber(ARGV[2]) then
+    return false
+end
+local delivery_id = redis.call('RPOP', KEYS[2])
+if not delivery_id then
+    -- Nothing parked; the next delivery for the host becomes the probe
+    redis.call('ZREM', KEYS[1], ARGV[1])
+    return false
+end
+redis.call('LPUSH', KEYS[3], delivery_id)
+redis.call('ZADD', KEYS[1], tonumber(ARGV[2]) + tonumber(ARGV[3]), ARGV[1])
+return delivery_id
+"""
+
+
+def breaker_host(url: str) -> str:
+    """Breakers are shared by every webhook pointing at the same host"""
+    return httpx.URL(url).host
+
+
+def is_endpoint_failure(status_code: Optional[int]) -> bool:
+    """Failures that say the endpoint is down; 4xx other than 429 do not count"""
+    return status_code is None or status_code >= 500 or status_code == 429
+
+
+class CircuitBreaker:
+    """Async breaker operations for the delivery engine; Redis trouble fails open"""
+
+    def __init__(
+        self,
+        redis_client,
+        window_seconds: int = 60,
+        bucket_seconds: int = 10,
+        min_requests: int = 20,
+        failure_rate: float = 0.5,
+        open_seconds: int = 30,
+        max_open_seconds: int = 600,
+        probe_lease_seconds: int = 35,
+    ):
+        self.redis = redis_client
+        self.window_seconds = window_seconds
+        self.bucket_seconds = bucket_seconds
+        self.min_requests = min_requests
+        self.failure_rate = failure_rate
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.probe_lease_seconds = probe_lease_seconds
+
+        self._acquire = redis_client.register_script(ACQUIRE_SCRIPT)
+        self._record = redis_client.register_script(RECORD_SCRIPT)
+        self._release_probe = redis_client.register_script(RELEASE_PROBE_SCRIPT)
+
+    @classmethod
+    def from_settings(cls, redis_client) -> "CircuitBreaker":
+        return cls(
+            redis_client,
+            window_seconds=settings.WEBHOOK_BREAKER_WINDOW_SECONDS,
+            bucket_seconds=settings.WEBHOOK_BREAKER_BUCKET_SECONDS,
+            min_requests=settings.WEBHOOK_BREAKER_MIN_REQUESTS,
+            failure_rate=settings.WEBHOOK_BREAKER_FAILURE_RATE,
+            open_seconds=settings.WEBHOOK_BREAKER_OPEN_SECONDS,
+            max_open_seconds=settings.WEBHOOK_BREAKER_MAX_OPEN_SECONDS,
+            # Long enough for the probe's request to time out and report back
+            probe_lease_seconds=settings.WEBHOOK_TIMEOUT_SECONDS + 5,
+        )
+
+    async def acquire(self, host: str, delivery_id: str, now: Optional[float] = None) -> str:
+        """ALLOW, PROBE (send, and report back as the half-open probe) or PARK"""
+        try:
+            decision = await self._acquire(
+                keys=[STATE_KEY.format(host=host)],
+                args=[now or time.time(), self.probe_lease_seconds, delivery_id],
+            )
+        except Exception as e:
+            logger.warning(f"Circuit breaker unavailable for {host}: {e}")
+            return ALLOW
+        return decision.decode() if isinstance(decision, bytes) else decision
+
+    async def record(self, host: str, delivery_id: str, ok: bool, now: Optional[float] = None) -> Optional[str]:
+        """Count an outcome; returns the breaker state afterwards"""
+        try:
+            state = await self._record(
+                keys=[
+                    STATE_KEY.format(host=host),
+                    WINDOW_KEY.format(host=host),
+                    PARKED_KEY.format(host=host),
+                    OPEN_KEY,
+                    QUEUE_KEY,
+                ],
+                args=[
+                    now or time.time(), 1 if ok else 0, host, delivery_id,
+                    self.bucket_seconds, self.window_seconds, self.min_requests,
+                    self.failure_rate, self.open_seconds, self.max_open_seconds,
+                ],
+            )
+        except Exception as e:
+            logger.warning(f"Circuit breaker unavailable for {host}: {e}")
+            return None
+        state = state.decode() if isinstance(state, bytes) else state
+        if state == 'open' and not ok:
+            logger.warning(f"Circuit breaker open for webhook host {host}")
+        return state
+
+    async def park(self, host: str, delivery_id: str):
+        """Hold a delivery for the next probe; the Delivery row's recheck time backs this up"""
+        try:
+            await self.redis.lpush(PARKED_KEY.format(host=host), delivery_id)
+        except Exception as e:
+            logger.warning(f"Failed to park delivery {delivery_id} for {host}: {e}")
+
+    async def release_probes(self, now: Optional[float] = None) -> int:
+        """Queue one parked delivery per host whose cool-down is over"""
+        now = now or time.time()
+        hosts = await self.redis.zrangebyscore(OPEN_KEY, '-inf', now, start=0, num=100)
+        released = 0
+        for host in hosts:
+            host = host.decode() if isinstance(host, bytes) else host
+            delivery_id = await self._release_probe(
+                keys=[OPEN_KEY, PARKED_KEY.format(host=host), QUEUE_KEY],
+                args=[host, now, self.probe_lease_seconds],
+            )
+            if delivery_id:
+                released += 1
+        return released
+
+
+def breaker_states(urls: Iterable[str], now: Optional[float] = None) -> Dict[str, Optional[Dict[str, Any]]]:
+    """
+    Breakers of the URLs' hosts as shown in the webhook API, keyed by host,
+    read with one round trip; values are None if Redis is unavailable
+    """
+    hosts = list(dict.fromkeys(breaker_host(url) for url in urls))
+    if not hosts:
+        return {}
+    now = now or time.time()
+    try:
+        pipe = get_client().pipeline(transaction=False)
+        for host in hosts:
+            pipe.hgetall(STATE_KEY.format(host=host))
+            pipe.hgetall(WINDOW_KEY.format(host=host))
+            pipe.llen(PARKED_KEY.format(host=host))
+        results = pipe.execute()
+    except Exception as e:
+        logger.warning(f"Circuit breaker state unavailable for {len(hosts)} hosts: {e}")
+        return dict.fromkeys(hosts)
+
+    oldest = int(now // settings.WEBHOOK_BREAKER_BUCKET_SECONDS) - (
+        settings.WEBHOOK_BREAKER_WINDOW_SECONDS // settings.WEBHOOK_BREAKER_BUCKET_SECONDS
+    ) + 1
+    states = {}
+    for i, host in enumerate(hosts):
+        state, window, parked = results[3 * i:3 * i + 3]
+        state = {key.decode(): value.decode() for key, value in state.items()}
+        requests = failures = 0
+        for field, count in window.items():
+            kind, bucket = field.decode().split(':')
+            if int(bucket) >= oldest:
+                requests += int(count)
+                if kind == 'fail':
+                    failures += int(count)
+
+        open_until = state.get('open_until')
+        states[host] = {
+            'host': host,
+            'state': state.get('state', 'closed'),
+            'failure_rate': round(failures / requests, 4) if requests else 0.0,
+            'window_requests': requests,
+            'open_until': float(open_until) if open_until else None,
+            'parked_deliveries': parked,
+        }
+    return states
+
+
+def breaker_state(url: str, now: Optional[float] = None) -> Optional[Dict[str, Any]]:
+    """Breaker of the URL's host as shown in the webhook API; None if Redis is unavailable"""
+    return breaker_states([url], now)[breaker_host(url)]
@@ -1,298 +1,115 @@
 """
-Webhook delivery service with HMAC signing and retry logic
+Queue webhook deliveries for application events
+- The payload is stored on the Delivery row; the delivery engine
+  (webhooks/engine.py) signs, sends and retries it
+- Idempotency keys are unique per webhook (Delivery.idempotency_key, a
+  unique partial index); committed keys are also remembered in Redis for
+  WEBHOOK_IDEMPOTENCY_TTL_SECONDS, so repeated fan-outs are rejected there
+  without a database round trip
 """
-import json
 import logging
-import requests
-from datetime import timedelta
 from typing import Dict, Any, Optional
 from celery import shared_task
 from django.conf import settings
+from django.db import IntegrityError, transaction
 from django.utils import timezone
-from django.db import transaction
 
-from .models import Webhook, Delivery, DeadLetterQueue, WebhookLog
-from .signing import WebhookSigner
+from .models import Webhook, Delivery, DeadLetterQueue
+from .queue import enqueue_delivery, get_client
+from .tasks import BATCH_EVENT, redrive_dlq_entry
 from core.models import Submission, Partial
 
 logger = logging.getLogger(__name__)
 
+IDEMPOTENCY_KEY = "webhooks:idempotency:{webhook_id}:{key}"
 
-class WebhookDeliveryService:
-    """Handle webhook delivery with retries and error handling"""
-    
-    # Default timeout for webhook requests (10 seconds)
-    DEFAULT_TIMEOUT = 10
-    
-    # Maximum payload size (1MB)
-    MAX_PAYLOAD_SIZE = 1024 * 1024
-    
-    def __init__(self):
-        self.session = requests.Session()
-        # Set default headers
-        self.session.headers.update({
-            'User-Agent': f'FormsWebhook/{settings.VERSION}',
-        })
-    
-    def prepare_payload(self, webhook: Webhook, event: str, data: Dict[str, Any]) -> Dict[str, Any]:
-        """Prepare webhook payload with standard structure"""
-        payload = {
-            'event': event,
-            'timestamp': timezone.now().isoformat(),
-            'data': data,
-            'webhook': {
-                'id': str(webhook.id),
-                'version': '1.0',
-            }
+
+def prepare_payload(webhook: Webhook, event: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    """Prepare webhook payload with standard structure"""
+    payload = {
+        'event': event,
+        'timestamp': timezone.now().isoformat(),
+        'data': data,
+        'webhook': {
+            'id': str(webhook.id),
+            'version': '1.0',
         }
-        
-        # Add metadata if available
-        if 'form_id' in data:
-            payload['form'] = {'id': data['form_id']}
-            
-        return payload
+    }
     
-    def send_webhook(
-        self, 
-        webhook: Webhook, 
-        event: str, 
-        data: Dict[str, Any],
-        idempotency_key: Optional[str] = None,
-        delivery_id: Optional[str] = None
-    ) -> Delivery:
-        """
-        Send a webhook with HMAC signing
-        
-        Args:
-            webhook: Webhook configuration
-            event: Event type
-            data: Event data
-            idempotency_key: Optional idempotency key
-            delivery_id: Optional delivery ID to retry
-            
-        Returns:
-            Delivery object
-        """
-        # Get or create delivery record
-        if delivery_id:
-            try:
-                delivery = Delivery.objects.get(id=delivery_id, webhook=webhook)
-                delivery.attempt += 1
-            except Delivery.DoesNotExist:
-                logger.error(f"Delivery {delivery_id} not found")
-                raise
-        else:
-            # Check for duplicate delivery using idempotency key
-            if idempotency_key:
-                existing = Delivery.objects.filter(
-                    webhook=webhook,
-                    payload__idempotency_key=idempotency_key
-                ).first()
-                if existing:
-                    logger.info(f"Duplicate delivery for idempotency key {idempotency_key}")
-                    return existing
-                    
-            delivery = Delivery.objects.create(
-                webhook=webhook,
-                event=event,
-                status='processing',
-            )
-        
-        # Prepare payload
-        payload = self.prepare_payload(webhook, event, data)
-        if idempotency_key:
-            payload['idempotency_key'] = idempotency_key
-            
-        # Check payload size
-        payload_json = json.dumps(payload)
-        payload_size = len(payload_json.encode('utf-8'))
-        if payload_size > self.MAX_PAYLOAD_SIZE:
-            self._mark_delivery_failed(
-                delivery, 
-                f"Payload too large: {payload_size} bytes",
-                send_to_dlq=True
-            )
-            return delivery
-            
-        delivery.payload = payload
-        delivery.payload_size = payload_size
-        delivery.save()
-        
-        # Sign payload
-        signer = WebhookSigner(webhook.secret)
-        headers = signer.generate_webhook_headers(payload_json, str(delivery.id))
-        
-        # Add custom headers if configured
-        if webhook.headers_json:
-            headers.update(webhook.headers_json)
-            
-        # Create log entry
-        log = WebhookLog.objects.create(
-            delivery=delivery,
-            attempt=delivery.attempt,
-            request_headers=headers,
-            request_body=payload_json,
-        )
-        
-        # Send the request
-        try:
-            start_time = timezone.now()
-            response = self.session.post(
-                webhook.url,
-                data=payload_json,
-                headers=headers,
-                timeout=self.DEFAULT_TIMEOUT,
-                allow_redirects=False
-            )
-            duration_ms = int((timezone.now() - start_time).total_seconds() * 1000)
-            
-            # Update log with response
-            log.response_status = response.status_code
-            log.response_headers = dict(response.headers)
-            log.response_body = response.text[:10000]  # Limit response size
-            log.duration_ms = duration_ms
-            log.save()
-            
-            # Update delivery
-            delivery.response_code = response.status_code
-            delivery.response_time_ms = duration_ms
-            delivery.delivered_at = timezone.now()
-            
-            # Check if successful
-            if 200 <= response.status_code < 300:
-                self._mark_delivery_success(delivery)
-            else:
-                error_msg = f"HTTP {response.status_code}: {response.text[:500]}"
-                should_retry = response.status_code >= 500 or response.status_code == 429
-                self._mark_delivery_failed(
-                    delivery, 
-                    error_msg,
-                    retry=should_retry and webhook.retry_enabled
-                )
-                
-        except requests.exceptions.Timeout:
-            error_msg = f"Request timeout after {self.DEFAULT_TIMEOUT}s"
-            log.error_message = error_msg
-            log.duration_ms = self.DEFAULT_TIMEOUT * 1000
-            log.save()
-            self._mark_delivery_failed(delivery, error_msg, retry=webhook.retry_enabled)
-            
-        except requests.exceptions.ConnectionError as e:
-            error_msg = f"Connection error: {str(e)}"
-            log.error_message = error_msg
-            log.save()
-            self._mark_delivery_failed(delivery, error_msg, retry=webhook.retry_enabled)
-            
-        except Exception as e:
-            error_msg = f"Unexpected error: {str(e)}"
-            logger.exception(f"Webhook delivery error for {webhook.id}")
-            log.error_message = error_msg
-            log.save()
-            self._mark_delivery_failed(delivery, error_msg, retry=False)
-            
-        return delivery
+    # Add metadata if available
+    if 'form_id' in data:
+        payload['form'] = {'id': data['form_id']}
     
-    def _mark_delivery_success(self, delivery: Delivery):
-        """Mark delivery as successful and update stats"""
-        with transaction.atomic():
-            delivery.status = 'success'
-            delivery.save()
-            
-            # Update webhook stats
-            webhook = delivery.webhook
-            webhook.total_deliveries += 1
-            webhook.successful_deliveries += 1
-            webhook.save()
-            
-    def _mark_delivery_failed(
-        self, 
-        delivery: Delivery, 
-        error_msg: str,
-        retry: bool = True,
-        send_to_dlq: bool = False
-    ):
-        """Mark delivery as failed and schedule retry if needed"""
-        delivery.error = error_msg
-        
-        with transaction.atomic():
-            if retry and delivery.attempt < delivery.webhook.max_retries:
-                # Calculate next retry time
-                retry_delays = [0, 30, 120, 600, 3600, 21600, 86400]  # 0s, 30s, 2m, 10m, 1h, 6h, 24h
-                delay_index = min(delivery.attempt, len(retry_delays) - 1)
-                delay_seconds = retry_delays[delay_index]
-                
-                delivery.status = 'failed'
-                delivery.next_retry_at = timezone.now() + timedelta(seconds=delay_seconds)
-                delivery.save()
-                
-                # Schedule retry
-                schedule_webhook_retry.apply_async(
-                    args=[str(delivery.id)],
-                    eta=delivery.next_retry_at
-                )
-                
-            else:
-                # Max retries exceeded or retry disabled
-                delivery.status = 'dlq' if send_to_dlq else 'failed'
-                delivery.save()
-                
-                # Update webhook stats
-                webhook = delivery.webhook
-                webhook.total_deliveries += 1
-                webhook.failed_deliveries += 1
-                webhook.save()
-                
-                # Add to DLQ if needed
-                if send_to_dlq or (retry and delivery.attempt >= delivery.webhook.max_retries):
-                    DeadLetterQueue.objects.create(
-                        delivery=delivery,
-                        reason=f"Max retries exceeded: {error_msg}",
-                        payload_json=delivery.payload
-                    )
+    return payload
+
 
+def _key_name(webhook: Webhook, idempotency_key: str) -> str:
+    return IDEMPOTENCY_KEY.format(webhook_id=webhook.id, key=idempotency_key)
 
-# Celery tasks
-@shared_task(bind=True, max_retries=3)
-def deliver_webhook(self, webhook_id: str, event: str, data: Dict[str, Any], idempotency_key: Optional[str] = None):
-    """Celery task to deliver webhook"""
+
+def _seen_key(webhook: Webhook, idempotency_key: str) -> bool:
     try:
-        webhook = Webhook.objects.get(id=webhook_id, active=True)
-        service = WebhookDeliveryService()
-        service.send_webhook(webhook, event, data, idempotency_key)
-    except Webhook.DoesNotExist:
-        logger.error(f"Webhook {webhook_id} not found or inactive")
+        return bool(get_client().exists(_key_name(webhook, idempotency_key)))
     except Exception as e:
-        logger.exception(f"Error delivering webhook {webhook_id}")
-        # Retry the task
-        raise self.retry(exc=e, countdown=60)
+        logger.warning(f"Idempotency cache unavailable for webhook {webhook.id}: {e}")
+        return False
 
 
-@shared_task
-def schedule_webhook_retry(delivery_id: str):
-    """Celery task to retry webhook delivery"""
+def _remember_key(webhook: Webhook, idempotency_key: str):
     try:
-        delivery = Delivery.objects.get(id=delivery_id)
-        if delivery.status != 'failed' or not delivery.next_retry_at:
-            logger.info(f"Delivery {delivery_id} no longer needs retry")
-            return
-            
-        # Check if it's time to retry
-        if timezone.now() < delivery.next_retry_at:
-            logger.info(f"Delivery {delivery_id} not ready for retry yet")
-            return
-            
-        service = WebhookDeliveryService()
-        service.send_webhook(
-            delivery.webhook,
-            delivery.event,
-            delivery.payload['data'],
-            delivery.payload.get('idempotency_key'),
-            delivery_id
-        )
-    except Delivery.DoesNotExist:
-        logger.error(f"Delivery {delivery_id} not found")
-    except Exception:
-        logger.exception(f"Error retrying webhook delivery {delivery_id}")
+        get_client().set(_key_name(webhook, idempotency_key), 1, ex=settings.WEBHOOK_IDEMPOTENCY_TTL_SECONDS)
+    except Exception as e:
+        logger.warning(f"Idempotency cache unavailable for webhook {webhook.id}: {e}")
+
+
+def queue_webhook(
+    webhook: Webhook,
+    event: str,
+    data: Dict[str, Any],
+    idempotency_key: Optional[str] = None
+) -> Optional[Delivery]:
+    """
+    Create a pending delivery for the engine
+    
+    Args:
+        webhook: Webhook configuration
+        event: Event type
+        data: Event data
+        idempotency_key: Optional idempotency key
+    
+    Returns:
+        Delivery object, or None when the webhook already has a delivery
+        for the idempotency key
+    """
+    if idempotency_key and _seen_key(webhook, idempotency_key):
+        logger.info(f"Duplicate delivery for idempotency key {idempotency_key}")
+        return None
+    
+    payload = prepare_payload(webhook, event, data)
+    if idempotency_key:
+        payload['idempotency_key'] = idempotency_key
+    
+    try:
+        # A savepoint, so a duplicate leaves the caller's transaction usable
+        with transaction.atomic():
+            delivery = Delivery.objects.create(
+                webhook=webhook,
+                event=event,
+                payload=payload,
+                idempotency_key=idempotency_key or None,
+            )
+    except IntegrityError:
+        if not idempotency_key:
+            raise
+        logger.info(f"Duplicate delivery for idempotency key {idempotency_key}")
+        _remember_key(webhook, idempotency_key)
+        return None
+    
+    if idempotency_key:
+        # Only keys of committed deliveries, so a rolled back fan-out can run again
+        transaction.on_commit(lambda: _remember_key(webhook, idempotency_key))
+    enqueue_delivery(delivery.id)
+    return delivery
 
 
 @shared_task
@@ -305,10 +122,12 @@ def process_dlq_redrives():
     ).select_related('delivery__webhook')[:100]
     
     for entry in entries:
+        if entry.delivery.event == BATCH_EVENT:
+            redrive_dlq_entry(entry.id)
+            continue
         try:
             # Create new delivery for redrive
-            service = WebhookDeliveryService()
-            new_delivery = service.send_webhook(
+            new_delivery = queue_webhook(
                 entry.delivery.webhook,
                 entry.payload_json['event'],
                 entry.payload_json['data'],
@@ -319,8 +138,11 @@ def process_dlq_redrives():
             entry.redriven_at = timezone.now()
             entry.save()
             
-            logger.info(f"Redrove DLQ entry {entry.id} as delivery {new_delivery.id}")
-            
+            if new_delivery is None:
+                logger.info(f"DLQ entry {entry.id} already has a delivery for its idempotency key")
+            else:
+                logger.info(f"Redrove DLQ entry {entry.id} as delivery {new_delivery.id}")
+        
         except Exception:
             logger.exception(f"Error redriving DLQ entry {entry.id}")
 
@@ -345,9 +167,9 @@ def trigger_webhook_for_submission(submission: Submission):
     for webhook in webhooks:
         if webhook.events and 'submission.created' not in webhook.events:
             continue
-            
-        deliver_webhook.delay(
-            str(webhook.id),
+        
+        queue_webhook(
+            webhook,
             'submission.created',
             data,
             f"submission-{submission.id}"
@@ -376,10 +198,10 @@ def trigger_webhook_for_partial(partial: Partial):
     for webhook in webhooks:
         if webhook.events and 'submission.partial' not in webhook.events:
             continue
-            
-        deliver_webhook.delay(
-            str(webhook.id),
+        
+        queue_webhook(
+            webhook,
             'submission.partial',
             data,
             f"partial-{partial.id}-{partial.updated_at.timestamp()}"
-        )
\ No newline at end of file
+        )
@@ -0,0 +1,629 @@
+"""
+Asynchronous webhook delivery engine
+- Run by a dedicated process (python manage.py run_webhook_engine) that keeps
+  thousands of deliveries in flight on one event loop, instead of one blocking
+  request per Celery prefork slot
+- Work arrives as delivery ids on a Redis list (webhooks/queue.py); rows are
+  claimed with a conditional UPDATE, so an id queued twice is sent once
+- One httpx.AsyncClient per destination host, each with its own connection cap
+- Per-endpoint concurrency caps (Webhook.max_concurrency, or the engine default)
+- Per-webhook token buckets; deliveries over the rate wait for the slot
+  reserved for them (webhooks/ratelimit.py)
+- A circuit breaker per destination host parks deliveries while it is down
+  (webhooks/breaker.py)
+- Webhooks with batching enabled get their deliveries collected per webhook
+  and sent as one signed JSON array; the batch is a Delivery of its own
+  (event BATCH_EVENT) that is retried and dead-lettered as a whole
+- Retries and other delayed deliveries go on the Redis timing wheel
+  (webhooks/scheduler.py) instead of waiting in memory
+- Claims are leased (next_retry_at while processing); deliveries held by an
+  engine that died are handed back once the lease expires
+- Response bodies are read up to a byte limit; attempts are logged under the
+  webhook's log policy (webhooks/logs.py)
+"""
+import asyncio
+import functools
+import json
+import logging
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from datetime import timedelta
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import httpx
+import redis.asyncio as aioredis
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .breaker import PARK, CircuitBreaker, breaker_host, is_endpoint_failure
+from .logs import write_log
+from .models import Webhook, Delivery, DeadLetterQueue
+from .queue import QUEUE_KEY, SCHEDULE_KEY
+from .ratelimit import reserve_slot
+from .stats import record_latency, record_outcome
+from .tasks import (
+    BATCH_EVENT, MAX_PAYLOAD_SIZE, RETRY_DELAYS,
+    calculate_hmac_signature, prepare_webhook_payload, render_payload,
+)
+
+logger = logging.getLogger(__name__)
+
+Origin = Tuple[str, str, int]
+
+
+class PreparedDelivery(NamedTuple):
+    """A claimed delivery with its signed request"""
+    delivery: Delivery
+    # None when the body was rendered from a shared payload
+    payload: Optional[Dict[str, Any]]
+    payload_json: str
+    headers: Dict[str, str]
+
+    def payload_dict(self) -> Dict[str, Any]:
+        """The payload as a dict; decoded only where it is needed (DLQ entries, batches)"""
+        return self.payload if self.payload is not None else json.loads(self.payload_json)
+
+
+def is_batched(delivery: Delivery) -> bool:
+    """Deliveries that wait to be sent in a batch rather than on their own"""
+    return delivery.webhook.batch_enabled and delivery.event != BATCH_EVENT
+
+
+class Attempt(NamedTuple):
+    """Outcome of one HTTP attempt"""
+    status_code: Optional[int] = None
+    headers: Optional[Dict[str, str]] = None
+    body: Optional[str] = None
+    duration_ms: int = 0
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code is not None and 200 <= self.status_code < 300
+
+
+async def read_limited(response: httpx.Response, limit: int) -> Tuple[bytes, bool]:
+    """Read at most `limit` bytes of a streamed body; True when it was cut short"""
+    body = bytearray()
+    async for chunk in response.aiter_bytes():
+        if len(body) + len(chunk) > limit:
+            body += chunk[:limit - len(body)]
+            return bytes(body), True
+        body += chunk
+    return bytes(body), False
+
+
+# Database side, run in threads
+def claim_delivery(delivery_id: str) -> Tuple[Optional[PreparedDelivery], Optional[float]]:
+    """
+    Claim a due pending delivery and build its signed request
+
+    Returns the prepared request, or None with the seconds after which the
+    delivery should be queued again (None when there is nothing left to do).
+    """
+    try:
+        delivery = Delivery.objects.select_related('webhook', 'submission', 'partial', 'shared_payload').get(id=delivery_id)
+    except Delivery.DoesNotExist:
+        logger.warning(f"Queued delivery {delivery_id} not found")
+        return None, None
+
+    now = timezone.now()
+    if delivery.status == 'parked':
+        # Released by its host's circuit breaker
+        pass
+    elif delivery.status != 'pending' or (delivery.next_retry_at and delivery.next_retry_at > now):
+        # Already handled, or queued again before it is due
+        return None, None
+
+    webhook = delivery.webhook
+    # Batch members are rate limited as part of their batch
+    wait = reserve_slot(webhook, delivery.id) if webhook.active and not is_batched(delivery) else 0
+    if wait:
+        # Over the webhook's rate: come back for the slot reserved for it
+        delivery.next_retry_at = now + timedelta(seconds=wait)
+        delivery.save(update_fields=['next_retry_at'])
+        return None, wait
+
+    # A failed attempt leaves its error behind; the next claim counts a new attempt
+    attempt = delivery.attempt + 1 if delivery.error else delivery.attempt
+    # The lease lets scheduler.recover_expired_claims() hand the delivery back
+    # if this engine dies holding it; saving the claimed row clears it
+    claimed = Delivery.objects.filter(id=delivery.id, status=delivery.status).update(
+        status='processing',
+        attempt=attempt,
+        error='',
+        next_retry_at=now + timedelta(seconds=settings.WEBHOOK_ENGINE_CLAIM_LEASE_SECONDS),
+    )
+    if not claimed:
+        return None, None
+    delivery.status = 'processing'
+    delivery.attempt = attempt
+    delivery.error = ''
+    delivery.next_retry_at = None
+
+    if delivery.shared_payload_id:
+        # Serialized once at fan-out; only the envelope is new
+        payload, payload_json = None, render_payload(delivery)
+    else:
+        payload = delivery.payload or prepare_webhook_payload(delivery)
+        payload_json = json.dumps(payload)
+    delivery.payload_size = len(payload_json.encode('utf-8'))
+
+    if not webhook.active:
+        fail_delivery(delivery, payload or json.loads(payload_json), "Webhook is inactive", retry=False)
+        return None, None
+    if delivery.payload_size > MAX_PAYLOAD_SIZE:
+        fail_delivery(
+            delivery, payload or json.loads(payload_json), f"Payload too large: {delivery.payload_size} bytes",
+            retry=False
+        )
+        return None, None
+    if is_batched(delivery):
+        # Signed with the rest of its batch
+        return PreparedDelivery(delivery, payload, payload_json, {}), None
+
+    signature = calculate_hmac_signature(webhook.secret, payload_json)
+    headers = {
+        'Content-Type': 'application/json',
+        'User-Agent': 'FormsPlatform-Webhook/1.0',
+        'X-Forms-Signature': f'sha256={signature}',
+        'X-Forms-Timestamp': str(int(now.timestamp())),
+        'X-Forms-Delivery-Id': str(delivery.id),
+        'X-Forms-Attempt': str(delivery.attempt),
+        **(webhook.headers_json or {})
+    }
+    if delivery.event == BATCH_EVENT:
+        headers['X-Forms-Batch-Size'] = str(len(payload))
+    return PreparedDelivery(delivery, payload, payload_json, headers), None
+
+
+def record_attempt(prepared: PreparedDelivery, result: Attempt) -> Optional[int]:
+    """Store the attempt's outcome; returns the retry delay if one was scheduled"""
+    delivery = prepared.delivery
+    write_log(
+        delivery,
+        request_headers=prepared.headers,
+        request=prepared.payload_json,
+        ok=result.ok,
+        status_code=result.status_code,
+        response_headers=result.headers,
+        response=result.body,
+        error=result.error,
+        duration_ms=result.duration_ms,
+    )
+
+    delivery.response_code = result.status_code
+    delivery.response_time_ms = result.duration_ms
+    if result.status_code is not None:
+        record_latency(delivery.webhook_id, result.duration_ms)
+
+    if result.ok:
+        with transaction.atomic():
+            delivery.status = 'success'
+            delivery.delivered_at = timezone.now()
+            delivery.save()
+
+            count = 1
+            if delivery.event == BATCH_EVENT:
+                count = delivery.items.update(status='success', delivered_at=delivery.delivered_at)
+        record_outcome(delivery.webhook_id, True, count)
+        return None
+
+    if result.error:
+        # Timeouts and connection errors
+        return fail_delivery(delivery, prepared.payload_dict(), result.error, retry=True)
+    error = f"HTTP {result.status_code}: {(result.body or '')[:500]}"
+    return fail_delivery(delivery, prepared.payload_dict(), error, retry=is_endpoint_failure(result.status_code))
+
+
+def fail_delivery(delivery: Delivery, payload: Dict[str, Any], error: str, retry: bool) -> Optional[int]:
+    """Schedule a retry, or move the delivery to the DLQ once retries are exhausted"""
+    webhook = delivery.webhook
+    delivery.error = error
+
+    if retry and webhook.retry_enabled and delivery.attempt < webhook.max_retries:
+        delay = RETRY_DELAYS[min(delivery.attempt, len(RETRY_DELAYS) - 1)]
+        delivery.status = 'pending'
+        delivery.next_retry_at = timezone.now() + timedelta(seconds=delay)
+        delivery.save()
+
+        logger.warning(
+            f"Webhook delivery {delivery.id} failed (attempt {delivery.attempt}), "
+            f"retrying in {delay}s: {error}"
+        )
+        return delay
+
+    with transaction.atomic():
+        delivery.status = 'dlq'
+        delivery.save()
+
+        count = 1
+        if delivery.event == BATCH_EVENT:
+            # The batch holds the DLQ entry; its items follow its status
+            count = delivery.items.update(status='dlq', error=error)
+        # A manually retried delivery may already have an entry
+        DeadLetterQueue.objects.update_or_create(
+            delivery=delivery,
+            defaults={'reason': error, 'payload_json': payload, 'redriven_at': None}
+        )
+    record_outcome(webhook.id, False, count)
+
+    logger.error(f"Webhook delivery {delivery.id} moved to DLQ after {delivery.attempt} attempts: {error}")
+    return None
+
+
+def create_batch(webhook: Webhook, items: List[Dict[str, Any]]) -> str:
+    """Store a batch of claimed deliveries as one pending delivery; returns its id"""
+    with transaction.atomic():
+        batch = Delivery.objects.create(webhook=webhook, event=BATCH_EVENT, payload=items)
+        Delivery.objects.filter(id__in=[item['id'] for item in items], status='processing').update(
+            status='batched',
+            batch=batch,
+            next_retry_at=None
+        )
+    return str(batch.id)
+
+
+def park_delivery(delivery_id: str, recheck_seconds: int):
+    """Hold a claimed delivery while its host's breaker is open"""
+    Delivery.objects.filter(id=delivery_id, status='processing').update(
+        status='parked',
+        next_retry_at=timezone.now() + timedelta(seconds=recheck_seconds)
+    )
+
+
+def release_delivery(*delivery_ids: str):
+    """Hand back claimed deliveries that were never sent (engine shutdown)"""
+    Delivery.objects.filter(id__in=delivery_ids, status='processing').update(status='pending', next_retry_at=None)
+
+
+def _with_connection(fn):
+    """Drop stale connections first, as Django does at the start of a request"""
+    @functools.wraps(fn)
+    def call(*args):
+        close_old_connections()
+        return fn(*args)
+    return call
+
+
+# Network side
+class HostPools:
+    """One AsyncClient per destination origin; idle origins past max_hosts are closed"""
+
+    def __init__(
+        self,
+        max_connections_per_host: int = 50,
+        keepalive_expiry_seconds: float = 30.0,
+        timeout_seconds: float = 30.0,
+        connect_timeout_seconds: float = 5.0,
+        max_hosts: int = 1024,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.limits = httpx.Limits(
+            max_connections=max_connections_per_host,
+            max_keepalive_connections=max_connections_per_host,
+            keepalive_expiry=keepalive_expiry_seconds,
+        )
+        self.timeout_seconds = timeout_seconds
+        self.timeout = httpx.Timeout(timeout_seconds, connect=connect_timeout_seconds)
+        self.max_hosts = max_hosts
+        self.transport = transport
+
+        self._clients: "OrderedDict[Origin, httpx.AsyncClient]" = OrderedDict()
+        # Requests using each origin's client right now
+        self._leases: Dict[Origin, int] = {}
+
+    @asynccontextmanager
+    async def client(self, url: str):
+        parsed = httpx.URL(url)
+        origin = (parsed.scheme, parsed.host, parsed.port or (443 if parsed.scheme == 'https' else 80))
+        client = self._clients.get(origin)
+        if client is None:
+            client = self._clients[origin] = httpx.AsyncClient(
+                limits=self.limits,
+                timeout=self.timeout,
+                transport=self.transport,
+            )
+        else:
+            self._clients.move_to_end(origin)
+        self._leases[origin] = self._leases.get(origin, 0) + 1
+        try:
+            await self._evict()
+            yield client
+        finally:
+            self._leases[origin] -= 1
+            if not self._leases[origin]:
+                del self._leases[origin]
+
+    async def _evict(self):
+        excess = len(self._clients) - self.max_hosts
+        if excess <= 0:
+            return
+        # Least recently used first; clients with requests in flight stay open
+        idle = [origin for origin in self._clients if origin not in self._leases][:excess]
+        for origin in idle:
+            await self._clients.pop(origin).aclose()
+
+    async def close(self):
+        clients = list(self._clients.values())
+        self._clients.clear()
+        for client in clients:
+            await client.aclose()
+
+
+class EndpointLimiter:
+    """Caps concurrent requests per webhook; entries are dropped once idle"""
+
+    def __init__(self):
+        # webhook id -> [semaphore, holders and waiters]
+        self._entries: Dict[str, List[Any]] = {}
+
+    @asynccontextmanager
+    async def slot(self, key: str, limit: int):
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = [asyncio.Semaphore(limit), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._entries[key]
+
+
+class OpenBatch:
+    """Deliveries collected for one webhook, until it is full or its linger time is up"""
+
+    def __init__(self, webhook: Webhook, timer: asyncio.TimerHandle):
+        self.webhook = webhook
+        self.timer = timer
+        self.items: List[Dict[str, Any]] = []
+        # Size of the JSON array so far
+        self.size = 2
+
+
+class DeliveryEngine:
+    """Sends queued deliveries concurrently on one event loop"""
+
+    def __init__(
+        self,
+        redis_client,
+        pools: HostPools,
+        max_in_flight: int = 2000,
+        max_pending: int = 10000,
+        endpoint_concurrency: int = 10,
+        max_response_bytes: int = 10000,
+        breaker: Optional[CircuitBreaker] = None,
+        park_recheck_seconds: int = 3600,
+        db_thread_sensitive: bool = False,
+    ):
+        self.redis = redis_client
+        self.pools = pools
+        self.breaker = breaker
+        self.park_recheck_seconds = park_recheck_seconds
+        self.endpoint_concurrency = endpoint_concurrency
+        self.max_response_bytes = max_response_bytes
+        # Requests on the wire, across all endpoints
+        self._in_flight = asyncio.Semaphore(max_in_flight)
+        # Deliveries taken off the queue, including those waiting for an endpoint slot
+        self._pending = asyncio.Semaphore(max_pending)
+        self._endpoints = EndpointLimiter()
+        self._tasks = set()
+        self._batches: Dict[Any, OpenBatch] = {}
+        self._batch_tasks = set()
+        # Thread-sensitive calls run on the caller's thread and connection
+        # (tests); otherwise on executor threads that manage their own
+        self._db_thread_sensitive = db_thread_sensitive
+
+    @classmethod
+    def from_settings(cls) -> "DeliveryEngine":
+        pools = HostPools(
+            max_connections_per_host=settings.WEBHOOK_ENGINE_MAX_CONNECTIONS_PER_HOST,
+            timeout_seconds=settings.WEBHOOK_TIMEOUT_SECONDS,
+            connect_timeout_seconds=settings.WEBHOOK_ENGINE_CONNECT_TIMEOUT_SECONDS,
+            max_hosts=settings.WEBHOOK_ENGINE_MAX_HOSTS,
+        )
+        redis_client = aioredis.from_url(settings.WEBHOOK_ENGINE_REDIS_URL)
+        return cls(
+            redis_client,
+            pools,
+            max_in_flight=settings.WEBHOOK_ENGINE_MAX_IN_FLIGHT,
+            max_pending=settings.WEBHOOK_ENGINE_MAX_PENDING,
+            endpoint_concurrency=settings.WEBHOOK_ENGINE_ENDPOINT_CONCURRENCY,
+            max_response_bytes=settings.WEBHOOK_ENGINE_MAX_RESPONSE_BYTES,
+            breaker=CircuitBreaker.from_settings(redis_client),
+            park_recheck_seconds=settings.WEBHOOK_BREAKER_RECHECK_SECONDS,
+        )
+
+    def _db(self, fn):
+        if self._db_thread_sensitive:
+            return sync_to_async(fn, thread_sensitive=True)
+        return sync_to_async(_with_connection(fn), thread_sensitive=False)
+
+    async def run(self, stop: asyncio.Event):
+        """Take deliveries off the queue until `stop` is set, then drain"""
+        logger.info("Webhook delivery engine started")
+        probes = asyncio.create_task(self._release_probes(stop)) if self.breaker is not None else None
+        while not stop.is_set():
+            await self._pending.acquire()
+            try:
+                item = await self.redis.brpop(QUEUE_KEY, timeout=1)
+            except Exception as e:
+                self._pending.release()
+                logger.warning(f"Webhook delivery queue unavailable: {e}")
+                await asyncio.sleep(1)
+                continue
+            if item is None:
+                self._pending.release()
+                continue
+            delivery_id = item[1].decode() if isinstance(item[1], bytes) else item[1]
+            task = asyncio.create_task(self._run_one(delivery_id))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        if probes is not None:
+            await probes
+        await self._drain()
+
+    async def _release_probes(self, stop: asyncio.Event):
+        while not stop.is_set():
+            try:
+                await self.breaker.release_probes()
+            except Exception as e:
+                logger.warning(f"Failed to release circuit breaker probes: {e}")
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=1)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _drain(self):
+        await self.flush_batches()
+        if not self._tasks:
+            return
+        logger.info(f"Waiting for {len(self._tasks)} webhook deliveries to finish")
+        _, unfinished = await asyncio.wait(set(self._tasks), timeout=self.pools.timeout_seconds + 5)
+        # Deliveries still waiting for an endpoint slot go back to pending
+        for task in unfinished:
+            task.cancel()
+        if unfinished:
+            await asyncio.wait(unfinished)
+
+    async def _run_one(self, delivery_id: str):
+        try:
+            await self.deliver(delivery_id)
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            logger.exception(f"Error delivering webhook {delivery_id}")
+        finally:
+            self._pending.release()
+
+    async def deliver(self, delivery_id: str) -> Optional[str]:
+        """Send one delivery; returns its new status, or None if it was not sent"""
+        prepared, retry_in = await self._db(claim_delivery)(str(delivery_id))
+        if prepared is None:
+            if retry_in is not None:
+                await self._schedule(delivery_id, retry_in)
+            return None
+
+        webhook = prepared.delivery.webhook
+        if is_batched(prepared.delivery):
+            self._add_to_batch(prepared)
+            return 'batched'
+
+        host = breaker_host(webhook.url)
+        if self.breaker is not None:
+            if await self.breaker.acquire(host, str(delivery_id)) == PARK:
+                await self._db(park_delivery)(str(delivery_id), self.park_recheck_seconds)
+                await self.breaker.park(host, str(delivery_id))
+                # Recheck in case the breaker loses track of it
+                await self._schedule(delivery_id, self.park_recheck_seconds)
+                return 'parked'
+
+        try:
+            async with self._endpoints.slot(str(webhook.id), webhook.max_concurrency or self.endpoint_concurrency):
+                async with self._in_flight:
+                    result = await self._post(webhook.url, prepared)
+        except asyncio.CancelledError:
+            await self._db(release_delivery)(str(delivery_id))
+            raise
+
+        if self.breaker is not None:
+            await self.breaker.record(host, str(delivery_id), not is_endpoint_failure(result.status_code))
+        retry_in = await self._db(record_attempt)(prepared, result)
+        if retry_in is not None:
+            await self._schedule(delivery_id, retry_in)
+        return prepared.delivery.status
+
+    def _add_to_batch(self, prepared: PreparedDelivery):
+        webhook = prepared.delivery.webhook
+        item = {'id': str(prepared.delivery.id), 'event': prepared.delivery.event, 'payload': prepared.payload_dict()}
+        # Item and separator in the JSON array
+        size = len(json.dumps(item).encode('utf-8')) + 2
+
+        batch = self._batches.get(webhook.id)
+        max_bytes = min(webhook.batch_max_bytes, MAX_PAYLOAD_SIZE)
+        if batch is not None and batch.size + size > max_bytes:
+            self._flush_batch(webhook.id)
+            batch = None
+        if batch is None:
+            timer = asyncio.get_running_loop().call_later(
+                webhook.batch_linger_ms / 1000, self._flush_batch, webhook.id
+            )
+            batch = self._batches[webhook.id] = OpenBatch(webhook, timer)
+        batch.items.append(item)
+        batch.size += size
+        if len(batch.items) >= webhook.batch_max_size:
+            self._flush_batch(webhook.id)
+
+    def _flush_batch(self, webhook_id):
+        batch = self._batches.pop(webhook_id, None)
+        if batch is None:
+            return
+        batch.timer.cancel()
+        task = asyncio.ensure_future(self._send_batch(batch))
+        for tasks in (self._tasks, self._batch_tasks):
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+    async def _send_batch(self, batch: OpenBatch):
+        # Items that never made it into a stored batch go back to pending
+        item_ids = [item['id'] for item in batch.items]
+        try:
+            batch_id = await self._db(create_batch)(batch.webhook, batch.items)
+            await self.deliver(batch_id)
+        except asyncio.CancelledError:
+            await self._db(release_delivery)(*item_ids)
+        except Exception:
+            logger.exception(f"Error delivering webhook batch of {len(item_ids)} for webhook {batch.webhook.id}")
+            await self._db(release_delivery)(*item_ids)
+
+    async def flush_batches(self):
+        """Send every open batch now and wait for the batches being sent"""
+        for webhook_id in list(self._batches):
+            self._flush_batch(webhook_id)
+        if self._batch_tasks:
+            await asyncio.wait(set(self._batch_tasks))
+
+    async def _post(self, url: str, prepared: PreparedDelivery) -> Attempt:
+        started = time.monotonic()
+        try:
+            async with self.pools.client(url) as client:
+                async with client.stream(
+                    'POST',
+                    url,
+                    content=prepared.payload_json.encode('utf-8'),
+                    headers=prepared.headers
+                ) as response:
+                    body, _ = await read_limited(response, self.max_response_bytes)
+        except httpx.TimeoutException:
+            error = f"Request timed out after {self.pools.timeout_seconds:g} seconds"
+        except httpx.ConnectError as e:
+            error = f"Connection error: {str(e)}"
+        except httpx.HTTPError as e:
+            error = f"Request error: {str(e)}"
+        else:
+            return Attempt(
+                status_code=response.status_code,
+                headers=dict(response.headers),
+                body=body.decode('utf-8', errors='replace'),
+                duration_ms=int((time.monotonic() - started) * 1000)
+            )
+        return Attempt(duration_ms=int((time.monotonic() - started) * 1000), error=error)
+
+    async def _schedule(self, delivery_id: str, delay: float):
+        """Put the delivery on the timing wheel; the scheduler queues it when it is due"""
+        try:
+            await self.redis.zadd(SCHEDULE_KEY, {str(delivery_id): time.time() + delay})
+        except Exception as e:
+            # next_retry_at is on the row; run_webhook_scheduler --rebuild recovers it
+            logger.warning(f"Failed to schedule webhook delivery {delivery_id}: {e}")
+
+    async def close(self):
+        await self.pools.close()
+        if self.redis is not None:
+            await self.redis.aclose()
@@ -0,0 +1,104 @@
+"""
+Delivery attempt logs
+- Failed attempts are always logged in full
+- Successful attempts follow Webhook.success_log_policy: 'full', 'metadata'
+  (status, timing and error only) or 'sampled' (full for a sample of
+  success_log_sample_rate, or WEBHOOK_LOG_SAMPLE_RATE, metadata otherwise)
+- Bodies are stored zstd-compressed in bytea columns; compressed bodies over
+  WEBHOOK_LOG_MAX_INLINE_BYTES go to the secure storage (core/storage.py)
+  and the row keeps the file name
+- Logs written before compression keep their text columns and read as before
+"""
+import logging
+import random
+from typing import Any, Dict, Optional, Tuple
+
+import zstandard
+from django.conf import settings
+from django.core.files.base import ContentFile
+
+from core.storage import webhook_log_storage
+from .models import WebhookLog
+
+logger = logging.getLogger(__name__)
+
+COMPRESSION_LEVEL = 3
+
+
+def logs_in_full(webhook, ok: bool) -> bool:
+    """Whether an attempt to `webhook` gets its headers and bodies logged"""
+    if not ok or webhook.success_log_policy == 'full':
+        return True
+    if webhook.success_log_policy == 'metadata':
+        return False
+    rate = webhook.success_log_sample_rate
+    if rate is None:
+        rate = settings.WEBHOOK_LOG_SAMPLE_RATE
+    return random.random() < rate
+
+
+def pack_body(text: Optional[str]) -> Tuple[Optional[bytes], str]:
+    """Compress a body; returns (inline bytes, '') or (None, storage file name)"""
+    if text is None:
+        return None, ''
+    data = zstandard.compress(text.encode('utf-8'), COMPRESSION_LEVEL)
+    if len(data) <= settings.WEBHOOK_LOG_MAX_INLINE_BYTES:
+        return data, ''
+    try:
+        return None, webhook_log_storage.save('body.zst', ContentFile(data))
+    except OSError as e:
+        logger.warning(f"Webhook log storage unavailable, keeping body inline: {e}")
+        return data, ''
+
+
+def unpack_body(data: Optional[bytes], file_name: str) -> Optional[str]:
+    if file_name:
+        try:
+            with webhook_log_storage.open(file_name) as f:
+                data = f.read()
+        except OSError as e:
+            logger.warning(f"Webhook log body {file_name} unavailable: {e}")
+            return None
+    if data is None:
+        return None
+    return zstandard.decompress(bytes(data)).decode('utf-8')
+
+
+def request_body(log: WebhookLog) -> Optional[str]:
+    if log.request_body is not None:
+        return log.request_body
+    return unpack_body(log.request_body_zstd, log.request_body_file)
+
+
+def response_body(log: WebhookLog) -> Optional[str]:
+    if log.response_body is not None:
+        return log.response_body
+    return unpack_body(log.response_body_zstd, log.response_body_file)
+
+
+def write_log(
+    delivery,
+    request_headers: Dict[str, Any],
+    request: str,
+    ok: bool,
+    status_code: Optional[int],
+    response_headers: Optional[Dict[str, Any]],
+    response: Optional[str],
+    error: Optional[str],
+    duration_ms: Optional[int],
+) -> WebhookLog:
+    """Store an attempt of `delivery` under its webhook's log policy"""
+    log = WebhookLog(
+        delivery=delivery,
+        attempt=delivery.attempt,
+        response_status=status_code,
+        error_message=error,
+        duration_ms=duration_ms,
+    )
+    if logs_in_full(delivery.webhook, ok):
+        log.request_headers = request_headers
+        log.response_headers = response_headers
+        log.request_body_zstd, log.request_body_file = pack_body(request)
+        log.response_body_zstd, log.response_body_file = pack_body(response)
+    log.save()
+    return log
@@ -0,0 +1,35 @@
+import asyncio
+import signal
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from webhooks.engine import DeliveryEngine
+
+
+class Command(BaseCommand):
+    help = 'Runs the asynchronous webhook delivery engine until SIGINT/SIGTERM'
+
+    def handle(self, *args, **options):
+        self.stdout.write('Starting webhook delivery engine...')
+        asyncio.run(self._run())
+        self.stdout.write(self.style.SUCCESS('Webhook delivery engine stopped'))
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        # ORM calls run on these threads, each with its own connection
+        loop.set_default_executor(ThreadPoolExecutor(
+            max_workers=settings.WEBHOOK_ENGINE_DB_THREADS,
+            thread_name_prefix='webhook-engine-db'
+        ))
+
+        stop = asyncio.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stop.set)
+
+        engine = DeliveryEngine.from_settings()
+        try:
+            await engine.run(stop)
+        finally:
+            await engine.close()
@@ -0,0 +1,37 @@
+import asyncio
+import signal
+
+from django.core.management.base import BaseCommand
+
+from webhooks.scheduler import RetryScheduler, rebuild_schedule
+
+
+class Command(BaseCommand):
+    help = 'Runs the webhook retry scheduler (timing wheel) until SIGINT/SIGTERM'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Reschedule every pending or parked delivery (and expired claims) from the database first',
+        )
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            scheduled = rebuild_schedule()
+            self.stdout.write(f'Rescheduled {scheduled} webhook deliveries')
+        self.stdout.write('Starting webhook retry scheduler...')
+        asyncio.run(self._run())
+        self.stdout.write(self.style.SUCCESS('Webhook retry scheduler stopped'))
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stop = asyncio.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stop.set)
+
+        scheduler = RetryScheduler.from_settings()
+        try:
+            await scheduler.run(stop)
+        finally:
+            await scheduler.close()
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-17 07:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webhooks', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='webhook',
+            name='max_concurrency',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
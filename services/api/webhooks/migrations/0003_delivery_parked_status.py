@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-17 08:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webhooks', '0002_webhook_max_concurrency'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='delivery',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('parked', 'Parked'), ('success', 'Success'), ('failed', 'Failed'), ('dlq', 'Dead Letter Queue')], default='pending', max_length=20),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-17 08:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webhooks', '0003_delivery_parked_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='webhook',
+            name='rate_limit_burst',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='webhook',
+            name='rate_limit_per_minute',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
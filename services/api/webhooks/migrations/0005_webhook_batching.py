@@ -0,0 +1,44 @@
+# Generated by Django 4.2.30 on 2026-10-17 08:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webhooks', '0004_webhook_rate_limit'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='delivery',
+            name='batch',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='items', to='webhooks.delivery'),
+        ),
+        migrations.AddField(
+            model_name='webhook',
+            name='batch_enabled',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='webhook',
+            name='batch_linger_ms',
+            field=models.PositiveIntegerField(default=1000),
+        ),
+        migrations.AddField(
+            model_name='webhook',
+            name='batch_max_bytes',
+            field=models.PositiveIntegerField(default=524288),
+        ),
+        migrations.AddField(
+            model_name='webhook',
+            name='batch_max_size',
+            field=models.PositiveIntegerField(default=100),
+        ),
+        migrations.AlterField(
+            model_name='delivery',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('parked', 'Parked'), ('batched', 'Batched'), ('success', 'Success'), ('failed', 'Failed'), ('dlq', 'Dead Letter Queue')], default='pending', max_length=20),
+        ),
+    ]
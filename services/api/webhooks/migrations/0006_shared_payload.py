@@ -0,0 +1,27 @@
+# Generated by Django 4.2.30 on 2026-10-17 08:07
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webhooks', '0005_webhook_batching'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WebhookPayload',
+            fields=[
+                ('digest', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('body', models.TextField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='delivery',
+            name='shared_payload',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='deliveries', to='webhooks.webhookpayload'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 4.2.30 on 2026-10-17 08:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webhooks', '0006_shared_payload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='webhook',
+            name='success_log_policy',
+            field=models.CharField(choices=[('full', 'Full'), ('sampled', 'Sampled'), ('metadata', 'Metadata only')], default='sampled', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='webhook',
+            name='success_log_sample_rate',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='webhooklog',
+            name='request_body_file',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='webhooklog',
+            name='request_body_zstd',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.AddField(
+            model_name='webhooklog',
+            name='response_body_file',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='webhooklog',
+            name='response_body_zstd',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='webhooklog',
+            name='request_body',
+            field=models.TextField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='webhooklog',
+            name='request_headers',
+            field=models.JSONField(null=True),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.30 on 2026-10-17 08:29
+
+from django.db import migrations, models
+
+
+def backfill_idempotency_keys(apps, schema_editor):
+    """Copy keys out of the payloads; only the oldest delivery keeps a repeated key"""
+    Delivery = apps.get_model('webhooks', 'Delivery')
+    rows = Delivery.objects.filter(
+        payload__has_key='idempotency_key'
+    ).order_by('created_at').values_list('id', 'webhook_id', 'payload__idempotency_key')
+
+    seen = set()
+    batch = []
+    for delivery_id, webhook_id, key in rows.iterator(chunk_size=1000):
+        key = str(key or '')[:255]
+        if not key or (webhook_id, key) in seen:
+            continue
+        seen.add((webhook_id, key))
+        batch.append(Delivery(id=delivery_id, idempotency_key=key))
+        if len(batch) >= 1000:
+            Delivery.objects.bulk_update(batch, ['idempotency_key'])
+            batch = []
+    Delivery.objects.bulk_update(batch, ['idempotency_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webhooks', '0007_log_policy'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='delivery',
+            name='idempotency_key',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.RunPython(backfill_idempotency_keys, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='delivery',
+            constraint=models.UniqueConstraint(condition=models.Q(('idempotency_key__isnull', False)), fields=('webhook', 'idempotency_key'), name='delivery_webhook_idempotency_key'),
+        ),
+    ]
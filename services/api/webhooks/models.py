@@ -4,6 +4,12 @@ import uuid
 
 
 class Webhook(models.Model):
+    LOG_POLICY_CHOICES = [
+        ("full", "Full"),
+        ("sampled", "Sampled"),
+        ("metadata", "Metadata only"),
+    ]
+    
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     organization = models.ForeignKey(Organization, on_delete=models.CASCADE, related_name="webhooks")
     url = models.URLField()
@@ -14,6 +20,21 @@ class Webhook(models.Model):
     include_partials = models.BooleanField(default=False)
     retry_enabled = models.BooleanField(default=True)
     max_retries = models.IntegerField(default=7)
+    # Concurrent requests the delivery engine sends this endpoint (null: engine default)
+    max_concurrency = models.PositiveIntegerField(null=True, blank=True)
+    # Token bucket for outbound requests (null: WEBHOOK_RATE_LIMIT_* settings)
+    rate_limit_per_minute = models.PositiveIntegerField(null=True, blank=True)
+    rate_limit_burst = models.PositiveIntegerField(null=True, blank=True)
+    # Opt-in batching: deliveries are sent together as one signed JSON array,
+    # flushed at batch_max_size items, batch_max_bytes or batch_linger_ms
+    batch_enabled = models.BooleanField(default=False)
+    batch_max_size = models.PositiveIntegerField(default=100)
+    batch_linger_ms = models.PositiveIntegerField(default=1000)
+    batch_max_bytes = models.PositiveIntegerField(default=512 * 1024)
+    # Logging of successful attempts (failures are always logged in full);
+    # null sample rate: WEBHOOK_LOG_SAMPLE_RATE setting
+    success_log_policy = models.CharField(max_length=10, choices=LOG_POLICY_CHOICES, default="sampled")
+    success_log_sample_rate = models.FloatField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -32,10 +53,19 @@ class Webhook(models.Model):
         return (self.successful_deliveries / self.total_deliveries) * 100
 
 
+class WebhookPayload(models.Model):
+    """Serialized event body shared by every delivery of the event, keyed by its SHA-256"""
+    digest = models.CharField(max_length=64, primary_key=True)
+    body = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+
 class Delivery(models.Model):
     STATUS_CHOICES = [
         ("pending", "Pending"),
         ("processing", "Processing"),
+        ("parked", "Parked"),
+        ("batched", "Batched"),
         ("success", "Success"),
         ("failed", "Failed"),
         ("dlq", "Dead Letter Queue"),
@@ -45,8 +75,16 @@ class Delivery(models.Model):
     webhook = models.ForeignKey(Webhook, on_delete=models.CASCADE, related_name="deliveries")
     submission = models.ForeignKey(Submission, on_delete=models.CASCADE, null=True, blank=True)
     partial = models.ForeignKey(Partial, on_delete=models.CASCADE, null=True, blank=True)
+    # Batch delivery this one was sent in; the batch carries retries and the DLQ entry
+    batch = models.ForeignKey("self", on_delete=models.SET_NULL, null=True, blank=True, related_name="items")
     event = models.CharField(max_length=50, default='submission.created')
     payload = models.JSONField(null=True, blank=True)
+    # At most one delivery per webhook and key (see delivery.queue_webhook)
+    idempotency_key = models.CharField(max_length=255, null=True, blank=True)
+    # Body built once for every subscriber of the event (see tasks.share_payload)
+    shared_payload = models.ForeignKey(
+        WebhookPayload, on_delete=models.PROTECT, null=True, blank=True, related_name="deliveries"
+    )
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending")
     attempt = models.IntegerField(default=1)
     response_code = models.IntegerField(null=True, blank=True)
@@ -64,6 +102,13 @@ class Delivery(models.Model):
             models.Index(fields=["webhook", "created_at"]),
             models.Index(fields=["status", "created_at"]),
         ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["webhook", "idempotency_key"],
+                condition=models.Q(idempotency_key__isnull=False),
+                name="delivery_webhook_idempotency_key",
+            ),
+        ]
 
 
 class DeadLetterQueue(models.Model):
@@ -88,11 +133,18 @@ class WebhookLog(models.Model):
     delivery = models.ForeignKey(Delivery, on_delete=models.CASCADE, related_name="logs")
     attempt = models.IntegerField()
     timestamp = models.DateTimeField(auto_now_add=True)
-    request_headers = models.JSONField()
-    request_body = models.TextField()
+    # Headers and bodies are null on metadata-only logs (see webhooks/logs.py)
+    request_headers = models.JSONField(null=True)
+    # Uncompressed bodies of logs written before compression
+    request_body = models.TextField(null=True)
+    # zstd-compressed bodies, or the secure storage file holding them
+    request_body_zstd = models.BinaryField(null=True)
+    request_body_file = models.CharField(max_length=255, blank=True)
     response_status = models.IntegerField(null=True)
     response_headers = models.JSONField(null=True)
     response_body = models.TextField(null=True)
+    response_body_zstd = models.BinaryField(null=True)
+    response_body_file = models.CharField(max_length=255, blank=True)
     error_message = models.TextField(null=True)
     duration_ms = models.IntegerField(null=True)
     
@@ -0,0 +1,43 @@
+"""
+Hand deliveries to the webhook delivery engine (webhooks/engine.py)
+"""
+import logging
+
+import redis
+from django.conf import settings
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+# Shared with services/ingest/worker.py
+QUEUE_KEY = "webhooks:deliveries"
+# Timing wheel: delivery ids scored by when they are next due (webhooks/scheduler.py)
+SCHEDULE_KEY = "webhooks:scheduled"
+
+_client = None
+
+
+def get_client():
+    global _client
+    if _client is None:
+        _client = redis.from_url(
+            settings.WEBHOOK_ENGINE_REDIS_URL,
+            socket_connect_timeout=2,
+            socket_timeout=2
+        )
+    return _client
+
+
+def _push(delivery_ids):
+    try:
+        get_client().lpush(QUEUE_KEY, *delivery_ids)
+    except Exception:
+        # The rows stay pending; run_webhook_scheduler --rebuild queues them again
+        logger.exception(f"Failed to queue {len(delivery_ids)} webhook deliveries")
+
+
+def enqueue_delivery(*delivery_ids):
+    """Queue pending deliveries for the engine once their rows are committed"""
+    delivery_ids = [str(delivery_id) for delivery_id in delivery_ids]
+    if delivery_ids:
+        transaction.on_commit(lambda: _push(delivery_ids))
@@ -0,0 +1,128 @@
+"""
+Timing wheel for delivery retries (python manage.py run_webhook_scheduler)
+- Retries, rate-limited deliveries and parked rechecks are scored by their
+  due time in one Redis sorted set (SCHEDULE_KEY), written by the engine
+- The scheduler moves due ids onto the delivery queue in batches with one
+  Lua script, so a scheduler restarted twice (or two of them) queues each id once
+- Nothing waits in worker memory and no periodic task scans for due retries
+  in the table; rebuild_schedule() restores the wheel from the rows after Redis data loss
+- Deliveries left 'processing' by an engine that died are put back on the
+  wheel once their claim lease expires (recover_expired_claims, run by the
+  recover_webhook_claims task)
+"""
+import asyncio
+import logging
+import time
+from typing import Optional
+
+import redis.asyncio as aioredis
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Delivery
+from .queue import QUEUE_KEY, SCHEDULE_KEY, get_client
+
+logger = logging.getLogger(__name__)
+
+# KEYS: schedule, delivery queue; ARGV: now, batch size
+# Returns how many deliveries were queued
+POP_DUE_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+if #due == 0 then
+    return 0
+end
+redis.call('ZREM', KEYS[1], unpack(due))
+-- Earliest first: the queue is consumed from the right
+for i = 1, #due do
+    redis.call('LPUSH', KEYS[2], due[i])
+end
+return #due
+"""
+
+
+class RetryScheduler:
+    """Moves due deliveries from the timing wheel to the delivery engine's queue"""
+
+    def __init__(self, redis_client, batch_size: int = 500, tick_seconds: float = 0.5):
+        self.redis = redis_client
+        self.batch_size = batch_size
+        self.tick_seconds = tick_seconds
+        self._pop_due = redis_client.register_script(POP_DUE_SCRIPT)
+
+    @classmethod
+    def from_settings(cls) -> "RetryScheduler":
+        return cls(
+            aioredis.from_url(settings.WEBHOOK_ENGINE_REDIS_URL),
+            batch_size=settings.WEBHOOK_SCHEDULER_BATCH_SIZE,
+            tick_seconds=settings.WEBHOOK_SCHEDULER_TICK_SECONDS,
+        )
+
+    async def pop_due(self, now: Optional[float] = None) -> int:
+        """Queue every delivery due by `now`, a batch at a time"""
+        now = now or time.time()
+        queued = 0
+        while True:
+            moved = await self._pop_due(keys=[SCHEDULE_KEY, QUEUE_KEY], args=[now, self.batch_size])
+            queued += moved
+            if moved < self.batch_size:
+                return queued
+
+    async def run(self, stop: asyncio.Event):
+        """Queue due deliveries every tick until `stop` is set"""
+        logger.info("Webhook retry scheduler started")
+        while not stop.is_set():
+            try:
+                queued = await self.pop_due()
+                if queued:
+                    logger.info(f"Queued {queued} scheduled webhook deliveries")
+            except Exception as e:
+                logger.warning(f"Webhook retry schedule unavailable: {e}")
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=self.tick_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    async def close(self):
+        await self.redis.aclose()
+
+
+def recover_expired_claims(chunk_size: int = 1000) -> int:
+    """Return deliveries whose claim lease expired to pending and schedule them now"""
+    now = timezone.now()
+    client = get_client()
+    recovered = 0
+    while True:
+        delivery_ids = list(
+            Delivery.objects.filter(status='processing', next_retry_at__lte=now)
+            .values_list('id', flat=True)[:chunk_size]
+        )
+        if not delivery_ids:
+            return recovered
+        # The error makes the next claim count a new attempt, since this one may have been sent
+        updated = Delivery.objects.filter(
+            id__in=delivery_ids, status='processing', next_retry_at__lte=now
+        ).update(status='pending', next_retry_at=now, error='Claim expired before the attempt finished')
+        recovered += updated
+        # Ids finished in the meantime are ignored by the engine's claim
+        client.zadd(SCHEDULE_KEY, {str(delivery_id): now.timestamp() for delivery_id in delivery_ids})
+        logger.warning(f"Recovered {updated} webhook deliveries with expired claims")
+        if len(delivery_ids) < chunk_size:
+            return recovered
+
+
+def rebuild_schedule(chunk_size: int = 1000) -> int:
+    """Put every pending or parked delivery back on the wheel, at its next_retry_at or now"""
+    recover_expired_claims(chunk_size)
+    now = timezone.now()
+    client = get_client()
+    rows = Delivery.objects.filter(status__in=['pending', 'parked']).values_list('id', 'next_retry_at')
+
+    scheduled = 0
+    pipe = client.pipeline(transaction=False)
+    for delivery_id, next_retry_at in rows.iterator(chunk_size=chunk_size):
+        pipe.zadd(SCHEDULE_KEY, {str(delivery_id): (next_retry_at or now).timestamp()})
+        scheduled += 1
+        if scheduled % chunk_size == 0:
+            pipe.execute()
+    pipe.execute()
+    return scheduled
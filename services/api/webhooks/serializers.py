@@ -1,28 +1,84 @@
+from django.db import models
 from rest_framework import serializers
 from .models import Webhook, Delivery, DeadLetterQueue, WebhookLog
+from .breaker import breaker_host, breaker_state, breaker_states
+from .logs import request_body, response_body
+from .stats import merged_counts, merged_counts_for, success_rate
+from .tasks import MAX_PAYLOAD_SIZE
+
+
+class WebhookListSerializer(serializers.ListSerializer):
+    """Reads the circuit breakers and pending counts of every webhook on the page, one Redis round trip each"""
+    
+    def to_representation(self, data):
+        webhooks = list(data.all() if isinstance(data, models.Manager) else data)
+        states = breaker_states(webhook.url for webhook in webhooks if webhook.url)
+        counts = merged_counts_for(webhooks)
+        for webhook in webhooks:
+            if webhook.url:
+                webhook._breaker_state = states[breaker_host(webhook.url)]
+            webhook._merged_counts = counts[webhook.id]
+        return super().to_representation(webhooks)
 
 
 class WebhookSerializer(serializers.ModelSerializer):
     success_rate = serializers.SerializerMethodField()
+    circuit_breaker = serializers.SerializerMethodField()
     organization_id = serializers.UUIDField(write_only=True, required=False)
     
     class Meta:
         model = Webhook
         fields = [
             "id", "url", "secret", "active", "headers_json", 
-            "include_partials", "retry_enabled", "max_retries",
+            "include_partials", "retry_enabled", "max_retries", "max_concurrency",
+            "rate_limit_per_minute", "rate_limit_burst",
+            "batch_enabled", "batch_max_size", "batch_linger_ms", "batch_max_bytes",
+            "success_log_policy", "success_log_sample_rate",
             "total_deliveries", "successful_deliveries", "failed_deliveries",
-            "success_rate", "organization_id", "created_at", "updated_at"
+            "success_rate", "circuit_breaker", "organization_id", "created_at", "updated_at"
         ]
         read_only_fields = [
             "id", "secret", "total_deliveries", "successful_deliveries",
-            "failed_deliveries", "success_rate", "created_at", "updated_at"
+            "failed_deliveries", "success_rate", "circuit_breaker", "created_at", "updated_at"
         ]
+        list_serializer_class = WebhookListSerializer
     
     def get_success_rate(self, obj) -> float:
-        if obj.total_deliveries == 0:
-            return 100.0
-        return round((obj.successful_deliveries / obj.total_deliveries) * 100, 2)
+        return success_rate(self._counts(obj))
+    
+    def _counts(self, obj):
+        # Counts not flushed from Redis yet are included (read per page by WebhookListSerializer)
+        if getattr(obj, '_merged_counts', None) is None:
+            obj._merged_counts = merged_counts(obj)
+        return obj._merged_counts
+    
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        data.update(self._counts(instance))
+        return data
+    
+    def get_circuit_breaker(self, obj):
+        if not obj.url:
+            return None
+        # Already read for the whole page by WebhookListSerializer
+        if not hasattr(obj, '_breaker_state'):
+            obj._breaker_state = breaker_state(obj.url)
+        return obj._breaker_state
+    
+    def validate_batch_max_size(self, value):
+        if value < 1:
+            raise serializers.ValidationError("Batches hold at least one delivery")
+        return value
+    
+    def validate_batch_max_bytes(self, value):
+        if value > MAX_PAYLOAD_SIZE:
+            raise serializers.ValidationError(f"Batches are limited to {MAX_PAYLOAD_SIZE} bytes")
+        return value
+    
+    def validate_success_log_sample_rate(self, value):
+        if value is not None and not 0 <= value <= 1:
+            raise serializers.ValidationError("Sample rate must be between 0 and 1")
+        return value
 
 
 class DeliverySerializer(serializers.ModelSerializer):
@@ -32,9 +88,9 @@ class DeliverySerializer(serializers.ModelSerializer):
     class Meta:
         model = Delivery
         fields = [
-            "id", "webhook", "webhook_url", "submission", "partial", "status",
+            "id", "webhook", "webhook_url", "submission", "partial", "batch", "status",
             "attempt", "response_code", "response_time_ms", "error", 
-            "next_retry_at", "payload_size", "has_dlq_entry",
+            "next_retry_at", "payload_size", "idempotency_key", "has_dlq_entry",
             "created_at", "delivered_at"
         ]
         read_only_fields = fields
@@ -56,6 +112,9 @@ class DeadLetterQueueSerializer(serializers.ModelSerializer):
 
 
 class WebhookLogSerializer(serializers.ModelSerializer):
+    request_body = serializers.SerializerMethodField()
+    response_body = serializers.SerializerMethodField()
+    
     class Meta:
         model = WebhookLog
         fields = [
@@ -64,6 +123,12 @@ class WebhookLogSerializer(serializers.ModelSerializer):
             "response_body", "error_message", "duration_ms"
         ]
         read_only_fields = fields
+    
+    def get_request_body(self, obj):
+        return request_body(obj)
+    
+    def get_response_body(self, obj):
+        return response_body(obj)
 
 
 class WebhookStatsSerializer(serializers.Serializer):
@@ -0,0 +1,20 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Webhook
+from .subscriptions import notify_subscriptions_changed
+
+# Delivery bookkeeping that does not change who receives what
+STATS_FIELDS = {'total_deliveries', 'successful_deliveries', 'failed_deliveries'}
+
+
+@receiver(post_save, sender=Webhook)
+def handle_webhook_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= STATS_FIELDS:
+        return
+    notify_subscriptions_changed(instance.organization_id)
+
+
+@receiver(post_delete, sender=Webhook)
+def handle_webhook_deleted(sender, instance, **kwargs):
+    notify_subscriptions_changed(instance.organization_id)
@@ -0,0 +1,206 @@
+"""
+Webhook delivery statistics without a hot Webhook row
+- Delivery outcomes are counted in a Redis hash per webhook, and response
+  times in an hourly latency sketch (a histogram with 8 buckets per doubling,
+  about 9% relative error)
+- flush_pending_stats() moves the counts to Webhook.total/successful/
+  failed_deliveries with one UPDATE per flush, for every webhook at once
+- The API adds the counts not flushed yet (merged_counts), so success_rate
+  is current; latency percentiles come from the last 24 hourly sketches
+- If Redis is unavailable the counts go straight to the row, as before
+"""
+import logging
+import math
+import time
+from typing import Any, Dict, Iterable, Optional
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+
+from .models import Webhook
+from .queue import get_client
+
+logger = logging.getLogger(__name__)
+
+COUNTS_KEY = "webhooks:stats:{webhook_id}"
+# Webhooks with counts waiting to be flushed
+DIRTY_KEY = "webhooks:stats:dirty"
+LATENCY_KEY = "webhooks:latency:{webhook_id}:{hour}"
+
+COUNT_FIELDS = ('total', 'successful', 'failed')
+BUCKETS_PER_DOUBLING = 8
+LATENCY_HOURS = 24
+
+
+def latency_bucket(duration_ms: int) -> int:
+    if duration_ms < 1:
+        return 0
+    return 1 + int(math.log2(duration_ms) * BUCKETS_PER_DOUBLING)
+
+
+def bucket_value(bucket: int) -> float:
+    """Middle of a bucket's range, in milliseconds"""
+    if bucket == 0:
+        return 0.0
+    return 2 ** ((bucket - 0.5) / BUCKETS_PER_DOUBLING)
+
+
+def record_outcome(webhook_id, ok: bool, count: int = 1):
+    """Count `count` delivered (ok) or dead-lettered deliveries"""
+    key = COUNTS_KEY.format(webhook_id=webhook_id)
+    try:
+        pipe = get_client().pipeline(transaction=True)
+        pipe.hincrby(key, 'total', count)
+        pipe.hincrby(key, 'successful' if ok else 'failed', count)
+        pipe.sadd(DIRTY_KEY, str(webhook_id))
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"Webhook stats unavailable, updating webhook {webhook_id} directly: {e}")
+        field = 'successful_deliveries' if ok else 'failed_deliveries'
+        Webhook.objects.filter(id=webhook_id).update(
+            total_deliveries=F('total_deliveries') + count,
+            **{field: F(field) + count}
+        )
+
+
+def record_latency(webhook_id, duration_ms: int, now: Optional[float] = None):
+    """Add a response time to the webhook's sketch for the current hour"""
+    key = LATENCY_KEY.format(webhook_id=webhook_id, hour=int((now or time.time()) // 3600))
+    try:
+        pipe = get_client().pipeline(transaction=False)
+        pipe.hincrby(key, latency_bucket(duration_ms), 1)
+        pipe.expire(key, (LATENCY_HOURS + 1) * 3600)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"Webhook latency unavailable for webhook {webhook_id}: {e}")
+
+
+def _read_counts(values) -> Dict[str, int]:
+    return {field: int(value or 0) for field, value in zip(COUNT_FIELDS, values)}
+
+
+def take_pending_counts(limit: int = 1000) -> Dict[str, Dict[str, int]]:
+    """Remove and return the counts of up to `limit` webhooks"""
+    client = get_client()
+    webhook_ids = [webhook_id.decode() for webhook_id in client.spop(DIRTY_KEY, limit) or []]
+    if not webhook_ids:
+        return {}
+    # Read and reset each hash in one transaction; increments landing after
+    # the SPOP mark the webhook dirty again and are flushed next time
+    pipe = client.pipeline(transaction=True)
+    for webhook_id in webhook_ids:
+        key = COUNTS_KEY.format(webhook_id=webhook_id)
+        pipe.hmget(key, *COUNT_FIELDS)
+        pipe.delete(key)
+    results = pipe.execute()
+    return {
+        webhook_id: _read_counts(values)
+        for webhook_id, values in zip(webhook_ids, results[::2])
+        if any(values)
+    }
+
+
+def restore_pending_counts(counts: Dict[str, Dict[str, int]]):
+    """Put taken counts back after a failed flush"""
+    pipe = get_client().pipeline(transaction=True)
+    for webhook_id, fields in counts.items():
+        for field, value in fields.items():
+            if value:
+                pipe.hincrby(COUNTS_KEY.format(webhook_id=webhook_id), field, value)
+        pipe.sadd(DIRTY_KEY, webhook_id)
+    pipe.execute()
+
+
+def _increments(counts: Dict[str, Dict[str, int]], field: str):
+    return Case(
+        *(When(id=webhook_id, then=Value(fields[field])) for webhook_id, fields in counts.items()),
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+
+
+def flush_pending_stats(limit: int = 1000) -> int:
+    """Apply pending counts to their Webhook rows in one UPDATE; returns how many webhooks changed"""
+    counts = take_pending_counts(limit)
+    if not counts:
+        return 0
+    try:
+        with transaction.atomic():
+            Webhook.objects.filter(id__in=list(counts)).update(
+                total_deliveries=F('total_deliveries') + _increments(counts, 'total'),
+                successful_deliveries=F('successful_deliveries') + _increments(counts, 'successful'),
+                failed_deliveries=F('failed_deliveries') + _increments(counts, 'failed'),
+            )
+    except Exception:
+        restore_pending_counts(counts)
+        raise
+    return len(counts)
+
+
+def merged_counts_for(webhooks: Iterable[Webhook]) -> Dict[Any, Dict[str, int]]:
+    """Stored counts plus those still in Redis for many webhooks, keyed by id, with one round trip"""
+    webhooks = list(webhooks)
+    pending = [dict.fromkeys(COUNT_FIELDS, 0)] * len(webhooks)
+    if webhooks:
+        try:
+            pipe = get_client().pipeline(transaction=False)
+            for webhook in webhooks:
+                pipe.hmget(COUNTS_KEY.format(webhook_id=webhook.id), *COUNT_FIELDS)
+            pending = [_read_counts(values) for values in pipe.execute()]
+        except Exception as e:
+            logger.warning(f"Pending webhook stats unavailable for {len(webhooks)} webhooks: {e}")
+    return {
+        webhook.id: {
+            'total_deliveries': webhook.total_deliveries + counts['total'],
+            'successful_deliveries': webhook.successful_deliveries + counts['successful'],
+            'failed_deliveries': webhook.failed_deliveries + counts['failed'],
+        }
+        for webhook, counts in zip(webhooks, pending)
+    }
+
+
+def merged_counts(webhook) -> Dict[str, int]:
+    """Stored counts of a webhook plus those still in Redis"""
+    return merged_counts_for([webhook])[webhook.id]
+
+
+def success_rate(counts: Dict[str, int], empty: float = 100.0) -> float:
+    if counts['total_deliveries'] == 0:
+        return empty
+    return round((counts['successful_deliveries'] / counts['total_deliveries']) * 100, 2)
+
+
+def latency_percentiles(
+    webhook_id,
+    percentiles: Iterable[int] = (50, 95, 99),
+    now: Optional[float] = None,
+) -> Optional[Dict[str, float]]:
+    """Response time percentiles over the last 24 hours, merged from the hourly sketches"""
+    hour = int((now or time.time()) // 3600)
+    try:
+        pipe = get_client().pipeline(transaction=False)
+        for offset in range(LATENCY_HOURS):
+            pipe.hgetall(LATENCY_KEY.format(webhook_id=webhook_id, hour=hour - offset))
+        sketches = pipe.execute()
+    except Exception as e:
+        logger.warning(f"Webhook latency unavailable for webhook {webhook_id}: {e}")
+        return None
+
+    histogram: Dict[int, int] = {}
+    for sketch in sketches:
+        for bucket, count in sketch.items():
+            histogram[int(bucket)] = histogram.get(int(bucket), 0) + int(count)
+    total = sum(histogram.values())
+    if not total:
+        return None
+
+    result = {}
+    for percentile in percentiles:
+        rank = math.ceil(total * percentile / 100)
+        seen = 0
+        for bucket in sorted(histogram):
+            seen += histogram[bucket]
+            if seen >= rank:
+                result[f'p{percentile}'] = round(bucket_value(bucket), 1)
+                break
+    return result
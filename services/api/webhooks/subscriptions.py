@@ -0,0 +1,47 @@
+"""
+Invalidate the submission worker's webhook subscription index
+"""
+import logging
+
+import redis
+from django.conf import settings
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+# Shared with services/ingest/subscription_index.py
+INDEX_KEY = "webhooks:subscriptions:{organization_id}"
+VERSION_KEY = "webhooks:subscriptions:version:{organization_id}"
+
+_client = None
+
+
+def _get_client():
+    global _client
+    if _client is None:
+        _client = redis.from_url(
+            settings.WEBHOOK_SUBSCRIPTIONS_REDIS_URL,
+            socket_connect_timeout=2,
+            socket_timeout=2
+        )
+    return _client
+
+
+def _invalidate(organization_id):
+    try:
+        pipe = _get_client().pipeline(transaction=True)
+        # Bumping the version stops a worker that read the old rows from
+        # writing them back after the delete
+        pipe.incr(VERSION_KEY.format(organization_id=organization_id))
+        pipe.delete(INDEX_KEY.format(organization_id=organization_id))
+        pipe.publish(settings.WEBHOOK_SUBSCRIPTIONS_CHANNEL, organization_id)
+        pipe.execute()
+    except Exception:
+        # Cached indexes still expire on their own TTL
+        logger.exception(f"Failed to invalidate webhook subscriptions for organization {organization_id}")
+
+
+def notify_subscriptions_changed(organization_id):
+    """Drop the organization's cached subscription index once the change commits"""
+    organization_id = str(organization_id)
+    transaction.on_commit(lambda: _invalidate(organization_id))
@@ -1,14 +1,36 @@
+from django.db import connection
 from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 from rest_framework.test import APIClient
 from rest_framework import status
-from unittest.mock import patch, Mock
-from core.models import Organization, Membership, Submission
+from unittest.mock import patch
+from core.models import Organization, Membership, Submission, Answer
+from core.storage import SecureLocalStorage
 from forms.models import Form
-from webhooks.models import Webhook, Delivery, DeadLetterQueue
-from webhooks.tasks import deliver_webhook, process_submission_webhooks
-import responses
+from webhooks.models import Webhook, Delivery, DeadLetterQueue, WebhookPayload
+from webhooks.breaker import PARK, PROBE, CircuitBreaker, breaker_state
+from webhooks.engine import DeliveryEngine, HostPools, claim_delivery, release_delivery
+from webhooks.queue import QUEUE_KEY, SCHEDULE_KEY
+from webhooks.scheduler import RetryScheduler, rebuild_schedule, recover_expired_claims
+from webhooks.stats import latency_percentiles, record_latency, record_outcome
+from webhooks.ratelimit import reserve_slot
+from webhooks.delivery import queue_webhook
+from webhooks.logs import request_body, response_body
+from webhooks.serializers import WebhookLogSerializer, WebhookSerializer
+from webhooks.tasks import (
+    BATCH_EVENT, build_event_body, calculate_hmac_signature, flush_webhook_stats, prepare_webhook_payload,
+    process_submission_webhooks, redrive_dlq_entry, share_payload,
+)
+from asgiref.sync import async_to_sync
+import asyncio
+import fakeredis
+import httpx
+import json
+import os
+import tempfile
+import time
 
 User = get_user_model()
 
@@ -159,24 +181,43 @@ class WebhookDeliveryTestCase(TestCase):
             slug='test-form',
             created_by=self.user
         )
+        # Redis of the engine's timing wheel, kept across engines in a test
+        self.redis_server = fakeredis.FakeServer()
     
-    @responses.activate
-    def test_successful_webhook_delivery(self):
-        """Test successful webhook delivery"""
-        responses.add(
-            responses.POST,
-            'https://example.com/webhook',
-            json={'success': True},
-            status=200
+    def scheduled(self):
+        """Timing wheel entries as {delivery id: due timestamp}"""
+        entries = fakeredis.FakeRedis(server=self.redis_server).zrange(SCHEDULE_KEY, 0, -1, withscores=True)
+        return {delivery_id.decode(): due for delivery_id, due in entries}
+    
+    def deliver(self, handler, *delivery_ids, **engine_options):
+        """Run deliveries through the engine against a mock endpoint"""
+        # Thread-sensitive ORM calls stay on the test's connection and transaction
+        engine = DeliveryEngine(
+            fakeredis.aioredis.FakeRedis(server=self.redis_server),
+            HostPools(transport=httpx.MockTransport(handler)),
+            db_thread_sensitive=True,
+            **engine_options
         )
         
+        async def run():
+            try:
+                statuses = await asyncio.gather(*(engine.deliver(delivery_id) for delivery_id in delivery_ids))
+                await engine.flush_batches()
+                return statuses
+            finally:
+                await engine.close()
+        
+        return async_to_sync(run)()
+    
+    def test_successful_webhook_delivery(self):
+        """Test successful webhook delivery"""
         delivery = Delivery.objects.create(
             webhook=self.webhook,
             submission=None,
             partial=None
         )
         
-        deliver_webhook(delivery.id)
+        self.deliver(lambda request: httpx.Response(200, json={'success': True}), delivery.id)
         
         delivery.refresh_from_db()
         self.assertEqual(delivery.status, 'success')
@@ -188,39 +229,60 @@ class WebhookDeliveryTestCase(TestCase):
         self.assertEqual(self.webhook.total_deliveries, 1)
         self.assertEqual(self.webhook.successful_deliveries, 1)
     
-    @responses.activate
     def test_failed_webhook_delivery_with_retry(self):
-        """Test failed webhook delivery triggers retry"""
-        responses.add(
-            responses.POST,
-            'https://example.com/webhook',
-            json={'error': 'Server error'},
-            status=500
-        )
-        
+        """Test failed webhook delivery schedules a retry"""
         delivery = Delivery.objects.create(
             webhook=self.webhook,
             submission=None,
             partial=None
         )
         
-        with self.assertRaises(Exception):
-            deliver_webhook(delivery.id)
+        self.deliver(lambda request: httpx.Response(500, json={'error': 'Server error'}), delivery.id)
         
         delivery.refresh_from_db()
         self.assertEqual(delivery.status, 'pending')
         self.assertIsNotNone(delivery.next_retry_at)
         self.assertEqual(delivery.attempt, 1)
         self.assertIn('HTTP 500', delivery.error)
+        # The retry waits on the timing wheel for its due time
+        self.assertAlmostEqual(self.scheduled()[str(delivery.id)], delivery.next_retry_at.timestamp(), delta=1)
+    
+    def test_retry_is_sent_as_the_next_attempt(self):
+        """Test a due retry is claimed again and counted as a new attempt"""
+        delivery = Delivery.objects.create(webhook=self.webhook)
+        self.deliver(lambda request: httpx.Response(503), delivery.id)
+        
+        # Not due yet
+        self.assertEqual(self.deliver(lambda request: httpx.Response(200), delivery.id), [None])
+        
+        Delivery.objects.filter(id=delivery.id).update(next_retry_at=timezone.now())
+        attempts = []
+        
+        def handler(request):
+            attempts.append(request.headers['X-Forms-Attempt'])
+            return httpx.Response(200)
+        
+        self.assertEqual(self.deliver(handler, delivery.id), ['success'])
+        self.assertEqual(attempts, ['2'])
+        self.assertEqual(delivery.logs.count(), 2)
+    
+    def test_client_errors_are_not_retried(self):
+        """Test 4xx responses go to the DLQ without retrying"""
+        delivery = Delivery.objects.create(webhook=self.webhook)
+        
+        self.deliver(lambda request: httpx.Response(410), delivery.id)
+        
+        delivery.refresh_from_db()
+        self.assertEqual(delivery.status, 'dlq')
+        self.assertTrue(DeadLetterQueue.objects.filter(delivery=delivery).exists())
     
-    @responses.activate
     def test_webhook_hmac_signature(self):
         """Test webhook includes correct HMAC signature"""
-        responses.add(
-            responses.POST,
-            'https://example.com/webhook',
-            status=200
-        )
+        requests = []
+        
+        def handler(request):
+            requests.append(request)
+            return httpx.Response(200)
         
         delivery = Delivery.objects.create(
             webhook=self.webhook,
@@ -228,16 +290,20 @@ class WebhookDeliveryTestCase(TestCase):
             partial=None
         )
         
-        deliver_webhook(delivery.id)
+        self.deliver(handler, delivery.id)
         
         # Check request was made with correct headers
-        self.assertEqual(len(responses.calls), 1)
-        request = responses.calls[0].request
+        self.assertEqual(len(requests), 1)
+        request = requests[0]
         
         self.assertIn('X-Forms-Signature', request.headers)
         self.assertIn('X-Forms-Timestamp', request.headers)
         self.assertIn('X-Forms-Delivery-Id', request.headers)
         self.assertEqual(request.headers['Content-Type'], 'application/json')
+        self.assertEqual(
+            request.headers['X-Forms-Signature'],
+            f"sha256={calculate_hmac_signature(self.webhook.secret, request.content.decode())}"
+        )
     
     def test_dlq_entry_created_after_max_retries(self):
         """Test DLQ entry created when max retries exceeded"""
@@ -248,29 +314,272 @@ class WebhookDeliveryTestCase(TestCase):
             attempt=7  # Max retries
         )
         
-        # Using a mock task that simulates max retries
-        from celery import Task
-        mock_task = Mock(spec=Task)
-        mock_task.request.retries = 7
+        self.deliver(lambda request: httpx.Response(502), delivery.id)
+        
+        delivery.refresh_from_db()
+        self.assertEqual(delivery.status, 'dlq')
+        
+        # Check DLQ entry exists
+        dlq_entry = DeadLetterQueue.objects.get(delivery=delivery)
+        self.assertIn('HTTP 502', dlq_entry.reason)
+        self.assertEqual(dlq_entry.payload_json['type'], 'webhook.test')
+        
+        self.webhook.refresh_from_db()
+        self.assertEqual(self.webhook.failed_deliveries, 1)
+    
+    def test_delivery_is_sent_once(self):
+        """Test an id queued twice is only sent once"""
+        requests = []
         
-        from webhooks.tasks import handle_webhook_failure
-        with patch('webhooks.tasks.send_to_dlq.delay') as mock_dlq:
-            handle_webhook_failure(mock_task, delivery, 'Connection error')
-            mock_dlq.assert_called_once()
+        def handler(request):
+            requests.append(request)
+            return httpx.Response(200)
         
+        delivery = Delivery.objects.create(webhook=self.webhook)
+        
+        self.assertEqual(self.deliver(handler, delivery.id, delivery.id), ['success', None])
+        self.assertEqual(len(requests), 1)
+    
+    def test_response_body_is_read_up_to_the_limit(self):
+        """Test large response bodies are cut at max_response_bytes"""
+        self.webhook.success_log_policy = 'full'
+        self.webhook.save()
+        delivery = Delivery.objects.create(webhook=self.webhook)
+        
+        self.deliver(lambda request: httpx.Response(200, content=b'x' * 50000), delivery.id, max_response_bytes=100)
+        
+        self.assertEqual(response_body(delivery.logs.get()), 'x' * 100)
+    
+    @override_settings(WEBHOOK_LOG_SAMPLE_RATE=0)
+    def test_successes_outside_the_sample_log_metadata_only(self):
+        """Test unsampled successful attempts keep no headers or bodies"""
+        delivery = Delivery.objects.create(webhook=self.webhook)
+        
+        self.deliver(lambda request: httpx.Response(200, content=b'ok'), delivery.id)
+        
+        log = delivery.logs.get()
+        self.assertEqual(log.response_status, 200)
+        self.assertIsNotNone(log.duration_ms)
+        self.assertIsNone(log.request_headers)
+        self.assertIsNone(request_body(log))
+        self.assertIsNone(response_body(log))
+    
+    @override_settings(WEBHOOK_LOG_SAMPLE_RATE=0)
+    def test_failures_are_logged_in_full_compressed(self):
+        """Test failed attempts keep zstd-compressed bodies whatever the policy"""
+        self.webhook.success_log_policy = 'metadata'
+        self.webhook.save()
+        delivery = Delivery.objects.create(webhook=self.webhook)
+        sent = []
+        
+        def handler(request):
+            sent.append(request.content.decode())
+            return httpx.Response(500, content=b'boom')
+        
+        self.deliver(handler, delivery.id)
+        
+        log = delivery.logs.get()
+        self.assertIsNotNone(log.request_body_zstd)
+        self.assertIsNone(log.request_body)
+        self.assertIn('X-Forms-Signature', log.request_headers)
+        self.assertEqual(request_body(log), sent[0])
+        self.assertEqual(response_body(log), 'boom')
+    
+    @override_settings(WEBHOOK_LOG_MAX_INLINE_BYTES=32)
+    def test_large_log_bodies_move_to_secure_storage(self):
+        """Test compressed bodies over the inline limit are stored as files"""
+        self.webhook.success_log_policy = 'full'
+        self.webhook.save()
+        delivery = Delivery.objects.create(webhook=self.webhook)
+        
+        with tempfile.TemporaryDirectory() as location, \
+                patch('webhooks.logs.webhook_log_storage', SecureLocalStorage(location=location)):
+            self.deliver(lambda request: httpx.Response(200, content=b'ok'), delivery.id)
+            
+            log = delivery.logs.get()
+            self.assertIsNone(log.request_body_zstd)
+            self.assertTrue(os.path.exists(os.path.join(location, log.request_body_file)))
+            data = WebhookLogSerializer(log).data
+            self.assertEqual(json.loads(data['request_body'])['type'], 'webhook.test')
+            # Small enough to stay in the row
+            self.assertEqual(log.response_body_file, '')
+            self.assertEqual(data['response_body'], 'ok')
+    
+    def test_endpoint_concurrency_cap(self):
+        """Test no more than max_concurrency requests reach one endpoint at once"""
+        self.webhook.max_concurrency = 2
+        self.webhook.save()
+        deliveries = [Delivery.objects.create(webhook=self.webhook) for _ in range(6)]
+        in_flight = []
+        peak = []
+        
+        async def handler(request):
+            in_flight.append(request)
+            peak.append(len(in_flight))
+            await asyncio.sleep(0.01)
+            in_flight.remove(request)
+            return httpx.Response(200)
+        
+        statuses = self.deliver(handler, *[delivery.id for delivery in deliveries])
+        
+        self.assertEqual(statuses, ['success'] * 6)
+        self.assertEqual(max(peak), 2)
+    
+    def test_open_breaker_parks_delivery(self):
+        """Test deliveries to a host with an open breaker are parked, not sent"""
+        server = fakeredis.FakeServer()
+        breaker = CircuitBreaker(fakeredis.aioredis.FakeRedis(server=server), min_requests=1)
+        async_to_sync(breaker.record)('example.com', 'earlier', False)
+        delivery = Delivery.objects.create(webhook=self.webhook)
+        sent = []
+        
+        statuses = self.deliver(lambda request: sent.append(request) or httpx.Response(200), delivery.id, breaker=breaker)
+        
+        self.assertEqual(statuses, ['parked'])
+        self.assertEqual(sent, [])
         delivery.refresh_from_db()
-        self.assertEqual(delivery.status, 'failed')
+        self.assertEqual(delivery.status, 'parked')
+        self.assertEqual(delivery.attempt, 1)
+        self.assertIsNotNone(delivery.next_retry_at)
+        parked = fakeredis.FakeRedis(server=server).lrange('webhooks:breaker:example.com:parked', 0, -1)
+        self.assertEqual(parked, [str(delivery.id).encode()])
+    
+    def test_parked_delivery_is_sent_when_released(self):
+        """Test a parked delivery is claimed again once its breaker lets it through"""
+        delivery = Delivery.objects.create(
+            webhook=self.webhook,
+            status='parked',
+            next_retry_at=timezone.now() + timezone.timedelta(hours=1)
+        )
         
-        # Simulate DLQ entry creation (which would happen async in real scenario)
-        DeadLetterQueue.objects.create(
-            delivery=delivery,
-            reason='Connection error',
-            payload_json={}
+        self.deliver(lambda request: httpx.Response(200), delivery.id)
+        
+        delivery.refresh_from_db()
+        self.assertEqual(delivery.status, 'success')
+    
+    def test_endpoint_failures_open_the_breaker(self):
+        """Test 5xx responses count against the host's breaker and 4xx do not"""
+        breaker = CircuitBreaker(fakeredis.aioredis.FakeRedis(), min_requests=2)
+        deliveries = [Delivery.objects.create(webhook=self.webhook) for _ in range(2)]
+        
+        self.deliver(lambda request: httpx.Response(400), deliveries[0].id, breaker=breaker)
+        self.assertEqual(async_to_sync(breaker.acquire)('example.com', 'next'), 'allow')
+        
+        self.deliver(lambda request: httpx.Response(503), deliveries[1].id, breaker=breaker)
+        self.assertEqual(async_to_sync(breaker.acquire)('example.com', 'next'), PARK)
+    
+    def enable_batching(self, **options):
+        for field, value in options.items():
+            setattr(self.webhook, field, value)
+        self.webhook.batch_enabled = True
+        self.webhook.save()
+        return [
+            Delivery.objects.create(webhook=self.webhook, event='submission.created', payload={'n': n})
+            for n in range(5)
+        ]
+    
+    def test_batched_deliveries_are_sent_as_one_signed_array(self):
+        """Test a batching webhook gets one request with every delivery as an item"""
+        deliveries = self.enable_batching(batch_max_size=10)
+        requests = []
+        
+        def handler(request):
+            requests.append(request)
+            return httpx.Response(200)
+        
+        statuses = self.deliver(handler, *(delivery.id for delivery in deliveries))
+        
+        self.assertEqual(statuses, ['batched'] * 5)
+        self.assertEqual(len(requests), 1)
+        request = requests[0]
+        body = request.content.decode()
+        self.assertEqual(
+            request.headers['X-Forms-Signature'],
+            f"sha256={calculate_hmac_signature(self.webhook.secret, body)}"
         )
+        self.assertEqual(request.headers['X-Forms-Batch-Size'], '5')
+        items = json.loads(body)
+        self.assertEqual([item['id'] for item in items], [str(delivery.id) for delivery in deliveries])
+        self.assertEqual(items[0]['event'], 'submission.created')
+        self.assertEqual(items[0]['payload'], {'n': 0})
         
-        # Check DLQ entry exists
-        dlq_exists = DeadLetterQueue.objects.filter(delivery=delivery).exists()
-        self.assertTrue(dlq_exists)
+        batch = Delivery.objects.get(event=BATCH_EVENT)
+        self.assertEqual(request.headers['X-Forms-Delivery-Id'], str(batch.id))
+        self.assertEqual(batch.status, 'success')
+        self.assertEqual(set(batch.items.values_list('status', flat=True)), {'success'})
+        self.webhook.refresh_from_db()
+        self.assertEqual(self.webhook.total_deliveries, 5)
+        self.assertEqual(self.webhook.successful_deliveries, 5)
+    
+    def test_batches_are_cut_at_max_size_and_bytes(self):
+        """Test batches close at batch_max_size items or batch_max_bytes"""
+        sizes = []
+        
+        def handler(request):
+            sizes.append(len(json.loads(request.content)))
+            return httpx.Response(200)
+        
+        deliveries = self.enable_batching(batch_max_size=2)
+        self.deliver(handler, *(delivery.id for delivery in deliveries))
+        self.assertEqual(sorted(sizes), [1, 2, 2])
+        
+        sizes.clear()
+        # Items take 100 bytes of the array: room for three
+        deliveries = self.enable_batching(batch_max_size=100, batch_max_bytes=400)
+        self.deliver(handler, *(delivery.id for delivery in deliveries))
+        self.assertEqual(sorted(sizes), [2, 3])
+    
+    def test_batch_is_sent_after_linger_time(self):
+        """Test a batch that never fills up is sent once its linger time is up"""
+        delivery = self.enable_batching(batch_max_size=10, batch_linger_ms=50)[0]
+        requests = []
+        engine = DeliveryEngine(
+            None,
+            HostPools(transport=httpx.MockTransport(lambda request: requests.append(request) or httpx.Response(200))),
+            db_thread_sensitive=True
+        )
+        
+        async def run():
+            await engine.deliver(delivery.id)
+            self.assertEqual(requests, [])
+            await asyncio.sleep(0.2)
+            await engine.close()
+        
+        async_to_sync(run)()
+        self.assertEqual(len(requests), 1)
+        delivery.refresh_from_db()
+        self.assertEqual(delivery.status, 'success')
+    
+    def test_failed_batch_is_retried_and_dead_lettered_as_a_whole(self):
+        """Test retries and the DLQ entry belong to the batch, and a redrive resends its items"""
+        deliveries = self.enable_batching(batch_max_size=10, max_retries=2)
+        
+        self.deliver(lambda request: httpx.Response(500), *(delivery.id for delivery in deliveries))
+        batch = Delivery.objects.get(event=BATCH_EVENT)
+        self.assertEqual(batch.status, 'pending')
+        self.assertEqual(batch.attempt, 1)
+        self.assertEqual(set(batch.items.values_list('status', flat=True)), {'batched'})
+        
+        Delivery.objects.filter(id=batch.id).update(next_retry_at=timezone.now())
+        self.deliver(lambda request: httpx.Response(500), batch.id)
+        batch.refresh_from_db()
+        self.assertEqual(batch.status, 'dlq')
+        self.assertEqual(batch.attempt, 2)
+        self.assertEqual(set(batch.items.values_list('status', flat=True)), {'dlq'})
+        self.assertEqual(DeadLetterQueue.objects.count(), 1)
+        entry = DeadLetterQueue.objects.get()
+        self.assertEqual(entry.delivery, batch)
+        self.assertEqual(len(entry.payload_json), 5)
+        self.webhook.refresh_from_db()
+        self.assertEqual(self.webhook.failed_deliveries, 5)
+        
+        with patch('webhooks.tasks.enqueue_delivery') as mock_enqueue:
+            redrive_dlq_entry(entry.id)
+        redriven = Delivery.objects.exclude(id=batch.id).get(event=BATCH_EVENT)
+        mock_enqueue.assert_called_once_with(redriven.id)
+        self.assertEqual(redriven.payload, batch.payload)
+        self.assertEqual(redriven.items.count(), 5)
+        self.assertEqual(set(redriven.items.values_list('status', flat=True)), {'batched'})
     
     def test_process_submission_webhooks(self):
         """Test webhooks are created for new submission"""
@@ -283,34 +592,389 @@ class WebhookDeliveryTestCase(TestCase):
             completed_at=timezone.now()
         )
         
-        # Mock the deliver_webhook task
-        with patch('webhooks.tasks.deliver_webhook.s') as mock_deliver_task:
-            # Create a mock for the signature
-            mock_signature = Mock()
-            mock_deliver_task.return_value = mock_signature
+        with patch('webhooks.tasks.enqueue_delivery') as mock_enqueue:
+            process_submission_webhooks(submission.id)
+            
+            # Check delivery was created
+            self.assertEqual(Delivery.objects.count(), 1)
+            delivery = Delivery.objects.first()
+            self.assertEqual(delivery.webhook, self.webhook)
+            self.assertEqual(delivery.submission, submission)
             
-            # Mock the group and apply_async
-            with patch('webhooks.tasks.group') as mock_group:
-                mock_group_instance = Mock()
-                mock_group.return_value = mock_group_instance
-                mock_group_instance.apply_async = Mock()
-                
-                process_submission_webhooks(submission.id)
-                
-                # Check delivery was created
-                self.assertEqual(Delivery.objects.count(), 1)
-                delivery = Delivery.objects.first()
-                self.assertEqual(delivery.webhook, self.webhook)
-                self.assertEqual(delivery.submission, submission)
-                
-                # Check deliver_webhook.s was called with the delivery id
-                mock_deliver_task.assert_called_once_with(delivery.id)
-                
-                # Check group was called with the list of tasks
-                mock_group.assert_called_once_with([mock_signature])
-                
-                # Check apply_async was called
-                mock_group_instance.apply_async.assert_called_once()
+            # Check the delivery was handed to the engine
+            mock_enqueue.assert_called_once_with(delivery.id)
+    
+    def test_fan_out_shares_one_serialized_payload(self):
+        """Test fan-out builds the submission body once and each delivery adds its envelope"""
+        other = Webhook.objects.create(organization=self.org, url='https://other.example.com/hook', secret='other-secret')
+        submission = Submission.objects.create(
+            form=self.form,
+            version=1,
+            respondent_key='test-key',
+            locale='en',
+            completed_at=timezone.now()
+        )
+        Answer.objects.create(submission=submission, block_id='email', type='email', value_json='a@example.com')
+        
+        with patch('webhooks.tasks.enqueue_delivery'), CaptureQueriesContext(connection) as queries:
+            process_submission_webhooks(submission.id)
+        
+        answer_queries = [q for q in queries.captured_queries if 'core_answer' in q['sql']]
+        self.assertEqual(len(answer_queries), 1)
+        self.assertEqual(WebhookPayload.objects.count(), 1)
+        deliveries = Delivery.objects.filter(submission=submission)
+        self.assertEqual(deliveries.count(), 2)
+        self.assertEqual({delivery.shared_payload_id for delivery in deliveries}, {WebhookPayload.objects.get().digest})
+        
+        requests = []
+        self.deliver(lambda request: requests.append(request) or httpx.Response(200), *(d.id for d in deliveries))
+        
+        self.assertEqual(len(requests), 2)
+        secrets = {str(self.webhook.id): self.webhook.secret, str(other.id): other.secret}
+        for request in requests:
+            body = request.content.decode()
+            payload = json.loads(body)
+            self.assertEqual(request.headers['X-Forms-Delivery-Id'], payload['delivery_id'])
+            self.assertEqual(
+                request.headers['X-Forms-Signature'],
+                f"sha256={calculate_hmac_signature(secrets[payload['webhook_id']], body)}"
+            )
+            # Same body as a payload built for the delivery on its own
+            expected = prepare_webhook_payload(Delivery.objects.get(id=payload['delivery_id']))
+            expected['timestamp'] = payload['timestamp']
+            self.assertEqual(payload, expected)
+            self.assertEqual(list(payload), list(expected))
+        
+        # Identical bodies are stored once
+        share_payload(build_event_body('submission.created', submission=submission))
+        self.assertEqual(WebhookPayload.objects.count(), 1)
+
+
+class HostPoolsTestCase(TestCase):
+    def test_one_client_per_origin(self):
+        """Test clients are shared per origin and idle ones are closed past max_hosts"""
+        pools = HostPools(max_hosts=2)
+        
+        async def run():
+            async with pools.client('https://a.example.com/one') as first:
+                async with pools.client('https://a.example.com/two') as second:
+                    self.assertIs(first, second)
+                async with pools.client('https://b.example.com/') as other:
+                    self.assertIsNot(first, other)
+                    # a.example.com is still in use, so it survives going over the cap
+                    async with pools.client('https://c.example.com/'):
+                        self.assertEqual(len(pools._clients), 3)
+            async with pools.client('https://d.example.com/'):
+                pass
+            origins = [origin[1] for origin in pools._clients]
+            await pools.close()
+            return origins
+        
+        self.assertEqual(async_to_sync(run)(), ['c.example.com', 'd.example.com'])
+
+
+class RetrySchedulerTestCase(TestCase):
+    """Timing wheel: due deliveries are moved to the engine's queue in batches"""
+    
+    def setUp(self):
+        self.server = fakeredis.FakeServer()
+        self.redis = fakeredis.FakeRedis(server=self.server)
+    
+    def pop_due(self, now, batch_size=2):
+        async def run():
+            scheduler = RetryScheduler(fakeredis.aioredis.FakeRedis(server=self.server), batch_size=batch_size)
+            try:
+                return await scheduler.pop_due(now=now)
+            finally:
+                await scheduler.close()
+        return async_to_sync(run)()
+    
+    def test_due_deliveries_are_queued_in_order(self):
+        """Test only due entries move, earliest first, across several batches"""
+        self.redis.zadd(SCHEDULE_KEY, {'d3': 1030, 'd1': 1010, 'd2': 1020, 'd4': 1040, 'later': 2000})
+        
+        self.assertEqual(self.pop_due(1000), 0)
+        self.assertEqual(self.pop_due(1040), 4)
+        
+        self.assertEqual(self.redis.rpop(QUEUE_KEY, 10), [b'd1', b'd2', b'd3', b'd4'])
+        self.assertEqual(self.redis.zrange(SCHEDULE_KEY, 0, -1), [b'later'])
+        # Each entry is queued once
+        self.assertEqual(self.pop_due(1040), 0)
+    
+    def test_rebuild_from_deliveries(self):
+        """Test pending and parked rows go back on the wheel at their due time"""
+        org = Organization.objects.create(name='Test Org', slug='test-org')
+        webhook = Webhook.objects.create(organization=org, url='https://example.com/hook', secret='secret')
+        due = timezone.now() + timezone.timedelta(minutes=10)
+        retry = Delivery.objects.create(webhook=webhook, next_retry_at=due)
+        parked = Delivery.objects.create(webhook=webhook, status='parked', next_retry_at=due)
+        new = Delivery.objects.create(webhook=webhook)
+        Delivery.objects.create(webhook=webhook, status='success')
+        
+        with patch('webhooks.scheduler.get_client', return_value=self.redis):
+            self.assertEqual(rebuild_schedule(), 3)
+        
+        scores = dict(self.redis.zrange(SCHEDULE_KEY, 0, -1, withscores=True))
+        self.assertEqual(set(scores), {str(d.id).encode() for d in (retry, parked, new)})
+        self.assertAlmostEqual(scores[str(retry.id).encode()], due.timestamp(), places=3)
+        self.assertLessEqual(scores[str(new.id).encode()], timezone.now().timestamp())
+    
+    @override_settings(WEBHOOK_ENGINE_CLAIM_LEASE_SECONDS=60)
+    def test_expired_claims_are_recovered(self):
+        """Test deliveries left processing by a dead engine go back on the wheel after their lease"""
+        org = Organization.objects.create(name='Test Org', slug='test-org')
+        webhook = Webhook.objects.create(organization=org, url='https://example.com/hook', secret='secret')
+        delivery = Delivery.objects.create(webhook=webhook)
+        released = Delivery.objects.create(webhook=webhook)
+        
+        claim_delivery(str(delivery.id))
+        claim_delivery(str(released.id))
+        release_delivery(str(released.id))
+        delivery.refresh_from_db()
+        self.assertEqual(delivery.status, 'processing')
+        self.assertGreater(delivery.next_retry_at, timezone.now() + timezone.timedelta(seconds=50))
+        
+        with patch('webhooks.scheduler.get_client', return_value=self.redis):
+            # Still leased
+            self.assertEqual(recover_expired_claims(), 0)
+            Delivery.objects.filter(id=delivery.id).update(next_retry_at=timezone.now() - timezone.timedelta(seconds=1))
+            self.assertEqual(recover_expired_claims(), 1)
+        
+        delivery.refresh_from_db()
+        self.assertEqual(delivery.status, 'pending')
+        self.assertTrue(delivery.error)
+        self.assertEqual(self.redis.zrange(SCHEDULE_KEY, 0, -1), [str(delivery.id).encode()])
+        # Handed back by the engine: due now, nothing to recover
+        released.refresh_from_db()
+        self.assertEqual(released.status, 'pending')
+        self.assertIsNone(released.next_retry_at)
+        # The next claim counts the lost attempt
+        prepared, _ = claim_delivery(str(delivery.id))
+        self.assertEqual(prepared.delivery.attempt, 2)
+
+
+class WebhookStatsTestCase(TestCase):
+    """Delivery counts accumulate in Redis and reach the Webhook rows in batched flushes"""
+    
+    def setUp(self):
+        self.org = Organization.objects.create(name='Test Org', slug='test-org')
+        self.webhook = Webhook.objects.create(
+            organization=self.org,
+            url='https://example.com/webhook',
+            secret='secret',
+            total_deliveries=10,
+            successful_deliveries=10
+        )
+        self.other = Webhook.objects.create(organization=self.org, url='https://example.com/other', secret='secret')
+        self.redis = fakeredis.FakeRedis()
+        patcher = patch('webhooks.stats.get_client', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def test_webhook_list_merges_pending_counts_per_webhook(self):
+        """Test a page of webhooks gets each webhook's own pending counts"""
+        record_outcome(self.webhook.id, False)
+        record_outcome(self.other.id, True, count=5)
+        
+        data = WebhookSerializer([self.webhook, self.other], many=True).data
+        
+        self.assertEqual([row['total_deliveries'] for row in data], [11, 5])
+        self.assertEqual([row['success_rate'] for row in data], [90.91, 100.0])
+    
+    def test_outcomes_are_merged_until_flushed(self):
+        """Test the API includes counts that are still in Redis"""
+        for ok in (True, False, False):
+            record_outcome(self.webhook.id, ok)
+        record_outcome(self.other.id, True, count=5)
+        
+        self.webhook.refresh_from_db()
+        self.assertEqual(self.webhook.total_deliveries, 10)
+        data = WebhookSerializer(self.webhook).data
+        self.assertEqual(data['total_deliveries'], 13)
+        self.assertEqual(data['successful_deliveries'], 11)
+        self.assertEqual(data['failed_deliveries'], 2)
+        self.assertEqual(data['success_rate'], 84.62)
+        
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(flush_webhook_stats(), 2)
+        updates = [q for q in queries.captured_queries if q['sql'].startswith('UPDATE "webhooks_webhook"')]
+        self.assertEqual(len(updates), 1)
+        
+        self.webhook.refresh_from_db()
+        self.other.refresh_from_db()
+        self.assertEqual(
+            (self.webhook.total_deliveries, self.webhook.successful_deliveries, self.webhook.failed_deliveries),
+            (13, 11, 2)
+        )
+        self.assertEqual((self.other.total_deliveries, self.other.successful_deliveries), (5, 5))
+        # Nothing counted twice
+        self.assertEqual(WebhookSerializer(self.webhook).data['total_deliveries'], 13)
+        self.assertEqual(flush_webhook_stats(), 0)
+    
+    def test_failed_flush_keeps_the_counts(self):
+        """Test counts taken for a flush that fails go back to Redis"""
+        record_outcome(self.webhook.id, True, count=3)
+        
+        with patch('webhooks.stats.Webhook.objects.filter', side_effect=RuntimeError('database down')):
+            with self.assertRaises(RuntimeError):
+                flush_webhook_stats()
+        
+        self.assertEqual(flush_webhook_stats(), 1)
+        self.webhook.refresh_from_db()
+        self.assertEqual(self.webhook.total_deliveries, 13)
+    
+    def test_latency_percentiles(self):
+        """Test percentiles merge the hourly sketches of the last day"""
+        now = 1_800_000_000.0
+        for duration_ms in [100] * 90 + [1000] * 9:
+            record_latency(self.webhook.id, duration_ms, now=now - 7200)
+        record_latency(self.webhook.id, 5000, now=now)
+        # Older than a day
+        record_latency(self.webhook.id, 60000, now=now - 25 * 3600)
+        
+        latency = latency_percentiles(self.webhook.id, now=now)
+        
+        self.assertAlmostEqual(latency['p50'], 100, delta=10)
+        self.assertAlmostEqual(latency['p95'], 1000, delta=100)
+        self.assertAlmostEqual(latency['p99'], 1000, delta=100)
+        self.assertIsNone(latency_percentiles(self.other.id, now=now))
+
+
+class CircuitBreakerTestCase(TestCase):
+    """Breaker transitions, driven with explicit clock values"""
+    
+    def setUp(self):
+        self.server = fakeredis.FakeServer()
+        self.redis = fakeredis.aioredis.FakeRedis(server=self.server)
+        self.breaker = CircuitBreaker(
+            self.redis,
+            window_seconds=60,
+            bucket_seconds=10,
+            min_requests=4,
+            failure_rate=0.5,
+            open_seconds=30,
+            max_open_seconds=100,
+            probe_lease_seconds=35,
+        )
+        self.host = 'hooks.example.com'
+    
+    def run_async(self, coro):
+        async def run():
+            return await coro
+        return async_to_sync(run)()
+    
+    def record(self, ok, now, delivery_id='d'):
+        return self.run_async(self.breaker.record(self.host, delivery_id, ok, now=now))
+    
+    def acquire(self, delivery_id, now):
+        return self.run_async(self.breaker.acquire(self.host, delivery_id, now=now))
+    
+    def open_breaker(self, now=1000.0):
+        for ok in (True, False, True, False):
+            state = self.record(ok, now)
+        self.assertEqual(state, 'open')
+    
+    def test_opens_on_failure_rate(self):
+        """Test the breaker needs min_requests and the failure rate within the window"""
+        for _ in range(3):
+            self.assertEqual(self.record(False, 1000.0), 'closed')
+        # Outcomes older than the window no longer count
+        self.assertEqual(self.record(False, 1065.0), 'closed')
+        self.assertEqual(self.record(True, 1066.0), 'closed')
+        self.assertEqual(self.record(True, 1066.0), 'closed')
+        self.assertEqual(self.acquire('x', 1066.0), 'allow')
+        self.assertEqual(self.record(False, 1067.0), 'open')
+        self.assertEqual(self.acquire('x', 1070.0), PARK)
+    
+    def test_probe_success_releases_parked_deliveries(self):
+        """Test one probe goes out after the cool-down and its success closes the breaker"""
+        self.open_breaker()
+        for delivery_id in ('p1', 'p2', 'p3'):
+            self.assertEqual(self.acquire(delivery_id, 1010.0), PARK)
+            self.run_async(self.breaker.park(self.host, delivery_id))
+        
+        # Not due yet
+        self.assertEqual(self.run_async(self.breaker.release_probes(now=1020.0)), 0)
+        self.assertEqual(self.run_async(self.breaker.release_probes(now=1031.0)), 1)
+        # Only one probe while it is in flight
+        self.assertEqual(self.run_async(self.breaker.release_probes(now=1032.0)), 0)
+        self.assertEqual(self.run_async(self.redis.lrange(QUEUE_KEY, 0, -1)), [b'p1'])
+        
+        self.assertEqual(self.acquire('p1', 1032.0), PROBE)
+        self.assertEqual(self.acquire('new', 1032.0), PARK)
+        self.assertEqual(self.record(True, 1033.0, 'p1'), 'closed')
+        
+        # Parked deliveries are queued oldest first behind the probe
+        self.assertEqual(self.run_async(self.redis.rpop(QUEUE_KEY, 3)), [b'p1', b'p2', b'p3'])
+        self.assertEqual(self.acquire('new', 1034.0), 'allow')
+        self.assertEqual(self.run_async(self.redis.zcard('webhooks:breakers:open')), 0)
+    
+    def test_probe_failure_reopens_with_longer_cool_down(self):
+        """Test a failed probe doubles the cool-down, up to max_open_seconds"""
+        self.open_breaker()
+        self.assertEqual(self.acquire('p1', 1031.0), PROBE)
+        self.assertEqual(self.record(False, 1032.0, 'p1'), 'open')
+        self.assertEqual(self.acquire('p2', 1091.0), PARK)
+        self.assertEqual(self.acquire('p2', 1093.0), PROBE)
+        self.assertEqual(self.record(False, 1094.0, 'p2'), 'open')
+        # 120 seconds is capped at 100
+        self.assertEqual(self.acquire('p3', 1193.0), PARK)
+        self.assertEqual(self.acquire('p3', 1195.0), PROBE)
+    
+    def test_lost_probe_is_replaced_after_its_lease(self):
+        """Test a probe that never reports back does not hold the breaker half open"""
+        self.open_breaker()
+        self.assertEqual(self.acquire('p1', 1031.0), PROBE)
+        self.assertEqual(self.acquire('p2', 1060.0), PARK)
+        self.assertEqual(self.acquire('p2', 1067.0), PROBE)
+        # A late report from the replaced probe is ignored
+        self.assertEqual(self.record(True, 1068.0, 'p1'), 'half_open')
+    
+    def test_state_in_webhook_api(self):
+        """Test the webhook API shows the breaker of the webhook's host"""
+        now = timezone.now().timestamp()
+        self.record(False, now)
+        client = fakeredis.FakeRedis(server=self.server)
+        
+        with patch('webhooks.breaker.get_client', return_value=client):
+            state = breaker_state('https://hooks.example.com/path')
+        self.assertEqual(state['state'], 'closed')
+        self.assertEqual(state['window_requests'], 1)
+        self.assertEqual(state['failure_rate'], 1.0)
+        
+        self.open_breaker(now=now)
+        self.run_async(self.breaker.park(self.host, 'p1'))
+        webhook = Webhook.objects.create(
+            organization=Organization.objects.create(name='Test Org', slug='test-org'),
+            url='https://hooks.example.com/path',
+            secret='secret'
+        )
+        
+        with patch('webhooks.breaker.get_client', return_value=client):
+            state = WebhookSerializer(webhook).data['circuit_breaker']
+        
+        self.assertEqual(state['host'], self.host)
+        self.assertEqual(state['state'], 'open')
+        # Opening starts a fresh window
+        self.assertEqual(state['window_requests'], 0)
+        self.assertAlmostEqual(state['open_until'], now + 30, places=2)
+        self.assertEqual(state['parked_deliveries'], 1)
+    
+    def test_webhook_list_reads_breakers_in_one_round_trip(self):
+        """Test a page of webhooks reads every host's breaker with one pipeline"""
+        self.open_breaker(now=timezone.now().timestamp())
+        org = Organization.objects.create(name='Test Org', slug='test-org')
+        for url in ('https://hooks.example.com/a', 'https://hooks.example.com/b', 'https://other.example.com/'):
+            Webhook.objects.create(organization=org, url=url, secret='secret')
+        client = fakeredis.FakeRedis(server=self.server)
+        
+        with patch('webhooks.breaker.get_client', return_value=client) as get_client, \
+                patch('webhooks.stats.get_client', return_value=client) as get_stats_client:
+            data = WebhookSerializer(Webhook.objects.order_by('url'), many=True).data
+        
+        self.assertEqual(get_client.call_count, 1)
+        self.assertEqual(get_stats_client.call_count, 1)
+        self.assertEqual([row['circuit_breaker']['state'] for row in data], ['open', 'open', 'closed'])
 
 
 class RateLimitTestCase(TestCase):
@@ -323,25 +987,159 @@ class RateLimitTestCase(TestCase):
         self.webhook = Webhook.objects.create(
             organization=self.org,
             url='https://example.com/webhook',
-            secret='secret'
+            secret='secret',
+            rate_limit_per_minute=60,
+            rate_limit_burst=3
+        )
+        self.redis = fakeredis.FakeRedis()
+    
+    def reserve(self, delivery_id, now):
+        with patch('webhooks.ratelimit.get_client', return_value=self.redis):
+            return reserve_slot(self.webhook, delivery_id, now=now)
+    
+    def test_burst_then_rate(self):
+        """Test the burst goes out at once and later deliveries get successive slots"""
+        for i in range(3):
+            self.assertEqual(self.reserve(f'd{i}', 1000.0), 0)
+        
+        # 60 per minute: one slot per second after the burst
+        self.assertAlmostEqual(self.reserve('d3', 1000.0), 1.0)
+        self.assertAlmostEqual(self.reserve('d4', 1000.0), 2.0)
+        # Tokens come back over time
+        self.assertEqual(self.reserve('d5', 1010.0), 0)
+    
+    def test_reserved_slot_is_kept(self):
+        """Test a scheduled delivery keeps its slot instead of taking another token"""
+        for i in range(3):
+            self.reserve(f'd{i}', 1000.0)
+        self.assertAlmostEqual(self.reserve('late', 1000.0), 1.0)
+        self.assertAlmostEqual(self.reserve('later', 1000.0), 2.0)
+        
+        # Asking early reports the remaining wait
+        self.assertAlmostEqual(self.reserve('late', 1000.5), 0.5)
+        self.assertEqual(self.reserve('late', 1001.0), 0)
+        self.assertAlmostEqual(self.reserve('next', 1001.0), 2.0)
+    
+    @override_settings(WEBHOOK_RATE_LIMIT_PER_MINUTE=600, WEBHOOK_RATE_LIMIT_BURST=1)
+    def test_settings_defaults(self):
+        """Test webhooks without their own limits use the settings"""
+        self.webhook.rate_limit_per_minute = None
+        self.webhook.rate_limit_burst = None
+        
+        self.assertEqual(self.reserve('d0', 1000.0), 0)
+        self.assertAlmostEqual(self.reserve('d1', 1000.0), 0.1)
+    
+    def test_throttled_delivery_is_scheduled_for_its_slot(self):
+        """Test the engine holds a delivery over the limit until its slot"""
+        for i in range(3):
+            self.reserve(f'd{i}', time.time())
+        delivery = Delivery.objects.create(webhook=self.webhook)
+        
+        with patch('webhooks.ratelimit.get_client', return_value=self.redis):
+            prepared, retry_in = claim_delivery(delivery.id)
+        
+        self.assertIsNone(prepared)
+        self.assertGreater(retry_in, 0)
+        self.assertLessEqual(retry_in, 1)
+        delivery.refresh_from_db()
+        self.assertEqual(delivery.status, 'pending')
+        self.assertAlmostEqual(
+            (delivery.next_retry_at - timezone.now()).total_seconds(), retry_in, delta=0.5
+        )
+
+class QueueWebhookTestCase(TestCase):
+    def setUp(self):
+        self.org = Organization.objects.create(name='Test Org', slug='test-org')
+        self.webhook = Webhook.objects.create(
+            organization=self.org,
+            url='https://example.com/webhook',
+            secret='test-secret-key'
         )
+        self.redis = fakeredis.FakeRedis()
+        for target in ('webhooks.delivery.get_client', 'webhooks.queue.get_client'):
+            patcher = patch(target, return_value=self.redis)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+    
+    def test_idempotency_key_is_stored_in_its_column(self):
+        """Test the key gets the indexed column as well as the payload"""
+        with self.captureOnCommitCallbacks(execute=True):
+            delivery = queue_webhook(self.webhook, 'submission.created', {}, 'submission-1')
+        
+        delivery.refresh_from_db()
+        self.assertEqual(delivery.idempotency_key, 'submission-1')
+        self.assertEqual(delivery.payload['idempotency_key'], 'submission-1')
+        self.assertEqual(self.redis.lrange(QUEUE_KEY, 0, -1), [str(delivery.id).encode()])
     
-    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
-    def test_rate_limiting(self):
-        """Test webhook rate limiting"""
-        from webhooks.tasks import check_rate_limit, RATE_LIMIT_MAX_REQUESTS
-        from django.core.cache import cache
+    def test_duplicate_key_is_rejected_by_the_index(self):
+        """Test a key Redis does not know yet is caught by the unique index"""
+        queue_webhook(self.webhook, 'submission.created', {}, 'submission-1')
         
-        # Clear cache
-        cache.clear()
+        self.assertIsNone(queue_webhook(self.webhook, 'submission.created', {}, 'submission-1'))
+        self.assertEqual(Delivery.objects.filter(webhook=self.webhook).count(), 1)
+        # Later duplicates stop at Redis
+        with self.assertNumQueries(0):
+            self.assertIsNone(queue_webhook(self.webhook, 'submission.created', {}, 'submission-1'))
+    
+    def test_committed_key_is_rejected_without_queries(self):
+        """Test repeated fan-outs are answered from Redis"""
+        with self.captureOnCommitCallbacks(execute=True):
+            queue_webhook(self.webhook, 'submission.created', {}, 'submission-1')
+        
+        with self.assertNumQueries(0):
+            self.assertIsNone(queue_webhook(self.webhook, 'submission.created', {}, 'submission-1'))
+    
+    def test_keys_are_scoped_per_webhook(self):
+        """Test the same key reaches each webhook once"""
+        other = Webhook.objects.create(organization=self.org, url='https://example.com/other', secret='s')
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            queue_webhook(self.webhook, 'submission.created', {}, 'submission-1')
         
-        # Should allow up to limit
-        for i in range(RATE_LIMIT_MAX_REQUESTS):
-            self.assertTrue(check_rate_limit(self.webhook))
+        self.assertIsNotNone(queue_webhook(other, 'submission.created', {}, 'submission-1'))
+        self.assertIsNotNone(queue_webhook(self.webhook, 'submission.created', {}))
+        self.assertIsNotNone(queue_webhook(self.webhook, 'submission.created', {}))
+
+
+class WebhookSubscriptionIndexTestCase(TestCase):
+    """Webhook changes invalidate the worker's cached subscription index"""
+    
+    def setUp(self):
+        self.org = Organization.objects.create(
+            name='Test Org',
+            slug='test-org'
+        )
+    
+    def test_create_update_and_delete_invalidate_after_commit(self):
+        with patch('webhooks.subscriptions._invalidate') as mock_invalidate:
+            with self.captureOnCommitCallbacks(execute=True):
+                webhook = Webhook.objects.create(
+                    organization=self.org,
+                    url='https://example.com/webhook',
+                    secret='test-secret-key'
+                )
+            with self.captureOnCommitCallbacks(execute=True):
+                webhook.events = ['submission.created']
+                webhook.save()
+            with self.captureOnCommitCallbacks(execute=True):
+                webhook.delete()
+        
+        self.assertEqual(
+            [call.args for call in mock_invalidate.call_args_list],
+            [(str(self.org.id),)] * 3
+        )
+    
+    def test_delivery_stats_do_not_invalidate(self):
+        webhook = Webhook.objects.create(
+            organization=self.org,
+            url='https://example.com/webhook',
+            secret='test-secret-key'
+        )
         
-        # Should block after limit
-        self.assertFalse(check_rate_limit(self.webhook))
+        with patch('webhooks.subscriptions._invalidate') as mock_invalidate:
+            with self.captureOnCommitCallbacks(execute=True):
+                webhook.total_deliveries += 1
+                webhook.successful_deliveries += 1
+                webhook.save(update_fields=['total_deliveries', 'successful_deliveries'])
         
-        # Clear cache and verify it works again
-        cache.clear()
-        self.assertTrue(check_rate_limit(self.webhook))
\ No newline at end of file
+        mock_invalidate.assert_not_called()
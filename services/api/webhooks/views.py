@@ -18,6 +18,7 @@ from .serializers import (
 )
 from .tasks import test_webhook_delivery, retry_webhook_delivery, bulk_redrive_dlq
 from .filters import DeliveryFilter
+from .stats import latency_percentiles, merged_counts, success_rate
 import secrets
 
 
@@ -76,17 +77,18 @@ class WebhookViewSet(viewsets.ModelViewSet):
         last_24h = timezone.now() - timedelta(hours=24)
         deliveries_24h = webhook.deliveries.filter(created_at__gte=last_24h)
         
+        counts = merged_counts(webhook)
+        
         stats = {
-            "total_deliveries": webhook.total_deliveries,
-            "successful_deliveries": webhook.successful_deliveries,
-            "failed_deliveries": webhook.failed_deliveries,
-            "success_rate": webhook.success_rate,
+            **counts,
+            "success_rate": success_rate(counts, empty=0),
             "deliveries_24h": deliveries_24h.count(),
             "success_24h": deliveries_24h.filter(status='success').count(),
             "failed_24h": deliveries_24h.filter(status='failed').count(),
             "avg_response_time_ms": deliveries_24h.filter(
                 response_time_ms__isnull=False
             ).aggregate(avg=Avg('response_time_ms'))['avg'],
+            "latency_ms": latency_percentiles(webhook.id),
             "pending_retries": webhook.deliveries.filter(
                 status='pending',
                 next_retry_at__isnull=False
@@ -0,0 +1,317 @@
+"""
+Single round trip Redis admission for submissions
+- Token bucket rate limiting with burst, per client IP and form
+- Any number of submissions admitted per script call (batch endpoint)
+- Idempotency lookup and in-progress reservation in the same atomic script
+- Idempotency keys hashed into bucketed Redis hashes, one hash per bucket
+  and TTL window, so small hashes stay in Redis' compact listpack encoding
+"""
+
+import asyncio
+import hashlib
+import time
+from typing import Any, List, NamedTuple, Optional
+
+import redis.asyncio as redis
+import structlog
+
+logger = structlog.get_logger()
+
+# Reservation values are "~<submission_id>:<deadline_ms>" while the submission
+# is being queued and the bare submission id once it has been accepted.
+# Admits any number of submissions in order; for item i:
+# KEYS[3i-2] rate limit bucket, KEYS[3i-1]/KEYS[3i] current/previous window
+# idempotency buckets ("" when the submission has no idempotency key),
+# ARGV[3i+1] submission id to reserve, ARGV[3i+2] current bucket expiry
+# (unix ms), ARGV[3i+3] idempotency field.
+# ARGV[1] refill rate (tokens/second), ARGV[2] burst capacity,
+# ARGV[3] in-progress reservation TTL (ms)
+# Returns {allowed, existing_submission_id, retry_after_ms, in_progress} per item, flattened
+ADMISSION_SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) * 1000 + math.floor(tonumber(now_parts[2]) / 1000)
+local rate = tonumber(ARGV[1]) / 1000
+local capacity = tonumber(ARGV[2])
+local pending_ttl = tonumber(ARGV[3])
+
+local function admit(rate_key, current, previous, submission_id, expire_at, field)
+    if field ~= '' then
+        for _, idempotency_bucket in ipairs({current, previous}) do
+            local existing = redis.call('HGET', idempotency_bucket, field)
+            if existing then
+                if string.sub(existing, 1, 1) ~= '~' then
+                    return {1, existing, 0, 0}
+                end
+                local sep = string.find(existing, ':', 2, true)
+                if tonumber(string.sub(existing, sep + 1)) > now then
+                    return {1, string.sub(existing, 2, sep - 1), 0, 1}
+                end
+                -- Abandoned reservation (the owner died before queueing)
+                redis.call('HDEL', idempotency_bucket, field)
+            end
+        end
+    end
+
+    local bucket = redis.call('HMGET', rate_key, 'tokens', 'ts')
+    local tokens = tonumber(bucket[1])
+    local last = tonumber(bucket[2])
+    if tokens == nil or last == nil then
+        tokens = capacity
+        last = now
+    end
+    tokens = math.min(capacity, tokens + math.max(0, now - last) * rate)
+
+    if tokens < 1 then
+        return {0, false, math.ceil((1 - tokens) / rate), 0}
+    end
+
+    redis.call('HSET', rate_key, 'tokens', tostring(tokens - 1), 'ts', tostring(now))
+    redis.call('PEXPIRE', rate_key, math.ceil(capacity / rate))
+
+    if field ~= '' then
+        redis.call('HSET', current, field, '~' .. submission_id .. ':' .. (now + pending_ttl))
+        redis.call('PEXPIREAT', current, expire_at)
+    end
+
+    return {1, false, 0, 0}
+end
+
+local results = {}
+for i = 1, #KEYS / 3 do
+    local result = admit(KEYS[3 * i - 2], KEYS[3 * i - 1], KEYS[3 * i], ARGV[3 * i + 1], ARGV[3 * i + 2], ARGV[3 * i + 3])
+    for j = 1, 4 do
+        results[#results + 1] = result[j]
+    end
+end
+return results
+"""
+
+# For item i: KEYS[2i-1]/KEYS[2i] current/previous window buckets,
+# ARGV[2i-1] field, ARGV[2i] submission id
+# Only touches in-progress reservations we still own; returns how many matched
+_OWNED_RESERVATIONS = """
+local matched = 0
+for i = 1, #ARGV / 2 do
+    local field = ARGV[2 * i - 1]
+    local submission_id = ARGV[2 * i]
+    local prefix = '~' .. submission_id .. ':'
+    for _, key in ipairs({KEYS[2 * i - 1], KEYS[2 * i]}) do
+        local value = redis.call('HGET', key, field)
+        if value and string.sub(value, 1, #prefix) == prefix then
+            %s
+            matched = matched + 1
+            break
+        end
+    end
+end
+return matched
+"""
+COMMIT_SCRIPT = _OWNED_RESERVATIONS % "redis.call('HSET', key, field, submission_id)"
+RELEASE_SCRIPT = _OWNED_RESERVATIONS % "redis.call('HDEL', key, field)"
+
+# How often a duplicate re-checks a reservation that is still in progress
+IDEMPOTENCY_POLL_SECONDS = 0.05
+
+
+class AdmissionResult(NamedTuple):
+    allowed: bool
+    existing_submission_id: Optional[str] = None
+    retry_after_ms: int = 0
+    # existing_submission_id is still being queued by another request
+    in_progress: bool = False
+
+
+class AdmissionItem(NamedTuple):
+    form_id: str
+    submission_id: str
+    idempotency: Optional[str] = None
+
+
+class IdempotencySlot(NamedTuple):
+    current_bucket: str
+    previous_bucket: str
+    field: bytes
+    expire_at_ms: int
+
+
+def rate_limit_key(client_ip: str, form_id: str) -> str:
+    return f"rate_limit:{client_ip}:{form_id}"
+
+
+def idempotency_slot(
+    form_id: str,
+    key: str,
+    buckets: int,
+    window_seconds: int,
+    now: Optional[float] = None,
+) -> IdempotencySlot:
+    """
+    Locate an idempotency key: sha256(form_id:key) picks one of `buckets`
+    hashes and the next 8 digest bytes are the field. Hashes are also split
+    by TTL window and expire at the end of the following window, so a key
+    is remembered for between one and two windows.
+    """
+    digest = hashlib.sha256(f"{form_id}:{key}".encode("utf-8")).digest()
+    bucket = int.from_bytes(digest[:4], "big") % buckets
+    window = int((time.time() if now is None else now) // window_seconds)
+    return IdempotencySlot(
+        current_bucket=f"idem:{window}:{bucket}",
+        previous_bucket=f"idem:{window - 1}:{bucket}",
+        field=digest[4:12],
+        expire_at_ms=(window + 2) * window_seconds * 1000,
+    )
+
+
+class AdmissionPipeline:
+    """Rate limit + idempotency check in one Redis round trip"""
+
+    def __init__(
+        self,
+        rate_limit_per_minute: int,
+        rate_limit_burst: int,
+        idempotency_ttl_seconds: int = 86400,
+        idempotency_buckets: int = 131072,
+        idempotency_pending_ttl_ms: int = 30000,
+        idempotency_wait_ms: int = 2000,
+    ):
+        # The script divides by the refill rate
+        if rate_limit_per_minute <= 0:
+            raise ValueError(f"rate_limit_per_minute must be positive, got {rate_limit_per_minute}")
+        self.refill_per_second = rate_limit_per_minute / 60
+        self.burst = max(1, rate_limit_burst)
+        self.idempotency_ttl = idempotency_ttl_seconds
+        self.idempotency_buckets = max(1, idempotency_buckets)
+        self.pending_ttl_ms = idempotency_pending_ttl_ms
+        self.wait_seconds = idempotency_wait_ms / 1000
+        self._scripts = {}
+
+    def _script(self, redis_client: redis.Redis, source: str):
+        # EVALSHA after the first call, reloading on NOSCRIPT
+        script = self._scripts.get(source)
+        if script is None:
+            script = self._scripts[source] = redis_client.register_script(source)
+        return script
+
+    def _slot(self, form_id: str, idempotency: Optional[str]) -> Optional[IdempotencySlot]:
+        if not idempotency:
+            return None
+        return idempotency_slot(form_id, idempotency, self.idempotency_buckets, self.idempotency_ttl)
+
+    async def _admit(
+        self,
+        redis_client: redis.Redis,
+        client_ip: str,
+        items: List[AdmissionItem],
+        slots: List[Optional[IdempotencySlot]],
+    ) -> List[AdmissionResult]:
+        keys: List[str] = []
+        args: List[Any] = [self.refill_per_second, self.burst, self.pending_ttl_ms]
+        for item, slot in zip(items, slots):
+            keys.append(rate_limit_key(client_ip, item.form_id))
+            if slot:
+                keys += [slot.current_bucket, slot.previous_bucket]
+                args += [item.submission_id, slot.expire_at_ms, slot.field]
+            else:
+                keys += ["", ""]
+                args += [item.submission_id, 0, b""]
+
+        flat = await self._script(redis_client, ADMISSION_SCRIPT)(keys=keys, args=args, client=redis_client)
+        return [
+            AdmissionResult(
+                allowed=bool(allowed),
+                existing_submission_id=existing,
+                retry_after_ms=int(retry_after_ms),
+                in_progress=bool(in_progress),
+            )
+            for allowed, existing, retry_after_ms, in_progress in zip(*[iter(flat)] * 4)
+        ]
+
+    async def admit(
+        self,
+        redis_client: redis.Redis,
+        client_ip: str,
+        form_id: str,
+        submission_id: str,
+        idempotency: Optional[str] = None,
+    ) -> AdmissionResult:
+        """
+        Take a token for (client_ip, form_id) and reserve the idempotency key
+        for submission_id as in progress. A known idempotency key
+        short-circuits the rate limiter and returns the submission it was
+        reserved for; while that submission is still in progress, wait up to
+        idempotency_wait_ms for it to be committed or released. A result with
+        in_progress set means the wait timed out.
+        """
+        items = [AdmissionItem(form_id, submission_id, idempotency)]
+        slots = [self._slot(form_id, idempotency)]
+        [result] = await self._admit(redis_client, client_ip, items, slots)
+        deadline = time.monotonic() + self.wait_seconds
+        while result.in_progress and time.monotonic() < deadline:
+            await asyncio.sleep(IDEMPOTENCY_POLL_SECONDS)
+            # Either returns the committed submission or, if the owner released
+            # the key, reserves it for this request
+            [result] = await self._admit(redis_client, client_ip, items, slots)
+        return result
+
+    async def admit_many(
+        self,
+        redis_client: redis.Redis,
+        client_ip: str,
+        items: List[AdmissionItem],
+    ) -> List[AdmissionResult]:
+        """
+        Admit several submissions from one client in a single round trip, in
+        order, with the same per-item semantics as admit(). Duplicates of
+        in-progress submissions are reported as in_progress without waiting.
+        """
+        if not items:
+            return []
+        slots = [self._slot(item.form_id, item.idempotency) for item in items]
+        return await self._admit(redis_client, client_ip, items, slots)
+
+    async def _resolve(self, redis_client: redis.Redis, source: str, items: List[AdmissionItem]) -> int:
+        keys: List[str] = []
+        args: List[Any] = []
+        for item in items:
+            slot = self._slot(item.form_id, item.idempotency)
+            if slot:
+                keys += [slot.current_bucket, slot.previous_bucket]
+                args += [slot.field, item.submission_id]
+        if not keys:
+            return 0
+        return int(await self._script(redis_client, source)(keys=keys, args=args, client=redis_client))
+
+    async def commit_many(self, redis_client: redis.Redis, items: List[AdmissionItem]):
+        """Mark reservations as accepted so duplicates get their submission ids back"""
+        try:
+            await self._resolve(redis_client, COMMIT_SCRIPT, items)
+        except Exception as e:
+            # The reservations lapse after idempotency_pending_ttl_ms
+            logger.error("Failed to commit idempotency reservations", count=len(items), error=str(e))
+
+    async def release_many(self, redis_client: redis.Redis, items: List[AdmissionItem]):
+        """Drop idempotency reservations for submissions that were not accepted"""
+        try:
+            await self._resolve(redis_client, RELEASE_SCRIPT, items)
+        except Exception as e:
+            logger.error("Failed to release idempotency reservations", count=len(items), error=str(e))
+
+    async def commit(
+        self,
+        redis_client: redis.Redis,
+        form_id: str,
+        submission_id: str,
+        idempotency: Optional[str],
+    ):
+        """Mark a reservation as accepted so duplicates get submission_id back"""
+        await self.commit_many(redis_client, [AdmissionItem(form_id, submission_id, idempotency)])
+
+    async def release(
+        self,
+        redis_client: redis.Redis,
+        form_id: str,
+        submission_id: str,
+        idempotency: Optional[str],
+    ):
+        """Drop an idempotency reservation for a submission that was not accepted"""
+        await self.release_many(redis_client, [AdmissionItem(form_id, submission_id, idempotency)])
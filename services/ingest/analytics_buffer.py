@@ -0,0 +1,210 @@
+"""
+Worker-side analytics event buffer
+- Events from every task in the process are coalesced into POST /events/batch
+- Flushed when max_events are waiting or the oldest is max_age_ms old, and on
+  worker shutdown
+- Batches that cannot be delivered are spilled to a Redis list and replayed
+  once the analytics service answers again; a batch the service keeps failing
+  with 5xx is dropped after retry_max_attempts so it cannot block the rest
+"""
+
+import json
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+import structlog
+from prometheus_client import Counter
+
+logger = structlog.get_logger()
+
+# Metrics
+analytics_events_counter = Counter(
+    'worker_analytics_events_total',
+    'Analytics events by outcome (sent, spilled, replayed, dropped)',
+    ['outcome']
+)
+analytics_flush_counter = Counter('worker_analytics_flushes_total', 'Analytics batch flushes', ['reason'])
+
+# Batches that failed to send, oldest first ({"attempts": n, "events": [...]};
+# plain JSON arrays from before attempts were counted)
+RETRY_LIST_KEY = "analytics:retry"
+
+
+class AnalyticsUnavailable(Exception):
+    """The analytics service could not take the batch right now"""
+
+    def __init__(self, message: str, failed_batch: bool = False):
+        super().__init__(message)
+        # The service answered with a server error for this batch; unreachable
+        # or throttling (429) says nothing about the batch and is not counted
+        self.failed_batch = failed_batch
+
+
+class AnalyticsBuffer:
+    """Thread-safe per-process buffer; sends with a caller-provided POST function"""
+
+    def __init__(
+        self,
+        post: Callable[..., httpx.Response],
+        batch_url: str,
+        headers: Optional[Dict[str, str]] = None,
+        redis_client=None,
+        max_events: int = 500,
+        max_age_ms: int = 1000,
+        retry_list_max_batches: int = 10000,
+        retry_drain_batches: int = 10,
+        retry_backoff_seconds: float = 5.0,
+        retry_max_attempts: int = 10,
+    ):
+        self.post = post
+        self.batch_url = batch_url
+        self.headers = headers or {}
+        self.redis = redis_client
+        self.max_events = max_events
+        self.max_age = max_age_ms / 1000
+        self.retry_list_max_batches = retry_list_max_batches
+        self.retry_drain_batches = retry_drain_batches
+        self.retry_backoff = retry_backoff_seconds
+        self.retry_max_attempts = retry_max_attempts
+
+        self._events: List[Dict[str, Any]] = []
+        self._oldest: Optional[float] = None
+        self._lock = threading.Lock()
+        # Serializes sends so shutdown does not race the flusher thread
+        self._send_lock = threading.Lock()
+        self._retry_after = 0.0
+        self._stop = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+
+    def add(self, event: Dict[str, Any]):
+        with self._lock:
+            if not self._events:
+                self._oldest = time.monotonic()
+            self._events.append(event)
+            full = len(self._events) >= self.max_events
+        if full:
+            self.flush("count")
+
+    def _take(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            events, self._events = self._events, []
+            self._oldest = None
+        return events
+
+    def flush(self, reason: str = "age"):
+        events = self._take()
+        if not events:
+            return
+        analytics_flush_counter.labels(reason=reason).inc()
+        with self._send_lock:
+            try:
+                self._send(events)
+                analytics_events_counter.labels(outcome="sent").inc(len(events))
+            except AnalyticsUnavailable as e:
+                self._retry_after = time.monotonic() + self.retry_backoff
+                self._spill(events, str(e), attempts=int(e.failed_batch))
+
+    def _send(self, events: List[Dict[str, Any]]):
+        try:
+            response = self.post(self.batch_url, json=events, headers=self.headers)
+        except httpx.HTTPError as e:
+            raise AnalyticsUnavailable(str(e))
+        if response.status_code == 429:
+            raise AnalyticsUnavailable("HTTP 429")
+        if response.status_code >= 500:
+            raise AnalyticsUnavailable(f"HTTP {response.status_code}", failed_batch=True)
+        if response.status_code >= 400:
+            # The batch itself is rejected; resending it would fail forever
+            analytics_events_counter.labels(outcome="dropped").inc(len(events))
+            logger.error(
+                "Analytics rejected event batch",
+                status_code=response.status_code,
+                events=len(events),
+                body=response.text[:500]
+            )
+
+    @staticmethod
+    def _entry(events: List[Dict[str, Any]], attempts: int) -> str:
+        return json.dumps({"attempts": attempts, "events": events}, separators=(",", ":"), default=str)
+
+    def _spill(self, events: List[Dict[str, Any]], error: str, attempts: int = 0):
+        if self.redis is None:
+            analytics_events_counter.labels(outcome="dropped").inc(len(events))
+            logger.error("Analytics unavailable, dropping events", events=len(events), error=error)
+            return
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.rpush(RETRY_LIST_KEY, self._entry(events, attempts))
+            # Bounded: the oldest batches go first if the outage outlasts it
+            pipe.ltrim(RETRY_LIST_KEY, -self.retry_list_max_batches, -1)
+            pipe.execute()
+            analytics_events_counter.labels(outcome="spilled").inc(len(events))
+            logger.warning("Analytics unavailable, events spilled to Redis", events=len(events), error=error)
+        except Exception as e:
+            analytics_events_counter.labels(outcome="dropped").inc(len(events))
+            logger.error("Failed to spill analytics events", events=len(events), error=str(e))
+
+    def replay_spilled(self) -> int:
+        """Resend up to retry_drain_batches spilled batches; returns events sent"""
+        if self.redis is None or time.monotonic() < self._retry_after:
+            return 0
+        sent = 0
+        with self._send_lock:
+            for _ in range(self.retry_drain_batches):
+                raw = self.redis.lpop(RETRY_LIST_KEY)
+                if raw is None:
+                    break
+                entry = json.loads(raw)
+                if isinstance(entry, list):
+                    entry = {"attempts": 0, "events": entry}
+                events = entry["events"]
+                try:
+                    self._send(events)
+                except AnalyticsUnavailable as e:
+                    self._retry_after = time.monotonic() + self.retry_backoff
+                    attempts = entry["attempts"] + int(e.failed_batch)
+                    if attempts >= self.retry_max_attempts:
+                        analytics_events_counter.labels(outcome="dropped").inc(len(events))
+                        logger.error(
+                            "Analytics keeps failing spilled batch, dropping it",
+                            events=len(events),
+                            attempts=attempts,
+                            error=str(e)
+                        )
+                        break
+                    # Still down: put it back at the head, keep the order
+                    self.redis.lpush(RETRY_LIST_KEY, self._entry(events, attempts))
+                    break
+                analytics_events_counter.labels(outcome="replayed").inc(len(events))
+                sent += len(events)
+        return sent
+
+    # Background flushing
+    def due(self) -> bool:
+        oldest = self._oldest
+        return oldest is not None and time.monotonic() - oldest >= self.max_age
+
+    def start(self):
+        self._stop.clear()
+        self._flusher = threading.Thread(target=self._run, name="analytics-flusher", daemon=True)
+        self._flusher.start()
+
+    def close(self):
+        """Stop the flusher and send whatever is still buffered"""
+        self._stop.set()
+        if self._flusher is not None:
+            self._flusher.join(timeout=5)
+            self._flusher = None
+        self.flush("shutdown")
+
+    def _run(self):
+        interval = min(self.max_age, 1.0) / 2
+        while not self._stop.wait(interval):
+            try:
+                if self.due():
+                    self.flush("age")
+                self.replay_spilled()
+            except Exception as e:
+                logger.error("Analytics flusher failed", error=str(e))
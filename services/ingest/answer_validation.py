@@ -0,0 +1,355 @@
+"""
+Compiled answer validators for published form versions
+- FormVersion.schema compiled once into per-block rules, cached by (form_id, version)
+- One pass over the answers: block ids, value types, size limits, required blocks
+- Lenient by design: unknown block types only get size checks, and required
+  blocks are not enforced where logic rules can hide or skip them
+- BlockTypeCache gives the worker the same per-version block type map, so
+  answers are stored with their block's type
+"""
+
+import asyncio
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+import structlog
+from prometheus_client import Counter, Gauge
+from sqlalchemy import create_engine, text
+
+logger = structlog.get_logger()
+
+# Metrics
+validator_lookup_counter = Counter('answer_validator_lookups_total', 'Compiled answer validator lookups', ['result'])
+validator_size_gauge = Gauge('answer_validator_entries', 'Compiled answer validators held in memory')
+answer_rejection_counter = Counter('answer_validation_rejections_total', 'Submissions rejected by answer validation')
+
+FORM_VERSION_SCHEMA_QUERY = """
+    SELECT schema FROM forms_formversion
+    WHERE form_id = :form_id AND version = :version
+"""
+
+# Default size limits when a block does not set its own
+MAX_TEXT_LENGTH = 4096
+MAX_LONG_TEXT_LENGTH = 65536
+MAX_LIST_ITEMS = 1000
+# Errors reported back to the client per submission
+MAX_REPORTED_ERRORS = 10
+# Answer.type for blocks the schema does not describe (as the API does)
+DEFAULT_ANSWER_TYPE = "text"
+
+EMAIL_PATTERN = re.compile(r"^[^@\s]+@[^@\s]+$")
+
+STRING_TYPES = {"text", "short_text", "email", "phone", "date", "time"}
+CHOICE_TYPES = {"dropdown", "select", "single_select"}
+LONG_STRING_TYPES = {"long_text"}
+NUMBER_TYPES = {"number", "rating", "scale"}
+# Answered with a score, or {score, feedback} when the block asks for a reason
+NPS_TYPES = {"nps"}
+BOOLEAN_TYPES = {"checkbox", "yes_no"}
+LIST_TYPES = {"checkboxGroup", "multi_select", "ranking"}
+# Logic actions that can leave a required block unanswered
+SKIPPING_ACTIONS = {"hide", "skip", "jump"}
+
+
+def _is_empty(value: Any) -> bool:
+    return value is None or value == "" or value == [] or value == {}
+
+
+def _is_number(value: Any) -> bool:
+    if isinstance(value, bool):
+        return False
+    if isinstance(value, (int, float)):
+        return True
+    # HTML number inputs may post the raw string
+    if isinstance(value, str):
+        try:
+            float(value)
+            return True
+        except ValueError:
+            return False
+    return False
+
+
+class BlockRule(NamedTuple):
+    block_type: str
+    required: bool
+    # Returns an error message, or None when the value is acceptable
+    check: Callable[[Any], Optional[str]]
+
+
+def _limit(block: Dict[str, Any], key: str, default: int) -> int:
+    properties = block.get("properties") or {}
+    value = properties.get(key, block.get(key))
+    if isinstance(value, int) and not isinstance(value, bool) and value > 0:
+        return value
+    for rule in block.get("validation") or []:
+        if isinstance(rule, dict) and rule.get("type") == "max" and isinstance(rule.get("value"), int):
+            return rule["value"]
+    return default
+
+
+def _compile_check(block: Dict[str, Any]) -> Callable[[Any], Optional[str]]:
+    block_type = block.get("type")
+    properties = block.get("properties") or {}
+
+    if block_type in CHOICE_TYPES:
+        # Choice blocks answer with a list when multiple selection is on
+        multiple = properties.get("allowMultiple") or properties.get("multiple") or block.get("multiple")
+        block_type = "multi_select" if multiple else "single_select"
+
+    if block_type in STRING_TYPES or block_type in LONG_STRING_TYPES or block_type == "single_select":
+        default = MAX_LONG_TEXT_LENGTH if block_type in LONG_STRING_TYPES else MAX_TEXT_LENGTH
+        max_length = _limit(block, "maxLength", default)
+        is_email = block_type == "email"
+
+        def check_string(value):
+            if not isinstance(value, str):
+                return "expected a string"
+            if len(value) > max_length:
+                return f"longer than {max_length} characters"
+            if is_email and value and not EMAIL_PATTERN.match(value):
+                return "not a valid email address"
+            return None
+        return check_string
+
+    if block_type in NUMBER_TYPES:
+        def check_number(value):
+            return None if _is_number(value) else "expected a number"
+        return check_number
+
+    if block_type in NPS_TYPES:
+        def check_nps(value):
+            if isinstance(value, dict):
+                if not _is_number(value.get("score")):
+                    return "expected a numeric score"
+                feedback = value.get("feedback")
+                if feedback is not None and not isinstance(feedback, str):
+                    return "expected feedback as a string"
+                if feedback and len(feedback) > MAX_LONG_TEXT_LENGTH:
+                    return f"feedback longer than {MAX_LONG_TEXT_LENGTH} characters"
+                return None
+            return None if _is_number(value) else "expected a number or {score, feedback}"
+        return check_nps
+
+    if block_type in BOOLEAN_TYPES:
+        def check_boolean(value):
+            return None if isinstance(value, bool) else "expected true or false"
+        return check_boolean
+
+    if block_type in LIST_TYPES:
+        max_items = _limit(block, "maxSelections", MAX_LIST_ITEMS)
+
+        def check_list(value):
+            if not isinstance(value, list):
+                return "expected a list"
+            if len(value) > max_items:
+                return f"more than {max_items} items"
+            return None
+        return check_list
+
+    # Structured and unknown blocks (address, matrix, file_upload, payment, ...)
+    def check_any(value):
+        if isinstance(value, str) and len(value) > MAX_LONG_TEXT_LENGTH:
+            return f"longer than {MAX_LONG_TEXT_LENGTH} characters"
+        if isinstance(value, (list, dict)) and len(value) > MAX_LIST_ITEMS:
+            return f"more than {MAX_LIST_ITEMS} items"
+        return None
+    return check_any
+
+
+def iter_blocks(schema: Any) -> Iterator[Dict[str, Any]]:
+    """Blocks from either the flat {"blocks": [...]} or the paged schema layout"""
+    if not isinstance(schema, dict):
+        return
+    containers = [schema] + [page for page in schema.get("pages") or [] if isinstance(page, dict)]
+    for container in containers:
+        for block in container.get("blocks") or []:
+            if isinstance(block, dict) and block.get("id"):
+                yield block
+
+
+def block_types(schema: Any) -> Dict[str, str]:
+    """Map of block id to the block's schema type"""
+    return {
+        str(block["id"]): str(block.get("type") or DEFAULT_ANSWER_TYPE)
+        for block in iter_blocks(schema)
+    }
+
+
+class AnswerValidator:
+    """Validator compiled from one form version's schema"""
+
+    def __init__(self, rules: Dict[str, BlockRule], enforce_required: bool = True):
+        self.rules = rules
+        self.required = frozenset(
+            block_id for block_id, rule in rules.items() if rule.required and enforce_required
+        )
+
+    def validate(self, answers: Dict[str, Any], partial: bool = False) -> List[str]:
+        """Return up to MAX_REPORTED_ERRORS "block_id: problem" messages; empty when valid"""
+        # Versions without blocks (drafts, imported forms) accept anything
+        if not self.rules:
+            return []
+
+        errors: List[str] = []
+        required_answered = 0
+        for block_id, value in answers.items():
+            rule = self.rules.get(block_id)
+            if rule is None:
+                errors.append(f"{block_id}: unknown block")
+            elif _is_empty(value):
+                continue
+            else:
+                error = rule.check(value)
+                if error:
+                    errors.append(f"{block_id}: {error}")
+                elif rule.required:
+                    required_answered += 1
+            if len(errors) >= MAX_REPORTED_ERRORS:
+                return errors
+
+        # Partial saves are allowed to miss required blocks
+        if not partial and required_answered < len(self.required):
+            answered = {block_id for block_id, value in answers.items() if not _is_empty(value)}
+            for block_id in sorted(self.required - answered):
+                errors.append(f"{block_id}: required")
+        return errors[:MAX_REPORTED_ERRORS]
+
+
+def compile_schema(schema: Any) -> AnswerValidator:
+    """Compile a FormVersion.schema into an AnswerValidator"""
+    rules: Dict[str, BlockRule] = {}
+    for block in iter_blocks(schema):
+        block_type = str(block.get("type") or "")
+        rules[str(block["id"])] = BlockRule(
+            block_type=block_type,
+            required=bool(block.get("required")),
+            check=_compile_check(block),
+        )
+
+    logic = schema.get("logic") if isinstance(schema, dict) else None
+    skippable = any(
+        isinstance(action, dict) and action.get("type") in SKIPPING_ACTIONS
+        for rule in logic or [] if isinstance(rule, dict)
+        for action in rule.get("actions") or []
+    )
+    # With hide/skip/jump logic any required block may legitimately be unanswered
+    return AnswerValidator(rules, enforce_required=not skippable)
+
+
+class ValidatorCache:
+    """Compiled validators keyed by (form_id, version), loaded from Postgres on a miss"""
+
+    def __init__(self, database_url: str, max_entries: int = 10000, ttl_seconds: int = 3600):
+        self.database_url = database_url
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+
+        # (form_id, version) -> (expires_at, validator or None for "no such version")
+        self._entries: "OrderedDict[Tuple[str, int], Tuple[float, Optional[AnswerValidator]]]" = OrderedDict()
+        self._inflight: Dict[Tuple[str, int], "asyncio.Future[Optional[AnswerValidator]]"] = {}
+        self._engine = None
+
+    def _set(self, key: Tuple[str, int], validator: Optional[AnswerValidator]):
+        self._entries[key] = (time.monotonic() + self.ttl, validator)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        validator_size_gauge.set(len(self._entries))
+
+    def invalidate(self, form_id: Optional[str] = None):
+        """Drop every version of one form, or everything when form_id is None"""
+        if form_id is None:
+            self._entries.clear()
+        else:
+            for key in [key for key in self._entries if key[0] == form_id]:
+                del self._entries[key]
+        validator_size_gauge.set(len(self._entries))
+
+    async def get(self, form_id: str, version: int) -> Optional[AnswerValidator]:
+        """
+        Return the compiled validator, or None when the version does not exist.
+        Raises if the database cannot be reached on a miss.
+        """
+        key = (form_id, version)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] >= time.monotonic():
+            self._entries.move_to_end(key)
+            validator_lookup_counter.labels(result="hit").inc()
+            return entry[1]
+
+        validator_lookup_counter.labels(result="miss").inc()
+
+        # Coalesce concurrent misses for the same version into one query
+        pending = self._inflight.get(key)
+        if pending is not None:
+            return await pending
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._inflight[key] = future
+        try:
+            validator = await loop.run_in_executor(None, self._load, form_id, version)
+            self._set(key, validator)
+            future.set_result(validator)
+            return validator
+        except Exception as e:
+            future.set_exception(e)
+            # Nobody else may be awaiting; avoid "exception never retrieved"
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    # Database access (runs in the default executor)
+    def _get_engine(self):
+        if self._engine is None:
+            self._engine = create_engine(self.database_url, pool_size=2, max_overflow=2, pool_pre_ping=True)
+        return self._engine
+
+    def _load(self, form_id: str, version: int) -> Optional[AnswerValidator]:
+        with self._get_engine().connect() as conn:
+            row = conn.execute(
+                text(FORM_VERSION_SCHEMA_QUERY),
+                {"form_id": form_id, "version": version}
+            ).fetchone()
+        if row is None:
+            return None
+        return compile_schema(row[0])
+
+
+class BlockTypeCache:
+    """
+    Block id -> type maps keyed by (form_id, version) for the sync worker.
+    Misses are loaded on the caller's session, so they join its transaction.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl_seconds: int = 3600, negative_ttl_seconds: int = 60):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self.negative_ttl = negative_ttl_seconds
+
+        self._entries: "OrderedDict[Tuple[str, int], Tuple[float, Dict[str, str]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, db, form_id: str, version: int) -> Dict[str, str]:
+        key = (str(form_id), int(version))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] >= time.monotonic():
+                self._entries.move_to_end(key)
+                return entry[1]
+
+        row = db.execute(text(FORM_VERSION_SCHEMA_QUERY), {"form_id": key[0], "version": key[1]}).fetchone()
+        types = block_types(row[0]) if row else {}
+        # An unknown version may still be created; do not pin its emptiness
+        ttl = self.ttl if row else self.negative_ttl
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, types)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return types
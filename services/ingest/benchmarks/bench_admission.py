@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Benchmark: per-request Redis admission latency
+- legacy: rate limit get/setex/incr + idempotency get + setex (sequential calls)
+- script: EVALSHA doing token bucket + idempotency reservation, then the
+  EVALSHA committing the reservation after publish, as submit_form does
+
+Usage:
+    python benchmarks/bench_admission.py --redis-url redis://localhost:6379/15
+    python benchmarks/bench_admission.py --fake   # fakeredis, no network
+
+fakeredis has no network hop, so with --fake only redis_calls_per_request is
+representative; run against a real Redis for latency numbers.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from uuid import uuid4
+
+import redis.asyncio as redis
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from admission import AdmissionPipeline  # noqa: E402
+
+
+class CountingRedis:
+    """Proxy that counts commands sent to Redis"""
+
+    def __init__(self, client):
+        self._client = client
+        self.calls = 0
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if not callable(attr) or name == "register_script":
+            return attr
+
+        async def wrapper(*args, **kwargs):
+            self.calls += 1
+            return await attr(*args, **kwargs)
+        return wrapper
+
+
+async def legacy_admit(client, client_ip, form_id, submission_id, idempotency, limit_per_minute):
+    """The pre-script call sequence from main.submit_form"""
+    current_minute = int(time.time() // 60)
+    key = f"rate_limit:{client_ip}:{form_id}:{current_minute}"
+    current_count = await client.get(key)
+    if current_count is None:
+        await client.setex(key, 60, 1)
+    elif int(current_count) >= limit_per_minute:
+        return False
+    else:
+        await client.incr(key)
+
+    idem_key = f"idempotency:{form_id}:{idempotency}"
+    if await client.get(idem_key):
+        return True
+    await client.setex(idem_key, 86400, submission_id)
+    return True
+
+
+async def run(client, mode, requests, clients):
+    pipeline = AdmissionPipeline(rate_limit_per_minute=10**9, rate_limit_burst=10**9)
+    counting = CountingRedis(client)
+    latencies = []
+
+    for i in range(requests):
+        client_ip = f"10.0.{(i % clients) // 256}.{(i % clients) % 256}"
+        form_id = "bench-form"
+        submission_id = str(uuid4())
+        idempotency = str(uuid4())
+
+        start = time.perf_counter()
+        if mode == "legacy":
+            await legacy_admit(counting, client_ip, form_id, submission_id, idempotency, 10**9)
+        else:
+            # Through the proxy, so EVALSHA and any NOSCRIPT reload are counted
+            await pipeline.admit(counting, client_ip, form_id, submission_id, idempotency)
+            # submit_form commits the reservation once the submission is published
+            await pipeline.commit(counting, form_id, submission_id, idempotency)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    latencies.sort()
+    return {
+        "mode": mode,
+        "requests": requests,
+        "redis_calls_per_request": counting.calls / requests,
+        "avg_ms": round(statistics.mean(latencies), 4),
+        "p50_ms": round(latencies[int(len(latencies) * 0.50)], 4),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95)], 4),
+        "p99_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))], 4),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--redis-url", default=os.environ.get("REDIS_URL", "redis://localhost:6379/15"))
+    parser.add_argument("--fake", action="store_true", help="Use fakeredis instead of a Redis server")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--clients", type=int, default=500, help="Distinct client IPs")
+    args = parser.parse_args()
+
+    if args.fake:
+        import fakeredis
+        client = fakeredis.FakeAsyncRedis(decode_responses=True)
+    else:
+        client = redis.from_url(args.redis_url, decode_responses=True)
+
+    results = []
+    for mode in ("legacy", "script"):
+        await client.flushdb()
+        results.append(await run(client, mode, args.requests, args.clients))
+    await client.flushdb()
+    await client.aclose()
+
+    print(json.dumps({"benchmark": "admission", "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
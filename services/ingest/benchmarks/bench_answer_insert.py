@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Benchmark: answer rows/sec in the submission worker write path
+- per_row: form SELECT, submission INSERT, one INSERT per answer (the old path)
+- set_based: worker.insert_submission + worker.insert_answers (two statements)
+
+Usage:
+    python benchmarks/bench_answer_insert.py --database-url postgresql://localhost/forms_bench
+    python benchmarks/bench_answer_insert.py --fields 10 200 --submissions 500
+
+Needs a real Postgres. Tables mirroring forms_form, core_submission and
+core_answer are created in a scratch schema (--schema, dropped afterwards),
+so the target database may be shared; round trip cost dominates, so run it
+against a database on another host to see production-like numbers.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from typing import Any, Dict
+from uuid import uuid4
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("HMAC_SECRET", "benchmark-secret")
+
+from worker import insert_answers, insert_submission  # noqa: E402
+
+SCHEMA_SQL = """
+    CREATE TABLE forms_form (
+        id uuid PRIMARY KEY,
+        organization_id uuid NOT NULL,
+        status varchar(20) NOT NULL
+    );
+    CREATE TABLE core_submission (
+        id uuid PRIMARY KEY,
+        form_id uuid NOT NULL REFERENCES forms_form (id),
+        version integer NOT NULL,
+        respondent_key varchar(255) NOT NULL,
+        locale varchar(10) NOT NULL,
+        started_at timestamptz NOT NULL,
+        completed_at timestamptz,
+        metadata_json jsonb
+    );
+    CREATE TABLE core_answer (
+        id uuid PRIMARY KEY,
+        submission_id uuid NOT NULL REFERENCES core_submission (id),
+        block_id varchar(100) NOT NULL,
+        type varchar(50) NOT NULL,
+        value_json jsonb NOT NULL,
+        created_at timestamptz NOT NULL,
+        updated_at timestamptz NOT NULL,
+        UNIQUE (submission_id, block_id)
+    );
+"""
+
+
+def save_per_row(db, submission_data: Dict[str, Any]) -> str:
+    """The write path this benchmark replaced, kept for comparison"""
+    form_id, _ = db.execute(
+        text("SELECT id, organization_id FROM forms_form WHERE id = :form_id AND status = 'published'"),
+        {"form_id": submission_data["form_id"]}
+    ).fetchone()
+    submission_id = db.execute(text("""
+        INSERT INTO core_submission (
+            id, form_id, version, respondent_key, locale,
+            started_at, completed_at, metadata_json
+        ) VALUES (
+            :id, :form_id, :version, :respondent_key, :locale,
+            :started_at, :completed_at, :metadata_json
+        ) RETURNING id
+    """), {
+        "id": submission_data["id"],
+        "form_id": form_id,
+        "version": submission_data["version"],
+        "respondent_key": submission_data["respondent_key"],
+        "locale": submission_data["locale"],
+        "started_at": datetime.utcnow(),
+        "completed_at": datetime.utcnow(),
+        "metadata_json": json.dumps(submission_data["metadata"])
+    }).fetchone()[0]
+    for block_id, value in submission_data["answers"].items():
+        db.execute(text("""
+            INSERT INTO core_answer (
+                id, submission_id, block_id, type, value_json,
+                created_at, updated_at
+            ) VALUES (
+                :id, :submission_id, :block_id, :type, :value_json,
+                :created_at, :updated_at
+            )
+        """), {
+            "id": str(uuid4()),
+            "submission_id": submission_id,
+            "block_id": block_id,
+            "type": "text",
+            "value_json": json.dumps(value),
+            "created_at": datetime.utcnow(),
+            "updated_at": datetime.utcnow()
+        })
+    return submission_id
+
+
+def save_set_based(db, submission_data: Dict[str, Any]) -> str:
+    submission_id = insert_submission(db, submission_data)
+    # The worker resolves types from an in-memory per-version map
+    insert_answers(db, submission_id, submission_data["answers"], {})
+    return submission_id
+
+
+def build_submission(form_id: str, fields: int) -> Dict[str, Any]:
+    return {
+        "id": str(uuid4()),
+        "form_id": form_id,
+        "version": 1,
+        "respondent_key": f"bench-{uuid4()}",
+        "locale": "en",
+        "answers": {f"q{i}": f"answer {i} " + "x" * 20 for i in range(fields)},
+        "metadata": {"partial": False, "submitted_at": datetime.utcnow().isoformat()},
+    }
+
+
+def measure(Session, path: str, form_id: str, fields: int, submissions: int) -> Dict[str, Any]:
+    save = save_per_row if path == "per_row" else save_set_based
+    payloads = [build_submission(form_id, fields) for _ in range(submissions)]
+
+    started = time.perf_counter()
+    for submission_data in payloads:
+        db = Session()
+        try:
+            save(db, submission_data)
+            db.commit()
+        finally:
+            db.close()
+    elapsed = time.perf_counter() - started
+
+    rows = fields * submissions
+    return {
+        "path": path,
+        "fields": fields,
+        "submissions": submissions,
+        "seconds": round(elapsed, 3),
+        "submissions_per_sec": round(submissions / elapsed, 1),
+        "answer_rows_per_sec": round(rows / elapsed, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=os.environ.get("DATABASE_URL", "postgresql://localhost/forms_bench"))
+    parser.add_argument("--schema", default="bench_answer_insert")
+    parser.add_argument("--fields", type=int, nargs="+", default=[10, 200])
+    parser.add_argument("--submissions", type=int, default=500)
+    args = parser.parse_args()
+
+    engine = create_engine(args.database_url, connect_args={"options": f"-csearch_path={args.schema}"})
+    Session = sessionmaker(bind=engine)
+    form_id = str(uuid4())
+
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP SCHEMA IF EXISTS {args.schema} CASCADE"))
+        conn.execute(text(f"CREATE SCHEMA {args.schema}"))
+        conn.execute(text(f"SET search_path TO {args.schema}"))
+        conn.execute(text(SCHEMA_SQL))
+        conn.execute(
+            text("INSERT INTO forms_form (id, organization_id, status) VALUES (:id, :org, 'published')"),
+            {"id": form_id, "org": str(uuid4())}
+        )
+
+    try:
+        results = []
+        for fields in args.fields:
+            for path in ("per_row", "set_based"):
+                results.append(measure(Session, path, form_id, fields, args.submissions))
+    finally:
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP SCHEMA IF EXISTS {args.schema} CASCADE"))
+        engine.dispose()
+
+    speedups = {}
+    for fields in args.fields:
+        per_row, set_based = [r for r in results if r["fields"] == fields]
+        speedups[str(fields)] = round(set_based["answer_rows_per_sec"] / per_row["answer_rows_per_sec"], 2)
+
+    print(json.dumps({
+        "benchmark": "answer_insert",
+        "results": results,
+        "speedup": speedups,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Benchmark: Redis memory per idempotency key
+- strings: one "idempotency:{form_id}:{key}" string per key with its own TTL
+- buckets: keys hashed into bucketed hashes (admission.idempotency_slot)
+
+Usage:
+    python benchmarks/bench_idempotency_memory.py --redis-url redis://localhost:6379/15
+    python benchmarks/bench_idempotency_memory.py --keys 1000000 --buckets 16384
+
+Needs a real Redis (INFO memory); the target database is flushed between
+layouts, so point it at a scratch database. The bucketed layout only pays
+off while hashes stay under hash-max-listpack-entries (128 by default), so
+size --buckets to about keys / 100.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from uuid import uuid4
+
+import redis
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from admission import idempotency_slot  # noqa: E402
+
+CHUNK = 10000
+
+
+def used_memory(client) -> int:
+    return int(client.info("memory")["used_memory"])
+
+
+def fill_strings(client, keys: int, forms: int, ttl: int):
+    for start in range(0, keys, CHUNK):
+        pipe = client.pipeline(transaction=False)
+        for i in range(start, min(keys, start + CHUNK)):
+            pipe.set(f"idempotency:{form_id_for(i, forms)}:{uuid4()}", str(uuid4()), ex=ttl)
+        pipe.execute()
+
+
+def fill_buckets(client, keys: int, forms: int, ttl: int, buckets: int):
+    now = time.time()
+    expiries = {}
+    for start in range(0, keys, CHUNK):
+        pipe = client.pipeline(transaction=False)
+        for i in range(start, min(keys, start + CHUNK)):
+            slot = idempotency_slot(form_id_for(i, forms), str(uuid4()), buckets, ttl, now=now)
+            pipe.hset(slot.current_bucket, slot.field, str(uuid4()))
+            expiries[slot.current_bucket] = slot.expire_at_ms
+        pipe.execute()
+
+    bucket_keys = list(expiries.items())
+    for start in range(0, len(bucket_keys), CHUNK):
+        pipe = client.pipeline(transaction=False)
+        for key, expire_at_ms in bucket_keys[start:start + CHUNK]:
+            pipe.pexpireat(key, expire_at_ms)
+        pipe.execute()
+
+
+# A fixed pool of form ids, like real traffic spread over many forms
+_FORM_IDS = {}
+
+
+def form_id_for(i: int, forms: int) -> str:
+    index = i % forms
+    if index not in _FORM_IDS:
+        _FORM_IDS[index] = str(uuid4())
+    return _FORM_IDS[index]
+
+
+def measure(client, layout: str, args) -> dict:
+    client.flushdb()
+    before = used_memory(client)
+    started = time.perf_counter()
+    if layout == "strings":
+        fill_strings(client, args.keys, args.forms, args.ttl)
+    else:
+        fill_buckets(client, args.keys, args.forms, args.ttl, args.buckets)
+    elapsed = time.perf_counter() - started
+    used = used_memory(client) - before
+
+    result = {
+        "layout": layout,
+        "keys": args.keys,
+        "redis_keys": client.dbsize(),
+        "used_memory_bytes": used,
+        "bytes_per_key": round(used / args.keys, 2),
+        "fill_seconds": round(elapsed, 2),
+    }
+    if layout == "buckets":
+        sample = client.randomkey()
+        result["buckets"] = args.buckets
+        result["sample_bucket_encoding"] = client.object("encoding", sample)
+        result["sample_bucket_entries"] = client.hlen(sample)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--redis-url", default=os.environ.get("REDIS_URL", "redis://localhost:6379/15"))
+    parser.add_argument("--keys", type=int, default=10_000_000)
+    parser.add_argument("--buckets", type=int, default=131072)
+    parser.add_argument("--forms", type=int, default=1000, help="Distinct form ids")
+    parser.add_argument("--ttl", type=int, default=86400)
+    args = parser.parse_args()
+
+    client = redis.from_url(args.redis_url, decode_responses=True)
+    redis_version = client.info("server")["redis_version"]
+    results = [measure(client, layout, args) for layout in ("strings", "buckets")]
+    client.flushdb()
+    client.close()
+
+    strings, buckets = results
+    print(json.dumps({
+        "benchmark": "idempotency_memory",
+        "redis_version": redis_version,
+        "results": results,
+        "reduction": round(1 - buckets["used_memory_bytes"] / max(1, strings["used_memory_bytes"]), 3),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
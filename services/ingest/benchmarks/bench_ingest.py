@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Offline ingest benchmark
+- Runs the FastAPI app in-process (httpx ASGI transport, no server)
+- fakeredis for admission, Celery in-memory broker for publishing
+- Signed payloads with configurable answer count and answer size
+- Reports throughput, latency percentiles and per-stage timings as JSON
+
+Usage:
+    python benchmarks/bench_ingest.py --requests 5000 --concurrency 50
+    python benchmarks/bench_ingest.py --answers 200 --answer-bytes 64 --output before.json
+    diff <(jq -S .results before.json) <(jq -S .results after.json)
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from functools import wraps
+from typing import Any, Dict, List
+from uuid import uuid4
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICE_DIR)
+
+HMAC_SECRET = "bench-hmac-secret"
+
+
+def configure_environment(spool_dir: str):
+    """Point main.Settings at local stand-ins; must run before importing main"""
+    os.environ.update({
+        "HMAC_SECRET": HMAC_SECRET,
+        "CELERY_BROKER_URL": "memory://",
+        "RATE_LIMIT_PER_MINUTE": str(10**9),
+        "RATE_LIMIT_BURST": str(10**9),
+        "SPOOL_DIR": spool_dir,
+    })
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * q))], 4)
+
+    return {
+        "count": len(ordered),
+        "mean": round(statistics.mean(ordered), 4),
+        "p50": pick(0.50),
+        "p95": pick(0.95),
+        "p99": pick(0.99),
+        "max": round(ordered[-1], 4),
+    }
+
+
+class StageTimer:
+    """Wraps main's hot-path functions to time each stage"""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+
+    def wrap_sync(self, stage, func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.samples[stage].append((time.perf_counter() - start) * 1000)
+        return wrapper
+
+    def wrap_async(self, stage, func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                self.samples[stage].append((time.perf_counter() - start) * 1000)
+        return wrapper
+
+    def install(self, main):
+        main.validate_hmac_signature = self.wrap_sync("hmac", main.validate_hmac_signature)
+        main.validate_form_exists = self.wrap_async("form_lookup", main.validate_form_exists)
+        main.validate_answers = self.wrap_async("answer_validation", main.validate_answers)
+        main.admit_submission = self.wrap_async("redis_admission", main.admit_submission)
+        main.queue_submission = self.wrap_async("publish", main.queue_submission)
+
+        timer = self
+        request_model = main.SubmissionRequest
+
+        class TimedSubmissionRequest:
+            @staticmethod
+            def model_validate_json(body):
+                return timer.wrap_sync("parse", request_model.model_validate_json)(body)
+
+        main.SubmissionRequest = TimedSubmissionRequest
+
+    def report(self) -> Dict[str, Dict[str, float]]:
+        return {stage: percentiles(values) for stage, values in sorted(self.samples.items())}
+
+
+def build_payload(form_id: str, answers: int, answer_bytes: int) -> Dict[str, Any]:
+    value = "x" * answer_bytes
+    return {
+        "data": {
+            "form_id": form_id,
+            "respondent_key": f"bench-{uuid4()}",
+            "version": 1,
+            "locale": "en",
+            "answers": {f"block_{i}": value for i in range(answers)},
+            "metadata": {"benchmark": True},
+            "partial": False,
+        },
+        "idempotency_key": str(uuid4()),
+        "timestamp": int(time.time()),
+    }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=SERVICE_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return "unknown"
+
+
+async def run_benchmark(args) -> Dict[str, Any]:
+    import logging
+
+    import fakeredis
+    import httpx
+    import structlog
+
+    # Per-request info logs would dominate the measurement
+    structlog.configure(wrapper_class=structlog.make_filtering_bound_logger(logging.WARNING))
+
+    import main
+    from answer_validation import compile_schema
+
+    # Celery's "memory://" is a broker transport only
+    main.celery_app.conf.result_backend = "cache+memory://"
+
+    timer = StageTimer()
+    timer.install(main)
+
+    form_id = str(uuid4())
+    main.redis_client = fakeredis.FakeAsyncRedis(decode_responses=True)
+    main.form_registry.apply({
+        "action": "publish",
+        "form_id": form_id,
+        "organization_id": str(uuid4()),
+        "version": 1,
+        "plan": "pro",
+    })
+    # Compiled validator matching the generated answers, so validation is measured
+    main.answer_validators._set((form_id, 1), compile_schema({
+        "blocks": [{"id": f"block_{i}", "type": "long_text"} for i in range(args.answers)]
+    }))
+    main.submission_publisher.start()
+
+    # Pre-sign every request so payload generation is not measured
+    total = args.warmup + args.requests
+    bodies = []
+    for _ in range(total):
+        body = json.dumps(build_payload(form_id, args.answers, args.answer_bytes), separators=(",", ":")).encode()
+        bodies.append((body, main.generate_hmac_signature(body, HMAC_SECRET)))
+
+    latencies: List[float] = []
+    status_codes: Dict[int, int] = defaultdict(int)
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://ingest") as client:
+        async def submit(body, signature, record):
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post(
+                    f"/submit/{form_id}",
+                    content=body,
+                    headers={"Content-Type": "application/json", "X-Forms-Signature": signature},
+                )
+                if record:
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    status_codes[response.status_code] += 1
+
+        await asyncio.gather(*(submit(body, sig, False) for body, sig in bodies[:args.warmup]))
+        timer.samples.clear()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(submit(body, sig, True) for body, sig in bodies[args.warmup:]))
+        elapsed = time.perf_counter() - started
+
+    await asyncio.get_running_loop().run_in_executor(None, main.submission_publisher.stop)
+
+    with main.celery_app.connection_for_write() as conn:
+        queued_batches = conn.SimpleQueue("submissions").qsize()
+
+    return {
+        "benchmark": "ingest",
+        "revision": git_revision(),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "config": {
+            "requests": args.requests,
+            "warmup": args.warmup,
+            "concurrency": args.concurrency,
+            "answers": args.answers,
+            "answer_bytes": args.answer_bytes,
+            "payload_bytes": len(bodies[0][0]),
+        },
+        "results": {
+            "status_codes": {str(code): count for code, count in sorted(status_codes.items())},
+            "errors": sum(count for code, count in status_codes.items() if code != 200),
+            "throughput_rps": round(args.requests / elapsed, 2),
+            "latency_ms": percentiles(latencies),
+            "stages_ms": timer.report(),
+            "broker_batches": queued_batches,
+        },
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--answers", type=int, default=10, help="Answers per submission")
+    parser.add_argument("--answer-bytes", type=int, default=32, help="Size of each answer value")
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    with tempfile.TemporaryDirectory(prefix="ingest-bench-spool-") as spool_dir:
+        configure_environment(spool_dir)
+        report = asyncio.run(run_benchmark(args))
+
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return report
+
+
+if __name__ == "__main__":
+    main()
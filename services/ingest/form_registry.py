@@ -0,0 +1,244 @@
+"""
+In-process registry of published forms for the ingest service
+- form_id -> organization, published version and plan
+- LRU with TTL, including short-lived negative entries for unknown forms
+- Warmed from Postgres at startup, invalidated over Redis pub/sub
+"""
+
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, NamedTuple, Tuple
+from uuid import UUID
+
+import redis.asyncio as redis
+import structlog
+from prometheus_client import Counter, Gauge
+from sqlalchemy import create_engine, text
+
+logger = structlog.get_logger()
+
+# Metrics
+registry_lookup_counter = Counter('form_registry_lookups_total', 'Form registry lookups', ['result'])
+registry_size_gauge = Gauge('form_registry_entries', 'Entries held in the form registry')
+registry_invalidation_counter = Counter('form_registry_invalidations_total', 'Form registry invalidation messages', ['action'])
+
+# Channel the API publishes to from FormViewSet.publish/unpublish
+FORM_REGISTRY_CHANNEL = "forms:registry"
+
+PUBLISHED_FORMS_QUERY = """
+    SELECT f.id, f.organization_id, o.plan,
+           (SELECT MAX(v.version) FROM forms_formversion v
+            WHERE v.form_id = f.id AND v.published_at IS NOT NULL) AS version
+    FROM forms_form f
+    JOIN core_organization o ON o.id = f.organization_id
+    WHERE f.status = 'published'
+"""
+
+
+class FormInfo(NamedTuple):
+    form_id: str
+    organization_id: str
+    version: Optional[int]
+    plan: str
+
+
+class FormRegistry:
+    """Published-form lookup that avoids a database hit per submission"""
+
+    def __init__(
+        self,
+        database_url: str,
+        max_entries: int = 50000,
+        ttl_seconds: int = 300,
+        negative_ttl_seconds: int = 30,
+        channel: str = FORM_REGISTRY_CHANNEL,
+    ):
+        self.database_url = database_url
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self.negative_ttl = negative_ttl_seconds
+        self.channel = channel
+
+        # form_id -> (expires_at, FormInfo or None for "not published")
+        self._entries: "OrderedDict[str, Tuple[float, Optional[FormInfo]]]" = OrderedDict()
+        self._inflight: Dict[str, "asyncio.Future[Optional[FormInfo]]"] = {}
+        self._engine = None
+        self._listener: Optional[asyncio.Task] = None
+        # Called with the form_id of every registry message (None after a
+        # reconnect) so caches derived from form data can drop stale entries
+        self.listeners: List[Callable[[Optional[str]], None]] = []
+
+    # Cache primitives
+    def _set(self, form_id: str, info: Optional[FormInfo]):
+        ttl = self.ttl if info else self.negative_ttl
+        self._entries[form_id] = (time.monotonic() + ttl, info)
+        self._entries.move_to_end(form_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        registry_size_gauge.set(len(self._entries))
+
+    def _get_cached(self, form_id: str) -> Tuple[bool, Optional[FormInfo]]:
+        entry = self._entries.get(form_id)
+        if entry is None:
+            return False, None
+        expires_at, info = entry
+        if expires_at < time.monotonic():
+            del self._entries[form_id]
+            return False, None
+        self._entries.move_to_end(form_id)
+        return True, info
+
+    def invalidate(self, form_id: Optional[str] = None):
+        """Drop one form, or the whole registry when form_id is None"""
+        if form_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(form_id, None)
+        registry_size_gauge.set(len(self._entries))
+
+    # Lookups
+    async def get(self, form_id: str) -> Optional[FormInfo]:
+        """
+        Return the published form, or None when it does not exist or is not
+        published. Raises if the database cannot be reached on a miss.
+        """
+        try:
+            UUID(form_id)
+        except ValueError:
+            registry_lookup_counter.labels(result="malformed").inc()
+            return None
+
+        found, info = self._get_cached(form_id)
+        if found:
+            registry_lookup_counter.labels(result="hit" if info else "negative_hit").inc()
+            return info
+
+        registry_lookup_counter.labels(result="miss").inc()
+
+        # Coalesce concurrent misses for the same form into one query
+        pending = self._inflight.get(form_id)
+        if pending is not None:
+            return await pending
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._inflight[form_id] = future
+        try:
+            info = await loop.run_in_executor(None, self._load_one, form_id)
+            self._set(form_id, info)
+            future.set_result(info)
+            return info
+        except Exception as e:
+            future.set_exception(e)
+            # Nobody else may be awaiting; avoid "exception never retrieved"
+            future.exception()
+            raise
+        finally:
+            del self._inflight[form_id]
+
+    async def warm(self):
+        """Load every published form, up to max_entries"""
+        loop = asyncio.get_running_loop()
+        forms = await loop.run_in_executor(None, self._load_all)
+        for info in forms[:self.max_entries]:
+            self._set(info.form_id, info)
+        logger.info("Form registry warmed", forms=len(forms), cached=len(self._entries))
+
+    # Database access (runs in the default executor)
+    def _get_engine(self):
+        if self._engine is None:
+            self._engine = create_engine(self.database_url, pool_size=2, max_overflow=2, pool_pre_ping=True)
+        return self._engine
+
+    def _load_one(self, form_id: str) -> Optional[FormInfo]:
+        query = text(PUBLISHED_FORMS_QUERY + " AND f.id = :form_id")
+        with self._get_engine().connect() as conn:
+            row = conn.execute(query, {"form_id": form_id}).fetchone()
+        return self._row_to_info(row) if row else None
+
+    def _load_all(self) -> List[FormInfo]:
+        with self._get_engine().connect() as conn:
+            rows = conn.execute(text(PUBLISHED_FORMS_QUERY)).fetchall()
+        return [self._row_to_info(row) for row in rows]
+
+    @staticmethod
+    def _row_to_info(row) -> FormInfo:
+        form_id, organization_id, plan, version = row
+        return FormInfo(
+            form_id=str(form_id),
+            organization_id=str(organization_id),
+            version=version,
+            plan=plan,
+        )
+
+    # Invalidation
+    def apply(self, message: Dict[str, Any]):
+        """Apply a registry message published by the API"""
+        action = message.get("action")
+        form_id = message.get("form_id")
+        if not form_id:
+            return
+        registry_invalidation_counter.labels(action=action or "unknown").inc()
+
+        if action == "publish":
+            self._set(form_id, FormInfo(
+                form_id=form_id,
+                organization_id=message["organization_id"],
+                version=message.get("version"),
+                plan=message.get("plan", "free"),
+            ))
+        elif action == "unpublish":
+            self._set(form_id, None)
+        else:
+            self.invalidate(form_id)
+        self._notify(form_id)
+
+    def _notify(self, form_id: Optional[str]):
+        for listener in self.listeners:
+            try:
+                listener(form_id)
+            except Exception as e:
+                logger.error("Form registry listener callback failed", form_id=form_id, error=str(e))
+
+    def start_listener(self, redis_client: redis.Redis):
+        self._listener = asyncio.create_task(self._listen(redis_client))
+
+    async def stop_listener(self):
+        if self._listener:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+    async def _listen(self, redis_client: redis.Redis, reconnect_delay: float = 1.0):
+        reconnecting = False
+        while True:
+            pubsub = redis_client.pubsub()
+            try:
+                await pubsub.subscribe(self.channel)
+                if reconnecting:
+                    # Messages may have been missed while disconnected
+                    self.invalidate()
+                    self._notify(None)
+                reconnecting = True
+                async for message in pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    try:
+                        self.apply(json.loads(message["data"]))
+                    except (ValueError, KeyError) as e:
+                        logger.warning("Ignoring malformed registry message", error=str(e))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Form registry listener disconnected", error=str(e))
+                await asyncio.sleep(reconnect_delay)
+            finally:
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
@@ -0,0 +1,121 @@
+"""
+Long-lived outbound HTTP clients for worker processes
+- One httpx.Client per origin, so every host gets its own keep-alive pool and
+  connection cap; least recently used origins are closed past max_hosts
+- Optional HTTP/2 (needs the h2 package, otherwise HTTP/1.1 is used)
+- Counts requests served on a reused connection vs a newly opened one
+"""
+
+import importlib.util
+import threading
+from collections import OrderedDict
+from typing import Dict, Tuple
+
+import httpx
+import structlog
+from prometheus_client import Counter, Gauge
+
+logger = structlog.get_logger()
+
+# Metrics
+pool_request_counter = Counter(
+    'worker_http_requests_total',
+    'Outbound worker requests by whether they reused a pooled connection',
+    ['client', 'connection']
+)
+pool_hosts_gauge = Gauge('worker_http_pooled_hosts', 'Origins with an open client pool', ['client'])
+
+# httpcore trace event emitted only when a request has to open a connection
+NEW_CONNECTION_EVENT = "connection.connect_tcp.started"
+
+Origin = Tuple[str, str, int]
+
+
+class PoolTracer:
+    """httpcore trace hook that notes whether a request opened a connection"""
+
+    def __init__(self):
+        self.connected = False
+
+    def __call__(self, event_name: str, info: Dict):
+        if event_name == NEW_CONNECTION_EVENT:
+            self.connected = True
+
+
+class HTTPClientRegistry:
+    """Per-origin pooled clients shared by every task in a worker process"""
+
+    def __init__(
+        self,
+        name: str,
+        http2: bool = False,
+        max_connections_per_host: int = 10,
+        max_keepalive_per_host: int = 10,
+        keepalive_expiry_seconds: float = 30.0,
+        connect_timeout_seconds: float = 3.0,
+        timeout_seconds: float = 10.0,
+        max_hosts: int = 256,
+    ):
+        self.name = name
+        if http2 and importlib.util.find_spec("h2") is None:
+            logger.warning("HTTP/2 requested but h2 is not installed, using HTTP/1.1", client=name)
+            http2 = False
+        self.http2 = http2
+        self.limits = httpx.Limits(
+            max_connections=max_connections_per_host,
+            max_keepalive_connections=max_keepalive_per_host,
+            keepalive_expiry=keepalive_expiry_seconds,
+        )
+        self.timeout = httpx.Timeout(timeout_seconds, connect=connect_timeout_seconds)
+        self.max_hosts = max_hosts
+
+        self._clients: "OrderedDict[Origin, httpx.Client]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _create(self) -> httpx.Client:
+        return httpx.Client(
+            http2=self.http2,
+            limits=self.limits,
+            timeout=self.timeout,
+            event_hooks={"request": [self._trace], "response": [self._count]},
+        )
+
+    def _trace(self, request: httpx.Request):
+        request.extensions["trace"] = PoolTracer()
+
+    def _count(self, response: httpx.Response):
+        tracer = response.request.extensions.get("trace")
+        connection = "new" if isinstance(tracer, PoolTracer) and tracer.connected else "reused"
+        pool_request_counter.labels(client=self.name, connection=connection).inc()
+
+    def client_for(self, url: str) -> httpx.Client:
+        """Pooled client for the URL's origin"""
+        parsed = httpx.URL(url)
+        origin = (parsed.scheme, parsed.host, parsed.port or (443 if parsed.scheme == "https" else 80))
+        evicted = None
+        with self._lock:
+            client = self._clients.get(origin)
+            if client is not None:
+                self._clients.move_to_end(origin)
+                return client
+            client = self._clients[origin] = self._create()
+            if len(self._clients) > self.max_hosts:
+                _, evicted = self._clients.popitem(last=False)
+            pool_hosts_gauge.labels(client=self.name).set(len(self._clients))
+        if evicted is not None:
+            evicted.close()
+        return client
+
+    def post(self, url: str, **kwargs) -> httpx.Response:
+        return self.client_for(url).post(url, **kwargs)
+
+    def close(self):
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+            pool_hosts_gauge.labels(client=self.name).set(0)
+        for client in clients:
+            try:
+                client.close()
+            except Exception as e:
+                logger.warning("Failed to close HTTP client", client=self.name, error=str(e))
@@ -0,0 +1,161 @@
+"""
+Stage level instrumentation for the submit endpoints
+- StageTimer attributes elapsed time to named stages as a handler advances
+- StageTimingMiddleware times the response stage, records per-stage histograms
+  and echoes a Server-Timing breakdown on sampled requests
+- TopKTracker keeps approximate per-form counts for the busiest forms only,
+  so form ids never become an unbounded metric label
+"""
+
+import random
+import time
+from typing import Dict, List, Optional, Tuple
+
+from prometheus_client import Histogram
+from prometheus_client.core import GaugeMetricFamily
+
+# Most stages take well under a millisecond; keep resolution down there
+STAGE_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+    0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+)
+
+# Metrics
+stage_duration = Histogram(
+    'submission_stage_seconds',
+    'Time spent in each stage of a submit request',
+    ['endpoint', 'stage'],
+    buckets=STAGE_BUCKETS
+)
+
+TIMING_HEADER = b"server-timing"
+# ASGI scope key the middleware hands the timer to the endpoint under
+SCOPE_KEY = "stage_timer"
+
+
+class StageTimer:
+    """Sequential stage clock: each mark closes the stage that just ran"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._last = self.started
+        self.stages: List[Tuple[str, float]] = []
+
+    def mark(self, stage: str):
+        """Attribute the time since the previous mark to stage"""
+        now = time.perf_counter()
+        self.stages.append((stage, now - self._last))
+        self._last = now
+
+    def total(self) -> float:
+        return self._last - self.started
+
+    def observe(self, endpoint: str):
+        for stage, seconds in self.stages:
+            stage_duration.labels(endpoint=endpoint, stage=stage).observe(seconds)
+
+    def header_value(self) -> str:
+        parts = [f"{stage};dur={seconds * 1000:.3f}" for stage, seconds in self.stages]
+        parts.append(f"total;dur={self.total() * 1000:.3f}")
+        return ", ".join(parts)
+
+
+def stage_timer(request) -> StageTimer:
+    """The request's timer, or a throwaway one when the middleware is not installed"""
+    timer = request.scope.get(SCOPE_KEY)
+    if timer is None:
+        timer = request.scope[SCOPE_KEY] = StageTimer()
+    return timer
+
+
+class StageTimingMiddleware:
+    """
+    Pure ASGI middleware for POST /submit/... requests. The endpoint marks its
+    own stages; everything between its last mark and the response start
+    (response model validation, serialization, exception handlers) is the
+    "response" stage.
+    """
+
+    def __init__(self, app, path_prefix: str = "/submit/", sample_rate: float = 0.0):
+        self.app = app
+        self.path_prefix = path_prefix
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] != "POST"
+            or not scope["path"].startswith(self.path_prefix)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        timer = scope[SCOPE_KEY] = StageTimer()
+        endpoint = "batch" if scope["path"] == self.path_prefix + "batch" else "single"
+        sampled = self.sample_rate > 0 and random.random() < self.sample_rate
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                timer.mark("response")
+                timer.observe(endpoint)
+                if sampled:
+                    headers = list(message.get("headers", []))
+                    headers.append((TIMING_HEADER, timer.header_value().encode("latin-1")))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        await self.app(scope, receive, send_with_timing)
+
+
+class TopKTracker:
+    """
+    Space-Saving heavy hitters: approximate counts for at most `capacity` keys.
+    A key that displaces the smallest entry inherits its count, so a count may
+    overestimate by at most errors[key]; the true heavy hitters always stay in.
+    """
+
+    def __init__(self, capacity: int = 100):
+        self.capacity = capacity
+        self.counts: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+
+    def add(self, key: str, count: int = 1):
+        if key in self.counts:
+            self.counts[key] += count
+            return
+        if len(self.counts) < self.capacity:
+            self.counts[key] = count
+            self.errors[key] = 0
+            return
+        victim = min(self.counts, key=self.counts.__getitem__)
+        floor = self.counts.pop(victim)
+        del self.errors[victim]
+        self.counts[key] = floor + count
+        self.errors[key] = floor
+
+    def top(self, n: Optional[int] = None) -> List[Tuple[str, int]]:
+        return sorted(self.counts.items(), key=lambda item: item[1], reverse=True)[:n]
+
+
+class TopFormsCollector:
+    """Exports a TopKTracker at scrape time; cardinality is bounded by its capacity"""
+
+    def __init__(self, tracker: TopKTracker):
+        self.tracker = tracker
+
+    def collect(self):
+        counts = GaugeMetricFamily(
+            'submissions_top_forms',
+            'Approximate submissions since start for the busiest forms',
+            labels=['form_id']
+        )
+        errors = GaugeMetricFamily(
+            'submissions_top_forms_error',
+            'Upper bound on the overcount in submissions_top_forms',
+            labels=['form_id']
+        )
+        for form_id, count in self.tracker.top():
+            counts.add_metric([form_id], count)
+            errors.add_metric([form_id], self.tracker.errors[form_id])
+        yield counts
+        yield errors
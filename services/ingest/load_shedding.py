@@ -0,0 +1,158 @@
+"""
+Adaptive load shedding for the ingest service
+- Samples broker queue depth, worker lag and the local publish backlog
+- Degrades in steps: defer partial saves first, then shed all new traffic
+- Decisions are cheap in-memory lookups; sampling runs in the background
+"""
+
+import asyncio
+import time
+from typing import Callable, NamedTuple, Optional
+
+import redis.asyncio as redis
+import structlog
+from prometheus_client import Counter, Gauge
+
+logger = structlog.get_logger()
+
+# Metrics
+shed_decision_counter = Counter('load_shed_decisions_total', 'Requests deferred or shed by the admission controller', ['action'])
+shed_level_gauge = Gauge('load_shed_level', 'Admission controller level (0 normal, 1 defer partials, 2 shed)')
+queue_depth_gauge = Gauge('load_shed_queue_depth', 'Last sampled broker queue depth for submissions')
+worker_lag_gauge = Gauge('load_shed_worker_lag_seconds', 'Last sampled submission worker lag')
+
+# Set by the worker after each batch (milliseconds between submit and processing)
+WORKER_LAG_KEY = "ingest:worker_lag_ms"
+
+NORMAL = 0
+DEFER_PARTIAL = 1
+SHED = 2
+
+
+class ShedDecision(NamedTuple):
+    action: str  # "defer_partial" or "shed"
+    retry_after_seconds: int
+
+
+class LoadSample(NamedTuple):
+    queue_depth: int
+    worker_lag_ms: int
+    local_backlog: int
+    sampled_at: float
+
+
+class AdmissionController:
+    """Decide whether to take new submissions based on downstream health"""
+
+    def __init__(
+        self,
+        queue_name: str = "submissions",
+        defer_partial_queue_depth: int = 5000,
+        shed_queue_depth: int = 20000,
+        defer_partial_lag_ms: int = 10000,
+        shed_lag_ms: int = 60000,
+        defer_partial_local_backlog: int = 5000,
+        shed_local_backlog: int = 9000,
+        sample_interval_seconds: float = 1.0,
+        stale_after_seconds: float = 10.0,
+        partial_retry_after_seconds: int = 30,
+        shed_retry_after_seconds: int = 5,
+        local_backlog: Optional[Callable[[], int]] = None,
+    ):
+        self.queue_name = queue_name
+        self.defer_partial_queue_depth = defer_partial_queue_depth
+        self.shed_queue_depth = shed_queue_depth
+        self.defer_partial_lag_ms = defer_partial_lag_ms
+        self.shed_lag_ms = shed_lag_ms
+        self.defer_partial_local_backlog = defer_partial_local_backlog
+        self.shed_local_backlog = shed_local_backlog
+        self.sample_interval = sample_interval_seconds
+        self.stale_after = stale_after_seconds
+        self.partial_retry_after = partial_retry_after_seconds
+        self.shed_retry_after = shed_retry_after_seconds
+        # Publisher buffer + spool; covers a broker we cannot sample
+        self.local_backlog = local_backlog or (lambda: 0)
+
+        self.sample: Optional[LoadSample] = None
+        self._sampler: Optional[asyncio.Task] = None
+
+    # Decisions
+    def level(self) -> int:
+        sample = self.sample
+        # Fail open when sampling has stopped working
+        if sample is None or time.monotonic() - sample.sampled_at > self.stale_after:
+            return NORMAL
+        if (
+            sample.queue_depth >= self.shed_queue_depth
+            or sample.worker_lag_ms >= self.shed_lag_ms
+            or sample.local_backlog >= self.shed_local_backlog
+        ):
+            return SHED
+        if (
+            sample.queue_depth >= self.defer_partial_queue_depth
+            or sample.worker_lag_ms >= self.defer_partial_lag_ms
+            or sample.local_backlog >= self.defer_partial_local_backlog
+        ):
+            return DEFER_PARTIAL
+        return NORMAL
+
+    def decide(self, partial: bool) -> Optional[ShedDecision]:
+        """Return None to admit, or how the request should be turned away"""
+        level = self.level()
+        if level == SHED:
+            shed_decision_counter.labels(action="shed").inc()
+            return ShedDecision("shed", self.shed_retry_after)
+        if level == DEFER_PARTIAL and partial:
+            shed_decision_counter.labels(action="defer_partial").inc()
+            return ShedDecision("defer_partial", self.partial_retry_after)
+        return None
+
+    # Sampling
+    async def take_sample(self, broker_client: Optional[redis.Redis]) -> LoadSample:
+        queue_depth = 0
+        worker_lag_ms = 0
+        if broker_client is not None:
+            async with broker_client.pipeline(transaction=False) as pipe:
+                pipe.llen(self.queue_name)
+                pipe.get(WORKER_LAG_KEY)
+                queue_depth, lag = await pipe.execute()
+            worker_lag_ms = int(lag or 0)
+
+        self.sample = LoadSample(
+            queue_depth=int(queue_depth),
+            worker_lag_ms=worker_lag_ms,
+            local_backlog=self.local_backlog(),
+            sampled_at=time.monotonic(),
+        )
+        queue_depth_gauge.set(self.sample.queue_depth)
+        worker_lag_gauge.set(worker_lag_ms / 1000)
+        shed_level_gauge.set(self.level())
+        return self.sample
+
+    def start(self, broker_client: Optional[redis.Redis]):
+        self._sampler = asyncio.create_task(self._run(broker_client))
+
+    async def stop(self):
+        if self._sampler:
+            self._sampler.cancel()
+            try:
+                await self._sampler
+            except asyncio.CancelledError:
+                pass
+            self._sampler = None
+
+    async def _run(self, broker_client: Optional[redis.Redis]):
+        previous = NORMAL
+        while True:
+            try:
+                await self.take_sample(broker_client)
+                level = self.level()
+                if level != previous:
+                    logger.warning("Admission level changed", level=level, previous=previous, sample=self.sample._asdict())
+                    previous = level
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # The sample goes stale and decisions fail open
+                logger.error("Load sampling failed", error=str(e))
+            await asyncio.sleep(self.sample_interval)
@@ -0,0 +1,269 @@
+"""
+Micro-batching Celery publisher for the ingest service
+- Bounded in-memory buffer fed from the asyncio request handlers
+- Dedicated publisher thread that flushes by batch size or linger time
+- One broker round trip per batch instead of one per submission
+- Backpressure when the buffer is full
+- Groups (batch submissions) are published together as their own task
+- Optional local spool that takes batches while the broker is unreachable
+"""
+
+import asyncio
+import queue
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import structlog
+from celery import Celery
+from prometheus_client import Counter, Gauge, Histogram
+
+from spool import SegmentSpool
+
+logger = structlog.get_logger()
+
+# Metrics
+publish_batch_size = Histogram(
+    'submission_publish_batch_size',
+    'Number of submissions per broker publish',
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500)
+)
+publish_duration = Histogram('submission_publish_seconds', 'Time spent publishing a batch to the broker')
+publish_queue_depth = Gauge('submission_publish_queue_depth', 'Submissions waiting in the publish buffer')
+publish_failures_counter = Counter('submission_publish_failures_total', 'Failed broker publish attempts')
+publish_backpressure_counter = Counter('submission_publish_backpressure_total', 'Submissions rejected because the publish buffer was full')
+
+BATCH_TASK_NAME = "process_submission_batch"
+
+# Sentinel used to wake the publisher thread on shutdown
+_STOP = object()
+
+
+class PublisherBackpressure(Exception):
+    """Raised when the publish buffer stays full past the enqueue timeout"""
+
+
+class BatchingPublisher:
+    """Buffer submissions and publish them to Celery in batches"""
+
+    def __init__(
+        self,
+        celery_app: Celery,
+        max_batch_size: int = 100,
+        max_linger_ms: int = 20,
+        buffer_size: int = 10000,
+        enqueue_timeout_ms: int = 250,
+        queue_name: str = "submissions",
+        retry_delay_seconds: float = 0.5,
+        spool: Optional[SegmentSpool] = None,
+    ):
+        self.celery_app = celery_app
+        self.max_batch_size = max_batch_size
+        self.max_linger = max_linger_ms / 1000
+        self.enqueue_timeout = enqueue_timeout_ms / 1000
+        self.queue_name = queue_name
+        self.retry_delay = retry_delay_seconds
+        self.spool = spool
+        self._next_replay_at = 0.0
+
+        self._buffer: "queue.Queue[Any]" = queue.Queue(maxsize=buffer_size)
+        # Group taken off the buffer while a batch was being collected
+        self._carry: Optional[List[Tuple[Dict[str, Any], str]]] = None
+        self._thread: Optional[threading.Thread] = None
+        self._running = threading.Event()
+
+    # Lifecycle
+    def start(self):
+        """Start the publisher thread"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._running.set()
+        self._thread = threading.Thread(target=self._run, name="submission-publisher", daemon=True)
+        self._thread.start()
+        logger.info(
+            "Submission publisher started",
+            max_batch_size=self.max_batch_size,
+            max_linger_ms=self.max_linger * 1000,
+            buffer_size=self._buffer.maxsize
+        )
+
+    def stop(self, timeout: float = 10.0):
+        """Flush whatever is buffered and stop the publisher thread"""
+        if not self._thread:
+            return
+        self._running.clear()
+        # Blocking put so the sentinel is not lost when the buffer is full
+        self._buffer.put(_STOP)
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.warning("Submission publisher did not stop in time", pending=self.depth())
+        self._thread = None
+        logger.info("Submission publisher stopped")
+
+    def depth(self) -> int:
+        return self._buffer.qsize()
+
+    # Producer side (event loop)
+    async def _put(self, item: Any):
+        try:
+            self._buffer.put_nowait(item)
+        except queue.Full:
+            loop = asyncio.get_running_loop()
+            try:
+                await loop.run_in_executor(None, self._buffer.put, item, True, self.enqueue_timeout)
+            except queue.Full:
+                publish_backpressure_counter.inc()
+                raise PublisherBackpressure("Publish buffer is full")
+        publish_queue_depth.set(self._buffer.qsize())
+
+    async def publish(self, submission_data: Dict[str, Any], submission_id: str):
+        """
+        Add a submission to the buffer without blocking the event loop.
+
+        Waits up to enqueue_timeout for room when the buffer is full, then
+        raises PublisherBackpressure so the caller can shed the request.
+        """
+        await self._put((submission_data, submission_id))
+
+    async def publish_group(self, items: List[Tuple[Dict[str, Any], str]]):
+        """
+        Add submissions that must go out in one task. The group takes a
+        single buffer slot and is never merged with other submissions.
+        """
+        if items:
+            await self._put(list(items))
+
+    # Consumer side (publisher thread)
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch, stopping = self._collect_batch()
+            if batch:
+                self._flush(batch)
+            elif self.spool is not None and self.spool.pending():
+                self._replay_spool()
+
+        # Drain anything enqueued after the stop sentinel
+        remaining: List[Tuple[Dict[str, Any], str]] = []
+        for item in self._drain_nowait():
+            if isinstance(item, list):
+                self._flush(item)
+            else:
+                remaining.append(item)
+        while remaining:
+            self._flush(remaining[:self.max_batch_size])
+            remaining = remaining[self.max_batch_size:]
+        if self.spool is not None:
+            self.spool.close()
+
+    def _collect_batch(self) -> Tuple[List[Tuple[Dict[str, Any], str]], bool]:
+        """Wait for the first item, then gather more until size or linger is reached"""
+        batch: List[Tuple[Dict[str, Any], str]] = []
+
+        if self._carry is not None:
+            first, self._carry = self._carry, None
+        else:
+            # Wake up periodically while the spool has records to replay
+            idle_timeout = self.retry_delay if self.spool is not None and self.spool.pending() else None
+            try:
+                first = self._buffer.get(timeout=idle_timeout)
+            except queue.Empty:
+                return batch, False
+        if first is _STOP:
+            return batch, True
+        if isinstance(first, list):
+            return first, False
+        batch.append(first)
+
+        deadline = time.monotonic() + self.max_linger
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._buffer.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            if isinstance(item, list):
+                # Publish the group on its own after this batch
+                self._carry = item
+                break
+            batch.append(item)
+
+        return batch, False
+
+    def _drain_nowait(self) -> List[Any]:
+        items = []
+        while True:
+            try:
+                item = self._buffer.get_nowait()
+            except queue.Empty:
+                return items
+            if item is not _STOP:
+                items.append(item)
+
+    def _send(self, batch: List[Any]) -> bool:
+        """One broker publish attempt"""
+        start = time.perf_counter()
+        try:
+            self.celery_app.send_task(
+                BATCH_TASK_NAME,
+                args=[[list(item) for item in batch]],
+                queue=self.queue_name,
+                # With a spool, fail fast and let the spool absorb the outage
+                retry=self.spool is None
+            )
+        except Exception as e:
+            publish_failures_counter.inc()
+            logger.error("Batch publish failed", batch_size=len(batch), error=str(e))
+            return False
+
+        publish_duration.observe(time.perf_counter() - start)
+        publish_batch_size.observe(len(batch))
+        publish_queue_depth.set(self._buffer.qsize())
+        return True
+
+    def _flush(self, batch: List[Tuple[Dict[str, Any], str]]):
+        """Publish a batch, spooling it to disk when the broker is unavailable"""
+        if self.spool is not None:
+            try:
+                if self.spool.pending():
+                    # Keep submissions in order behind what is already spooled
+                    self.spool.append_batch([list(item) for item in batch])
+                    self._replay_spool()
+                    return
+                if self._send(batch):
+                    return
+                self.spool.append_batch([list(item) for item in batch])
+                self._next_replay_at = time.monotonic() + self.retry_delay
+                return
+            except OSError as e:
+                logger.error("Submission spool write failed", batch_size=len(batch), error=str(e))
+
+        while not self._send(batch):
+            if not self._running.is_set():
+                logger.error(
+                    "Dropping batch on shutdown",
+                    submission_ids=[submission_id for _, submission_id in batch]
+                )
+                return
+            # Holding the batch lets the buffer fill up, which pushes
+            # backpressure onto the request handlers
+            time.sleep(self.retry_delay)
+
+    def _replay_spool(self):
+        """Replay spooled submissions in order until the spool is empty or the broker fails"""
+        if time.monotonic() < self._next_replay_at:
+            return
+        while True:
+            records, position = self.spool.read_batch(self.max_batch_size)
+            if not records:
+                return
+            if not self._send(records):
+                self._next_replay_at = time.monotonic() + self.retry_delay
+                return
+            self.spool.commit(position)
+            if not self.spool.pending():
+                logger.info("Submission spool drained")
@@ -0,0 +1,203 @@
+"""
+Durable local spool for submissions the broker could not accept
+- Append-only segment files, one fsync per appended batch
+- Records are length + CRC framed JSON; a torn tail write is discarded
+- Replay is in append order, with a cursor file to limit re-sends after a crash
+"""
+
+import json
+import os
+import struct
+import zlib
+from typing import Any, List, NamedTuple, Optional, Tuple
+
+import structlog
+from prometheus_client import Counter, Gauge
+
+logger = structlog.get_logger()
+
+# Metrics
+spool_bytes_gauge = Gauge('submission_spool_bytes', 'Bytes held in the local submission spool')
+spool_records_gauge = Gauge('submission_spool_records', 'Submissions waiting in the local submission spool')
+spool_appended_counter = Counter('submission_spool_appended_total', 'Submissions written to the local spool')
+spool_replayed_counter = Counter('submission_spool_replayed_total', 'Submissions replayed from the local spool to the broker')
+
+# length, crc32
+HEADER = struct.Struct(">II")
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".log"
+CURSOR_FILE = "cursor"
+
+
+class SpoolPosition(NamedTuple):
+    segment: str
+    offset: int
+    records: int
+
+
+class SegmentSpool:
+    """
+    Append-only on-disk queue. Not thread-safe: the publisher thread is
+    its only writer and reader.
+    """
+
+    def __init__(self, directory: str, segment_max_bytes: int = 64 * 1024 * 1024):
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+        self._active_file = None
+        self._active_name: Optional[str] = None
+        self._cursor_segment: Optional[str] = None
+        self._cursor_offset = 0
+        self._records = 0
+
+        self._load_cursor()
+        self._records = sum(self._count_records(name) for name in self._segments())
+        self._update_gauges()
+        if self._records:
+            logger.warning("Submission spool has pending records", records=self._records, directory=directory)
+
+    # Segment bookkeeping
+    def _segments(self) -> List[str]:
+        return sorted(
+            name for name in os.listdir(self.directory)
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)
+        )
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _next_segment_name(self) -> str:
+        segments = self._segments()
+        sequence = int(segments[-1][len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]) + 1 if segments else 1
+        return f"{SEGMENT_PREFIX}{sequence:012d}{SEGMENT_SUFFIX}"
+
+    def _open_active(self):
+        if self._active_file is None:
+            self._active_name = self._next_segment_name()
+            self._active_file = open(self._path(self._active_name), "ab")
+            self._fsync_directory()
+        return self._active_file
+
+    def _close_active(self):
+        if self._active_file is not None:
+            self._active_file.close()
+            self._active_file = None
+            self._active_name = None
+
+    def _fsync_directory(self):
+        fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _update_gauges(self):
+        spool_records_gauge.set(self._records)
+        spool_bytes_gauge.set(sum(os.path.getsize(self._path(name)) for name in self._segments()))
+
+    # Cursor
+    def _load_cursor(self):
+        try:
+            with open(self._path(CURSOR_FILE)) as f:
+                segment, offset = f.read().split()
+            if os.path.exists(self._path(segment)):
+                self._cursor_segment, self._cursor_offset = segment, int(offset)
+        except (OSError, ValueError):
+            pass
+
+    def _save_cursor(self):
+        # Not fsynced: losing it only means re-sending an already-published batch
+        tmp_path = self._path(CURSOR_FILE + ".tmp")
+        with open(tmp_path, "w") as f:
+            f.write(f"{self._cursor_segment} {self._cursor_offset}")
+        os.replace(tmp_path, self._path(CURSOR_FILE))
+
+    def _start_offset(self, name: str) -> int:
+        return self._cursor_offset if name == self._cursor_segment else 0
+
+    # Reading
+    def _read_records(self, name: str, offset: int, max_records: Optional[int] = None) -> Tuple[List[Any], int]:
+        """Read framed records from offset; stops at EOF or at a torn/corrupt record"""
+        records: List[Any] = []
+        with open(self._path(name), "rb") as f:
+            f.seek(offset)
+            while max_records is None or len(records) < max_records:
+                header = f.read(HEADER.size)
+                if len(header) < HEADER.size:
+                    break
+                length, crc = HEADER.unpack(header)
+                payload = f.read(length)
+                if len(payload) < length or zlib.crc32(payload) != crc:
+                    logger.warning("Discarding torn spool record", segment=name, offset=offset)
+                    break
+                records.append(json.loads(payload))
+                offset += HEADER.size + length
+        return records, offset
+
+    def _count_records(self, name: str) -> int:
+        records, _ = self._read_records(name, self._start_offset(name))
+        return len(records)
+
+    # Public API
+    def pending(self) -> int:
+        return self._records
+
+    def append_batch(self, records: List[Any]):
+        """Append records and fsync once for the whole batch"""
+        if not records:
+            return
+        frames = []
+        for record in records:
+            payload = json.dumps(record, separators=(",", ":")).encode("utf-8")
+            frames.append(HEADER.pack(len(payload), zlib.crc32(payload)) + payload)
+
+        f = self._open_active()
+        f.write(b"".join(frames))
+        f.flush()
+        os.fsync(f.fileno())
+
+        self._records += len(records)
+        spool_appended_counter.inc(len(records))
+        if f.tell() >= self.segment_max_bytes:
+            self._close_active()
+        self._update_gauges()
+
+    def read_batch(self, max_records: int) -> Tuple[List[Any], Optional[SpoolPosition]]:
+        """Read up to max_records from the oldest segment without consuming them"""
+        for name in self._segments():
+            records, end = self._read_records(name, self._start_offset(name), max_records)
+            if records:
+                return records, SpoolPosition(name, end, len(records))
+            if name != self._active_name:
+                # Fully consumed (or only a torn tail left)
+                self._drop_segment(name)
+        return [], None
+
+    def commit(self, position: SpoolPosition):
+        """Mark records up to position as published"""
+        self._records = max(0, self._records - position.records)
+        spool_replayed_counter.inc(position.records)
+
+        segment_size = os.path.getsize(self._path(position.segment))
+        if position.offset >= segment_size:
+            if position.segment == self._active_name:
+                self._close_active()
+            self._drop_segment(position.segment)
+        else:
+            self._cursor_segment, self._cursor_offset = position.segment, position.offset
+            self._save_cursor()
+        self._update_gauges()
+
+    def _drop_segment(self, name: str):
+        os.remove(self._path(name))
+        if name == self._cursor_segment:
+            self._cursor_segment, self._cursor_offset = None, 0
+            try:
+                os.remove(self._path(CURSOR_FILE))
+            except FileNotFoundError:
+                pass
+
+    def close(self):
+        self._close_active()
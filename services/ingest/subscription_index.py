@@ -0,0 +1,173 @@
+"""
+Per-organization webhook subscription index for worker fan-out
+- Active webhooks of an organization (id, url, secret, headers, event
+  filters, include_partials), cached in process memory and in Redis
+- Invalidated by the API on Webhook post_save/post_delete: the Redis copy is
+  deleted and an organization id is published to drop in-process copies
+- A version key guards against writing back rows read before an invalidation
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import structlog
+from prometheus_client import Counter
+
+logger = structlog.get_logger()
+
+# Metrics
+subscription_lookup_counter = Counter(
+    'webhook_subscription_lookups_total',
+    'Webhook subscription index lookups',
+    ['result']
+)
+
+# Shared with services/api/webhooks/subscriptions.py
+INDEX_KEY = "webhooks:subscriptions:{organization_id}"
+VERSION_KEY = "webhooks:subscriptions:version:{organization_id}"
+SUBSCRIPTIONS_CHANNEL = "webhooks:subscriptions"
+
+SUBSCRIPTIONS_QUERY = """
+    SELECT id, url, secret, headers_json, events, include_partials
+    FROM webhooks_webhook
+    WHERE organization_id = :organization_id AND active = true
+"""
+
+# Store the index only if no invalidation happened since the version was read
+STORE_IF_CURRENT_SCRIPT = """
+local version = redis.call('GET', KEYS[2]) or '0'
+if version ~= ARGV[1] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+return 1
+"""
+
+Subscription = Dict[str, Any]
+
+
+def wants(subscription: Subscription, event: str, partial: bool) -> bool:
+    """Whether a subscription receives this event"""
+    if partial and not subscription.get("include_partials"):
+        return False
+    events = subscription.get("events")
+    return not events or event in events
+
+
+class SubscriptionIndex:
+    """Two-level cache of active webhooks per organization, for a sync worker"""
+
+    def __init__(
+        self,
+        redis_client,
+        load: Callable[[str], List[Subscription]],
+        max_entries: int = 10000,
+        local_ttl_seconds: float = 60.0,
+        redis_ttl_seconds: int = 3600,
+    ):
+        self.redis = redis_client
+        self.load = load
+        self.max_entries = max_entries
+        self.local_ttl = local_ttl_seconds
+        self.redis_ttl = redis_ttl_seconds
+
+        # organization_id -> (expires_at, subscriptions)
+        self._entries: "OrderedDict[str, Tuple[float, List[Subscription]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._store_script = redis_client.register_script(STORE_IF_CURRENT_SCRIPT)
+        self._listener: Optional[threading.Thread] = None
+        self._pubsub = None
+        self._stopped = threading.Event()
+
+    def _set_local(self, organization_id: str, subscriptions: List[Subscription]):
+        with self._lock:
+            self._entries[organization_id] = (time.monotonic() + self.local_ttl, subscriptions)
+            self._entries.move_to_end(organization_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, organization_id: Optional[str] = None):
+        """Drop one organization, or everything when organization_id is None"""
+        with self._lock:
+            if organization_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(organization_id, None)
+
+    def get(self, organization_id: str) -> List[Subscription]:
+        with self._lock:
+            entry = self._entries.get(organization_id)
+            if entry is not None and entry[0] >= time.monotonic():
+                self._entries.move_to_end(organization_id)
+                subscription_lookup_counter.labels(result="local").inc()
+                return entry[1]
+
+        index_key = INDEX_KEY.format(organization_id=organization_id)
+        version_key = VERSION_KEY.format(organization_id=organization_id)
+        try:
+            cached, version = self.redis.mget(index_key, version_key)
+        except Exception as e:
+            # Redis trouble must not stop fan-out; go to the database
+            logger.warning("Subscription index unavailable", error=str(e))
+            cached, version = None, None
+        if cached is not None:
+            subscriptions = json.loads(cached)
+            subscription_lookup_counter.labels(result="redis").inc()
+            self._set_local(organization_id, subscriptions)
+            return subscriptions
+
+        subscription_lookup_counter.labels(result="database").inc()
+        subscriptions = self.load(organization_id)
+        try:
+            self._store_script(
+                keys=[index_key, version_key],
+                args=[version or "0", json.dumps(subscriptions, default=str), self.redis_ttl],
+            )
+        except Exception as e:
+            logger.warning("Failed to cache webhook subscriptions", error=str(e))
+        self._set_local(organization_id, subscriptions)
+        return subscriptions
+
+    # Invalidation messages from the API
+    def start(self):
+        self._stopped.clear()
+        self._listener = threading.Thread(target=self._listen, name="subscription-index", daemon=True)
+        self._listener.start()
+
+    def stop(self):
+        self._stopped.set()
+        pubsub = self._pubsub
+        if pubsub is not None:
+            try:
+                pubsub.close()
+            except Exception:
+                pass
+
+    def _listen(self):
+        while not self._stopped.is_set():
+            try:
+                self._pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+                self._pubsub.subscribe(SUBSCRIPTIONS_CHANNEL)
+                # Messages may have been missed while disconnected
+                self.invalidate()
+                while not self._stopped.is_set():
+                    message = self._pubsub.get_message(timeout=1.0)
+                    if message and message["type"] == "message":
+                        data = message["data"]
+                        self.invalidate(data.decode() if isinstance(data, bytes) else data)
+            except Exception as e:
+                if self._stopped.is_set():
+                    break
+                logger.warning("Subscription index listener disconnected", error=str(e))
+                # Local entries still expire on their own TTL
+                self._stopped.wait(1.0)
+            finally:
+                if self._pubsub is not None:
+                    try:
+                        self._pubsub.close()
+                    except Exception:
+                        pass
+                    self._pubsub = None
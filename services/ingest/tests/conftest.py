@@ -0,0 +1,8 @@
+import os
+import sys
+
+# Make the service modules (main, worker, publisher, ...) importable from tests
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# main.Settings requires an HMAC secret
+os.environ.setdefault("HMAC_SECRET", "dev-hmac-secret-change-in-production")
@@ -0,0 +1,139 @@
+"""
+Tests for the single round trip Redis admission script
+"""
+
+import asyncio
+from uuid import uuid4
+
+import fakeredis
+import pytest
+
+from admission import AdmissionPipeline, idempotency_slot
+
+
+@pytest.fixture
+def redis_client():
+    return fakeredis.FakeAsyncRedis(decode_responses=True)
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_allows_burst_then_limits(redis_client):
+    pipeline = AdmissionPipeline(rate_limit_per_minute=60, rate_limit_burst=5)
+    
+    results = [
+        await pipeline.admit(redis_client, "1.2.3.4", "form-1", str(uuid4()))
+        for _ in range(6)
+    ]
+    
+    assert [r.allowed for r in results] == [True] * 5 + [False]
+    assert 0 < results[-1].retry_after_ms <= 1000
+
+
+@pytest.mark.asyncio
+async def test_buckets_are_per_client_and_form(redis_client):
+    pipeline = AdmissionPipeline(rate_limit_per_minute=60, rate_limit_burst=1)
+    
+    assert (await pipeline.admit(redis_client, "1.2.3.4", "form-1", str(uuid4()))).allowed
+    assert not (await pipeline.admit(redis_client, "1.2.3.4", "form-1", str(uuid4()))).allowed
+    assert (await pipeline.admit(redis_client, "1.2.3.4", "form-2", str(uuid4()))).allowed
+    assert (await pipeline.admit(redis_client, "5.6.7.8", "form-1", str(uuid4()))).allowed
+
+
+@pytest.mark.asyncio
+async def test_committed_reservation_returns_first_submission(redis_client):
+    pipeline = AdmissionPipeline(rate_limit_per_minute=60, rate_limit_burst=1)
+    
+    first = await pipeline.admit(redis_client, "1.2.3.4", "form-1", "sub-1", "key-1")
+    await pipeline.commit(redis_client, "form-1", "sub-1", "key-1")
+    # Duplicates are answered even though the bucket is now empty
+    duplicate = await pipeline.admit(redis_client, "1.2.3.4", "form-1", "sub-2", "key-1")
+    
+    assert first.allowed and first.existing_submission_id is None
+    assert duplicate.allowed and duplicate.existing_submission_id == "sub-1"
+    assert not duplicate.in_progress
+
+
+@pytest.mark.asyncio
+async def test_concurrent_duplicate_waits_for_commit(redis_client):
+    pipeline = AdmissionPipeline(rate_limit_per_minute=60, rate_limit_burst=10, idempotency_wait_ms=1000)
+    
+    await pipeline.admit(redis_client, "1.2.3.4", "form-1", "sub-1", "key-1")
+    waiter = asyncio.create_task(pipeline.admit(redis_client, "1.2.3.4", "form-1", "sub-2", "key-1"))
+    await asyncio.sleep(0.1)
+    assert not waiter.done()
+    
+    await pipeline.commit(redis_client, "form-1", "sub-1", "key-1")
+    duplicate = await waiter
+    assert duplicate.existing_submission_id == "sub-1" and not duplicate.in_progress
+
+
+@pytest.mark.asyncio
+async def test_concurrent_duplicate_takes_over_released_key(redis_client):
+    pipeline = AdmissionPipeline(rate_limit_per_minute=60, rate_limit_burst=10, idempotency_wait_ms=1000)
+    
+    await pipeline.admit(redis_client, "1.2.3.4", "form-1", "sub-1", "key-1")
+    waiter = asyncio.create_task(pipeline.admit(redis_client, "1.2.3.4", "form-1", "sub-2", "key-1"))
+    await asyncio.sleep(0.1)
+    await pipeline.release(redis_client, "form-1", "sub-1", "key-1")
+    
+    retried = await waiter
+    assert retried.allowed and retried.existing_submission_id is None
+    await pipeline.commit(redis_client, "form-1", "sub-2", "key-1")
+    again = await pipeline.admit(redis_client, "1.2.3.4", "form-1", "sub-3", "key-1")
+    assert again.existing_submission_id == "sub-2"
+
+
+@pytest.mark.asyncio
+async def test_duplicate_wait_times_out_while_in_progress(redis_client):
+    pipeline = AdmissionPipeline(rate_limit_per_minute=60, rate_limit_burst=10, idempotency_wait_ms=100)
+    
+    await pipeline.admit(redis_client, "1.2.3.4", "form-1", "sub-1", "key-1")
+    duplicate = await pipeline.admit(redis_client, "1.2.3.4", "form-1", "sub-2", "key-1")
+    
+    assert duplicate.in_progress and duplicate.existing_submission_id == "sub-1"
+
+
+@pytest.mark.asyncio
+async def test_abandoned_reservation_is_taken_over(redis_client):
+    pipeline = AdmissionPipeline(
+        rate_limit_per_minute=60, rate_limit_burst=10, idempotency_pending_ttl_ms=50, idempotency_wait_ms=0
+    )
+    
+    await pipeline.admit(redis_client, "1.2.3.4", "form-1", "sub-1", "key-1")
+    await asyncio.sleep(0.1)
+    retried = await pipeline.admit(redis_client, "1.2.3.4", "form-1", "sub-2", "key-1")
+    
+    assert retried.allowed and retried.existing_submission_id is None
+
+
+@pytest.mark.asyncio
+async def test_release_and_commit_only_touch_own_reservation(redis_client):
+    pipeline = AdmissionPipeline(rate_limit_per_minute=60, rate_limit_burst=10, idempotency_wait_ms=0)
+    
+    await pipeline.admit(redis_client, "1.2.3.4", "form-1", "sub-1", "key-1")
+    await pipeline.release(redis_client, "form-1", "sub-other", "key-1")
+    await pipeline.commit(redis_client, "form-1", "sub-other", "key-1")
+    assert (await pipeline.admit(redis_client, "1.2.3.4", "form-1", "sub-2", "key-1")).in_progress
+    
+    await pipeline.release(redis_client, "form-1", "sub-1", "key-1")
+    assert (await pipeline.admit(redis_client, "1.2.3.4", "form-1", "sub-2", "key-1")).existing_submission_id is None
+
+
+def test_idempotency_slots_are_bucketed_per_window():
+    slot = idempotency_slot("form-1", "key-1", buckets=16, window_seconds=100, now=1050)
+    same = idempotency_slot("form-1", "key-1", buckets=16, window_seconds=100, now=1099)
+    later = idempotency_slot("form-1", "key-1", buckets=16, window_seconds=100, now=1100)
+    
+    assert slot == same
+    assert slot.current_bucket.startswith("idem:10:") and slot.previous_bucket.startswith("idem:9:")
+    assert int(slot.current_bucket.rsplit(":", 1)[1]) < 16
+    assert len(slot.field) == 8
+    assert slot.expire_at_ms == 1200 * 1000
+    # The next window still checks the bucket the key was written to
+    assert later.previous_bucket == slot.current_bucket and later.field == slot.field
+
+
+@pytest.mark.parametrize("rate_limit_per_minute", [0, -5])
+def test_rate_limit_must_be_positive(rate_limit_per_minute):
+    with pytest.raises(ValueError):
+        AdmissionPipeline(rate_limit_per_minute=rate_limit_per_minute, rate_limit_burst=5)
@@ -0,0 +1,138 @@
+"""
+Tests for the worker-side analytics buffer
+"""
+
+import json
+import time
+
+import fakeredis
+import httpx
+
+from analytics_buffer import RETRY_LIST_KEY, AnalyticsBuffer
+
+
+class FakeAnalytics:
+    def __init__(self):
+        self.batches = []
+        self.status_code = 200
+        self.down = False
+
+    def post(self, url, json=None, headers=None):
+        if self.down:
+            raise httpx.ConnectError("connection refused")
+        request = httpx.Request("POST", url)
+        if self.status_code == 200:
+            self.batches.append(json)
+        return httpx.Response(self.status_code, request=request, text="nope")
+
+
+def make_buffer(service, **kwargs):
+    return AnalyticsBuffer(
+        service.post,
+        "http://analytics/events/batch",
+        redis_client=fakeredis.FakeRedis(),
+        retry_backoff_seconds=0,
+        **kwargs
+    )
+
+
+def test_flushes_by_count_and_on_close():
+    service = FakeAnalytics()
+    buffer = make_buffer(service, max_events=3)
+
+    for i in range(4):
+        buffer.add({"submission_id": i})
+    assert service.batches == [[{"submission_id": 0}, {"submission_id": 1}, {"submission_id": 2}]]
+
+    buffer.close()
+    assert service.batches[-1] == [{"submission_id": 3}]
+
+
+def test_flushes_by_age_in_the_background():
+    service = FakeAnalytics()
+    buffer = make_buffer(service, max_events=100, max_age_ms=50)
+    buffer.start()
+    try:
+        buffer.add({"submission_id": 1})
+        deadline = time.monotonic() + 2
+        while not service.batches and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        buffer.close()
+
+    assert service.batches == [[{"submission_id": 1}]]
+
+
+def test_outage_spills_to_redis_and_replays_in_order():
+    service = FakeAnalytics()
+    buffer = make_buffer(service, max_events=2)
+
+    service.down = True
+    buffer.add({"submission_id": 1})
+    buffer.add({"submission_id": 2})
+    service.down = False
+    service.status_code = 503
+    buffer.add({"submission_id": 3})
+    buffer.flush()
+    assert buffer.redis.llen(RETRY_LIST_KEY) == 2
+    assert json.loads(buffer.redis.lindex(RETRY_LIST_KEY, 0)) == {
+        "attempts": 0,
+        "events": [{"submission_id": 1}, {"submission_id": 2}],
+    }
+
+    # Still failing: the batch goes back to the head of the list
+    assert buffer.replay_spilled() == 0
+    assert buffer.redis.llen(RETRY_LIST_KEY) == 2
+
+    service.status_code = 200
+    assert buffer.replay_spilled() == 3
+    assert service.batches == [[{"submission_id": 1}, {"submission_id": 2}], [{"submission_id": 3}]]
+    assert buffer.redis.llen(RETRY_LIST_KEY) == 0
+
+
+def test_rejected_batches_are_dropped_not_spilled():
+    service = FakeAnalytics()
+    service.status_code = 422
+    buffer = make_buffer(service)
+
+    buffer.add({"submission_id": 1})
+    buffer.flush()
+
+    assert buffer.redis.llen(RETRY_LIST_KEY) == 0
+
+
+def test_batch_failing_with_server_errors_is_dropped_after_max_attempts():
+    service = FakeAnalytics()
+    service.status_code = 500
+    buffer = make_buffer(service, max_events=1, retry_max_attempts=3)
+
+    buffer.add({"submission_id": 1})
+    service.down = True
+    buffer.add({"submission_id": 2})
+    service.down = False
+    assert [json.loads(raw)["attempts"] for raw in buffer.redis.lrange(RETRY_LIST_KEY, 0, -1)] == [1, 0]
+
+    # Unreachable is not the batch's fault: no attempt is used up
+    service.down = True
+    assert buffer.replay_spilled() == 0
+    assert json.loads(buffer.redis.lindex(RETRY_LIST_KEY, 0))["attempts"] == 1
+
+    service.down = False
+    assert buffer.replay_spilled() == 0
+    assert json.loads(buffer.redis.lindex(RETRY_LIST_KEY, 0))["attempts"] == 2
+    # Third server error: the batch is dropped and no longer holds up the next one
+    assert buffer.replay_spilled() == 0
+    assert [json.loads(raw)["events"] for raw in buffer.redis.lrange(RETRY_LIST_KEY, 0, -1)] == [[{"submission_id": 2}]]
+
+    service.status_code = 200
+    assert buffer.replay_spilled() == 1
+    assert service.batches == [[{"submission_id": 2}]]
+
+
+def test_batches_spilled_before_attempts_were_counted_are_replayed():
+    service = FakeAnalytics()
+    buffer = make_buffer(service)
+    buffer.redis.rpush(RETRY_LIST_KEY, json.dumps([{"submission_id": 1}]))
+
+    assert buffer.replay_spilled() == 1
+    assert service.batches == [[{"submission_id": 1}]]
@@ -0,0 +1,125 @@
+"""
+Tests for compiled per form version answer validators
+"""
+
+import asyncio
+
+import pytest
+
+from answer_validation import MAX_REPORTED_ERRORS, ValidatorCache, compile_schema
+
+SCHEMA = {
+    "pages": [
+        {
+            "id": "page-1",
+            "blocks": [
+                {"id": "name", "type": "text", "required": True, "properties": {"maxLength": 10}},
+                {"id": "email", "type": "email", "required": True},
+                {"id": "age", "type": "number"},
+                {"id": "topics", "type": "checkboxGroup", "properties": {"maxSelections": 2}},
+                {"id": "plan", "type": "dropdown"},
+                {"id": "extras", "type": "select", "properties": {"allowMultiple": True}},
+                {"id": "agree", "type": "checkbox"},
+                {"id": "address", "type": "address"},
+            ],
+        }
+    ]
+}
+
+
+def test_valid_answers_pass():
+    validator = compile_schema(SCHEMA)
+
+    assert validator.validate({
+        "name": "Ada",
+        "email": "ada@example.com",
+        "age": "42",
+        "topics": ["a", "b"],
+        "plan": "pro",
+        "extras": ["x"],
+        "agree": True,
+        "address": {"city": "Paris"},
+    }) == []
+
+
+def test_reports_unknown_blocks_types_and_sizes():
+    validator = compile_schema(SCHEMA)
+
+    errors = validator.validate({
+        "name": "x" * 11,
+        "email": "not-an-email",
+        "age": True,
+        "topics": ["a", "b", "c"],
+        "plan": ["pro"],
+        "agree": "yes",
+        "nope": 1,
+    })
+
+    assert errors == [
+        "name: longer than 10 characters",
+        "email: not a valid email address",
+        "age: expected a number",
+        "topics: more than 2 items",
+        "plan: expected a string",
+        "agree: expected true or false",
+        "nope: unknown block",
+    ]
+
+
+def test_nps_accepts_a_score_or_score_with_feedback():
+    validator = compile_schema({"blocks": [{"id": "nps", "type": "nps"}]})
+
+    assert validator.validate({"nps": 9}) == []
+    assert validator.validate({"nps": {"score": 9, "feedback": "Fast support"}}) == []
+    assert validator.validate({"nps": {"score": "7"}}) == []
+    assert validator.validate({"nps": {"feedback": "no score"}}) == ["nps: expected a numeric score"]
+    assert validator.validate({"nps": {"score": 3, "feedback": 5}}) == ["nps: expected feedback as a string"]
+    assert validator.validate({"nps": "great"}) == ["nps: expected a number or {score, feedback}"]
+
+
+def test_required_blocks_are_skipped_for_partial_saves():
+    validator = compile_schema(SCHEMA)
+
+    assert validator.validate({"name": "Ada", "email": ""}) == ["email: required"]
+    assert validator.validate({"name": "Ada"}, partial=True) == []
+
+
+def test_logic_that_can_hide_blocks_disables_required_checks():
+    schema = {
+        "blocks": [{"id": "q1", "type": "text", "required": True}],
+        "logic": [{"id": "r1", "conditions": [], "actions": [{"type": "hide", "target": "q1"}]}],
+    }
+
+    assert compile_schema(schema).validate({}) == []
+
+
+def test_schema_without_blocks_accepts_anything():
+    assert compile_schema({"blocks": [], "settings": {}}).validate({"anything": [1, 2]}) == []
+
+
+def test_error_report_is_capped():
+    validator = compile_schema({"blocks": [{"id": "q", "type": "text"}]})
+
+    errors = validator.validate({f"unknown-{i}": 1 for i in range(50)})
+    assert len(errors) == MAX_REPORTED_ERRORS
+
+
+@pytest.mark.asyncio
+async def test_cache_compiles_once_per_version_and_invalidates_by_form(monkeypatch):
+    cache = ValidatorCache("postgresql://unused")
+    loads = []
+
+    def load(form_id, version):
+        loads.append((form_id, version))
+        return compile_schema(SCHEMA) if version == 1 else None
+
+    monkeypatch.setattr(cache, "_load", load)
+
+    first, second = await asyncio.gather(cache.get("form-1", 1), cache.get("form-1", 1))
+    assert first is second and first is not None
+    assert await cache.get("form-1", 2) is None
+    assert loads == [("form-1", 1), ("form-1", 2)]
+
+    cache.invalidate("form-1")
+    await cache.get("form-1", 1)
+    assert loads[-1] == ("form-1", 1) and len(loads) == 3
@@ -0,0 +1,211 @@
+"""
+Tests for the POST /submit/batch endpoint
+"""
+
+import json
+import time
+from uuid import uuid4
+
+import fakeredis
+import httpx
+import pytest
+from prometheus_client import REGISTRY
+
+import main
+from answer_validation import compile_schema
+from form_registry import FormInfo
+from publisher import PublisherBackpressure
+
+PUBLISHED_FORM = str(uuid4())
+UNKNOWN_FORM = str(uuid4())
+
+
+class RecordingPublisher:
+    def __init__(self, backpressure=False):
+        self.groups = []
+        self.backpressure = backpressure
+
+    async def publish_group(self, items):
+        if self.backpressure:
+            raise PublisherBackpressure("Publish buffer is full")
+        self.groups.append(list(items))
+
+
+@pytest.fixture
+def publisher(monkeypatch):
+    recording = RecordingPublisher()
+    monkeypatch.setattr(main, "submission_publisher", recording)
+    return recording
+
+
+@pytest.fixture
+def client(monkeypatch, publisher):
+    monkeypatch.setattr(main, "redis_client", fakeredis.FakeAsyncRedis(decode_responses=True))
+
+    async def validate_form_exists(form_id):
+        if form_id == PUBLISHED_FORM:
+            return True, FormInfo(PUBLISHED_FORM, "org-1", 1, "pro")
+        return False, None
+
+    monkeypatch.setattr(main, "validate_form_exists", validate_form_exists)
+
+    validator = compile_schema({"blocks": [{"id": "q1", "type": "text", "properties": {"maxLength": 5}}]})
+
+    async def get_validator(form_id, version):
+        return validator
+
+    monkeypatch.setattr(main.answer_validators, "get", get_validator)
+    transport = httpx.ASGITransport(app=main.app)
+    return httpx.AsyncClient(transport=transport, base_url="http://ingest")
+
+
+def submission(form_id=PUBLISHED_FORM, idempotency_key=None, **data):
+    return {
+        "data": {"form_id": form_id, "respondent_key": f"r-{uuid4()}", "answers": {"q1": "a"}, **data},
+        "idempotency_key": idempotency_key,
+        # Queued offline long ago; only the batch timestamp is checked
+        "timestamp": int(time.time()) - 7 * 86400,
+    }
+
+
+async def post_batch(client, submissions, timestamp=None):
+    body = json.dumps({
+        "submissions": submissions,
+        "timestamp": int(time.time()) if timestamp is None else timestamp,
+    }).encode()
+    signature = main.generate_hmac_signature(body, main.settings.hmac_secret)
+    return await client.post(
+        "/submit/batch",
+        content=body,
+        headers={"Content-Type": "application/json", "X-Forms-Signature": signature},
+    )
+
+
+@pytest.mark.asyncio
+async def test_batch_is_queued_as_one_group_with_per_item_results(client, publisher):
+    response = await post_batch(client, [
+        submission(idempotency_key="k1"),
+        submission(form_id=UNKNOWN_FORM),
+        {"data": {"form_id": PUBLISHED_FORM}},
+        submission(partial=True),
+    ])
+
+    assert response.status_code == 200
+    payload = response.json()
+    assert [r["status"] for r in payload["results"]] == ["queued", "not_found", "invalid", "queued"]
+    assert payload["queued"] == 2 and payload["success"] is False
+
+    [group] = publisher.groups
+    assert [submission_id for _, submission_id in group] == [
+        payload["results"][0]["submission_id"],
+        payload["results"][3]["submission_id"],
+    ]
+    data, _ = group[0]
+    assert data["organization_id"] == "org-1"
+    assert group[1][0]["metadata"]["partial"] is True
+
+
+@pytest.mark.asyncio
+async def test_batch_records_stage_timings_and_top_forms(client, publisher):
+    def stage_count(stage):
+        return REGISTRY.get_sample_value(
+            "submission_stage_seconds_count", {"endpoint": "batch", "stage": stage}
+        ) or 0
+
+    stages = ["body_read", "hmac", "parse", "form_lookup", "answer_validation", "admission", "publish", "response"]
+    before = [stage_count(stage) for stage in stages]
+    queued_before = main.top_forms.counts.get(PUBLISHED_FORM, 0)
+
+    await post_batch(client, [submission(), submission()])
+
+    assert [stage_count(stage) for stage in stages] == [count + 1 for count in before]
+    assert main.top_forms.counts[PUBLISHED_FORM] == queued_before + 2
+
+
+@pytest.mark.asyncio
+async def test_batch_deduplicates_within_and_across_batches(client, publisher):
+    first = await post_batch(client, [submission(idempotency_key="k1"), submission(idempotency_key="k1")])
+    results = first.json()["results"]
+    assert [r["status"] for r in results] == ["queued", "duplicate"]
+    assert results[1]["submission_id"] == results[0]["submission_id"]
+
+    replay = await post_batch(client, [submission(idempotency_key="k1")])
+    assert replay.json()["results"][0] == {
+        "index": 0,
+        "status": "duplicate",
+        "submission_id": results[0]["submission_id"],
+        "message": "Submission already processed (idempotent)",
+        "retry_after_ms": None,
+    }
+    assert len(publisher.groups) == 1
+
+
+@pytest.mark.asyncio
+async def test_batch_items_over_the_rate_limit_are_reported(client, publisher, monkeypatch):
+    monkeypatch.setattr(main, "admission", main.AdmissionPipeline(rate_limit_per_minute=60, rate_limit_burst=2))
+
+    response = await post_batch(client, [submission() for _ in range(3)])
+
+    results = response.json()["results"]
+    assert [r["status"] for r in results] == ["queued", "queued", "rate_limited"]
+    assert results[2]["retry_after_ms"] > 0
+
+
+@pytest.mark.asyncio
+async def test_batch_items_with_invalid_answers_are_not_queued(client, publisher):
+    bad = submission()
+    bad["data"]["answers"] = {"q1": "too long", "q9": 1}
+
+    response = await post_batch(client, [bad, submission()])
+
+    results = response.json()["results"]
+    assert results[0]["status"] == "invalid"
+    assert results[0]["message"] == "Invalid answers: q1: longer than 5 characters; q9: unknown block"
+    assert results[1]["status"] == "queued"
+    assert len(publisher.groups[0]) == 1
+
+
+@pytest.mark.asyncio
+async def test_load_shedding_defers_partial_items_then_sheds_batches(client, publisher, monkeypatch):
+    controller = main.AdmissionController(defer_partial_queue_depth=10, shed_queue_depth=100)
+    monkeypatch.setattr(main, "admission_controller", controller)
+
+    controller.sample = main.load_shedding.LoadSample(50, 0, 0, time.monotonic())
+    response = await post_batch(client, [submission(partial=True), submission()])
+    results = response.json()["results"]
+    assert [r["status"] for r in results] == ["deferred", "queued"]
+    assert results[0]["retry_after_ms"] == 30000
+
+    controller.sample = main.load_shedding.LoadSample(500, 0, 0, time.monotonic())
+    shed = await post_batch(client, [submission()])
+    assert shed.status_code == 503
+    assert shed.headers["Retry-After"] == "5"
+
+
+@pytest.mark.asyncio
+async def test_batch_backpressure_releases_reservations(client, publisher):
+    publisher.backpressure = True
+    response = await post_batch(client, [submission(idempotency_key="k1")])
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+    publisher.backpressure = False
+    retried = await post_batch(client, [submission(idempotency_key="k1")])
+    assert retried.json()["results"][0]["status"] == "queued"
+
+
+@pytest.mark.asyncio
+async def test_batch_rejects_bad_signature_stale_timestamp_and_oversize(client, monkeypatch):
+    response = await client.post(
+        "/submit/batch",
+        content=b'{"submissions": [], "timestamp": 0}',
+        headers={"X-Forms-Signature": "sha256=bad"},
+    )
+    assert response.status_code == 401
+
+    stale = await post_batch(client, [submission()], timestamp=int(time.time()) - 3600)
+    assert stale.status_code == 401
+
+    monkeypatch.setattr(main.settings, "batch_max_submissions", 2)
+    oversize = await post_batch(client, [submission() for _ in range(3)])
+    assert oversize.status_code == 413
@@ -0,0 +1,85 @@
+"""
+Tests for the in-process published-form registry
+"""
+
+from unittest.mock import patch
+from uuid import uuid4
+
+import pytest
+
+from form_registry import FormInfo, FormRegistry
+
+
+def make_info(form_id=None, version=1):
+    return FormInfo(
+        form_id=form_id or str(uuid4()),
+        organization_id=str(uuid4()),
+        version=version,
+        plan="pro"
+    )
+
+
+@pytest.fixture
+def registry():
+    return FormRegistry("postgresql://unused/db", max_entries=3)
+
+
+@pytest.mark.asyncio
+async def test_malformed_form_id_rejected_without_db(registry):
+    with patch.object(registry, "_load_one") as load_one:
+        assert await registry.get("not-a-uuid") is None
+    load_one.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_miss_loads_once_then_hits(registry):
+    info = make_info()
+    with patch.object(registry, "_load_one", return_value=info) as load_one:
+        assert await registry.get(info.form_id) == info
+        assert await registry.get(info.form_id) == info
+    load_one.assert_called_once_with(info.form_id)
+
+
+@pytest.mark.asyncio
+async def test_unknown_form_is_negatively_cached(registry):
+    form_id = str(uuid4())
+    with patch.object(registry, "_load_one", return_value=None) as load_one:
+        assert await registry.get(form_id) is None
+        assert await registry.get(form_id) is None
+    load_one.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_publish_and_unpublish_messages(registry):
+    info = make_info(version=3)
+    registry.apply({
+        "action": "publish",
+        "form_id": info.form_id,
+        "organization_id": info.organization_id,
+        "version": 3,
+        "plan": "pro"
+    })
+    with patch.object(registry, "_load_one") as load_one:
+        assert await registry.get(info.form_id) == info
+        
+        registry.apply({"action": "unpublish", "form_id": info.form_id})
+        assert await registry.get(info.form_id) is None
+    load_one.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_lru_eviction(registry):
+    infos = [make_info() for _ in range(4)]
+    for info in infos:
+        registry.apply({
+            "action": "publish",
+            "form_id": info.form_id,
+            "organization_id": info.organization_id,
+            "version": 1,
+            "plan": "pro"
+        })
+    
+    with patch.object(registry, "_load_one", return_value=None) as load_one:
+        assert await registry.get(infos[0].form_id) is None
+        assert await registry.get(infos[3].form_id) == infos[3]
+    load_one.assert_called_once_with(infos[0].form_id)
@@ -0,0 +1,71 @@
+"""
+Tests for the pooled worker HTTP clients
+"""
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from prometheus_client import REGISTRY
+
+from http_clients import HTTPClientRegistry
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(204)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def pool_requests(client, connection):
+    return REGISTRY.get_sample_value(
+        "worker_http_requests_total", {"client": client, "connection": connection}
+    ) or 0
+
+
+def test_requests_reuse_the_origin_pool(server_url):
+    registry = HTTPClientRegistry("test-reuse")
+    try:
+        for path in ("/a", "/b", "/c"):
+            assert registry.post(f"{server_url}{path}", content=b"{}").status_code == 204
+
+        assert registry.client_for(f"{server_url}/d") is registry.client_for(server_url)
+        assert pool_requests("test-reuse", "new") == 1
+        assert pool_requests("test-reuse", "reused") == 2
+    finally:
+        registry.close()
+
+
+def test_least_recently_used_origins_are_closed():
+    registry = HTTPClientRegistry("test-evict", max_hosts=2)
+    first = registry.client_for("https://one.example/hook")
+    registry.client_for("https://two.example/hook")
+    registry.client_for("https://one.example/other")
+    registry.client_for("https://three.example/hook")
+
+    assert not first.is_closed
+    assert set(origin[1] for origin in registry._clients) == {"one.example", "three.example"}
+    registry.close()
+    assert first.is_closed
+
+
+def test_http2_falls_back_without_h2(monkeypatch):
+    monkeypatch.setattr("importlib.util.find_spec", lambda name: None)
+    assert HTTPClientRegistry("test-h2", http2=True).http2 is False
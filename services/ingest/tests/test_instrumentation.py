@@ -0,0 +1,70 @@
+"""
+Tests for stage timing and the top-K form tracker
+"""
+
+import httpx
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+
+from instrumentation import StageTimingMiddleware, TopFormsCollector, TopKTracker, stage_timer
+
+
+def test_top_k_keeps_heavy_hitters_in_bounded_memory():
+    tracker = TopKTracker(capacity=10)
+    for _ in range(100):
+        tracker.add("hot")
+    for _ in range(50):
+        tracker.add("warm")
+    for i in range(200):
+        tracker.add(f"cold-{i}")
+
+    assert len(tracker.counts) == 10
+    assert [key for key, _ in tracker.top(2)] == ["hot", "warm"]
+    assert tracker.counts["hot"] == 100 and tracker.errors["hot"] == 0
+
+    # A newcomer inherits the evicted count and records it as its error bound
+    assert tracker.counts["cold-199"] - tracker.errors["cold-199"] == 1
+
+
+def test_collector_exports_tracked_forms_only():
+    tracker = TopKTracker(capacity=2)
+    for key in ["a", "a", "b", "c"]:
+        tracker.add(key)
+
+    counts, errors = TopFormsCollector(tracker).collect()
+    assert {s.labels["form_id"]: s.value for s in counts.samples} == {"a": 2, "c": 2}
+    assert {s.labels["form_id"]: s.value for s in errors.samples} == {"a": 0, "c": 1}
+
+
+def build_app(sample_rate):
+    async def submit(request):
+        timer = stage_timer(request)
+        await request.body()
+        timer.mark("body_read")
+        timer.mark("hmac")
+        return PlainTextResponse("ok")
+
+    app = Starlette(routes=[Route("/submit/{form_id}", submit, methods=["POST"])])
+    return StageTimingMiddleware(app, sample_rate=sample_rate)
+
+
+@pytest.mark.asyncio
+async def test_sampled_requests_echo_the_stage_breakdown():
+    transport = httpx.ASGITransport(app=build_app(sample_rate=1.0))
+    async with httpx.AsyncClient(transport=transport, base_url="http://ingest") as client:
+        response = await client.post("/submit/form-1", content=b"{}")
+
+    stages = [part.split(";")[0] for part in response.headers["Server-Timing"].split(", ")]
+    assert stages == ["body_read", "hmac", "response", "total"]
+
+
+@pytest.mark.asyncio
+async def test_unsampled_requests_have_no_timing_header():
+    transport = httpx.ASGITransport(app=build_app(sample_rate=0.0))
+    async with httpx.AsyncClient(transport=transport, base_url="http://ingest") as client:
+        response = await client.post("/submit/form-1", content=b"{}")
+
+    assert response.status_code == 200
+    assert "Server-Timing" not in response.headers
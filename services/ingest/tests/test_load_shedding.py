@@ -0,0 +1,61 @@
+"""
+Tests for the load shedding admission controller
+"""
+
+import time
+
+import fakeredis
+import pytest
+
+from load_shedding import DEFER_PARTIAL, NORMAL, SHED, WORKER_LAG_KEY, AdmissionController, LoadSample
+
+
+def controller_with(queue_depth=0, worker_lag_ms=0, local_backlog=0, age=0.0, **kwargs):
+    controller = AdmissionController(
+        defer_partial_queue_depth=100,
+        shed_queue_depth=1000,
+        defer_partial_lag_ms=1000,
+        shed_lag_ms=10000,
+        defer_partial_local_backlog=50,
+        shed_local_backlog=90,
+        **kwargs
+    )
+    controller.sample = LoadSample(queue_depth, worker_lag_ms, local_backlog, time.monotonic() - age)
+    return controller
+
+
+def test_levels_follow_the_worst_signal():
+    assert controller_with().level() == NORMAL
+    assert controller_with(queue_depth=100).level() == DEFER_PARTIAL
+    assert controller_with(worker_lag_ms=1500).level() == DEFER_PARTIAL
+    assert controller_with(queue_depth=100, local_backlog=95).level() == SHED
+    assert controller_with(worker_lag_ms=10000).level() == SHED
+
+
+def test_partials_are_deferred_before_new_traffic_is_shed():
+    deferring = controller_with(queue_depth=500, partial_retry_after_seconds=30)
+    assert deferring.decide(partial=False) is None
+    assert deferring.decide(partial=True) == ("defer_partial", 30)
+
+    shedding = controller_with(queue_depth=5000, shed_retry_after_seconds=5)
+    assert shedding.decide(partial=False) == ("shed", 5)
+    assert shedding.decide(partial=True) == ("shed", 5)
+
+
+def test_stale_or_missing_samples_fail_open():
+    assert AdmissionController().decide(partial=True) is None
+    assert controller_with(queue_depth=5000, age=60).decide(partial=False) is None
+
+
+@pytest.mark.asyncio
+async def test_sample_reads_queue_depth_and_worker_lag():
+    broker = fakeredis.FakeAsyncRedis(decode_responses=True)
+    await broker.rpush("submissions", *range(7))
+    await broker.set(WORKER_LAG_KEY, 2500)
+    controller = AdmissionController(local_backlog=lambda: 3)
+
+    sample = await controller.take_sample(broker)
+
+    assert (sample.queue_depth, sample.worker_lag_ms, sample.local_backlog) == (7, 2500, 3)
+    # No broker to sample (e.g. memory transport): local backlog only
+    assert (await controller.take_sample(None)).queue_depth == 0
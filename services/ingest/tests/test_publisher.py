@@ -0,0 +1,122 @@
+"""
+Tests for the micro-batching submission publisher
+"""
+
+import asyncio
+import threading
+import time
+from unittest.mock import MagicMock
+
+import pytest
+
+from publisher import BATCH_TASK_NAME, BatchingPublisher, PublisherBackpressure
+
+
+def make_celery(block: threading.Event = None):
+    celery_app = MagicMock()
+    
+    def send_task(*args, **kwargs):
+        if block is not None:
+            block.wait()
+    
+    celery_app.send_task.side_effect = send_task
+    return celery_app
+
+
+def published_ids(celery_app):
+    ids = []
+    for call in celery_app.send_task.call_args_list:
+        assert call.args[0] == BATCH_TASK_NAME
+        ids.extend(submission_id for _, submission_id in call.kwargs["args"][0])
+    return ids
+
+
+@pytest.mark.asyncio
+async def test_flushes_by_batch_size():
+    celery_app = make_celery()
+    publisher = BatchingPublisher(celery_app, max_batch_size=10, max_linger_ms=1000)
+    publisher.start()
+    
+    for i in range(30):
+        await publisher.publish({"id": str(i)}, str(i))
+    
+    # Full batches must not wait for the linger timeout
+    deadline = time.monotonic() + 0.5
+    while celery_app.send_task.call_count < 3 and time.monotonic() < deadline:
+        await asyncio.sleep(0.01)
+    publisher.stop()
+    
+    assert celery_app.send_task.call_count == 3
+    assert published_ids(celery_app) == [str(i) for i in range(30)]
+
+
+@pytest.mark.asyncio
+async def test_flushes_by_linger_time():
+    celery_app = make_celery()
+    publisher = BatchingPublisher(celery_app, max_batch_size=100, max_linger_ms=20)
+    publisher.start()
+    
+    await publisher.publish({"id": "a"}, "a")
+    await asyncio.sleep(0.2)
+    
+    assert celery_app.send_task.call_count == 1
+    publisher.stop()
+
+
+@pytest.mark.asyncio
+async def test_stop_flushes_buffered_submissions():
+    celery_app = make_celery()
+    publisher = BatchingPublisher(celery_app, max_batch_size=100, max_linger_ms=10000)
+    publisher.start()
+    
+    for i in range(5):
+        await publisher.publish({"id": str(i)}, str(i))
+    publisher.stop()
+    
+    assert published_ids(celery_app) == [str(i) for i in range(5)]
+
+
+@pytest.mark.asyncio
+async def test_backpressure_when_buffer_full():
+    release = threading.Event()
+    celery_app = make_celery(block=release)
+    publisher = BatchingPublisher(
+        celery_app,
+        max_batch_size=1,
+        max_linger_ms=0,
+        buffer_size=2,
+        enqueue_timeout_ms=50
+    )
+    publisher.start()
+    
+    # First item is taken by the (blocked) publisher thread, two fill the buffer
+    for i in range(3):
+        await publisher.publish({"id": str(i)}, str(i))
+        await asyncio.sleep(0.02)
+    
+    with pytest.raises(PublisherBackpressure):
+        await publisher.publish({"id": "overflow"}, "overflow")
+    
+    release.set()
+    publisher.stop()
+    assert published_ids(celery_app) == ["0", "1", "2"]
+
+
+@pytest.mark.asyncio
+async def test_group_is_published_as_its_own_task():
+    celery_app = make_celery()
+    publisher = BatchingPublisher(celery_app, max_batch_size=3, max_linger_ms=50)
+    publisher.start()
+    
+    await publisher.publish({"id": "a"}, "a")
+    await publisher.publish_group([({"id": f"g{i}"}, f"g{i}") for i in range(5)])
+    await publisher.publish({"id": "b"}, "b")
+    await asyncio.sleep(0.3)
+    publisher.stop()
+    
+    batches = [
+        [submission_id for _, submission_id in call.kwargs["args"][0]]
+        for call in celery_app.send_task.call_args_list
+    ]
+    # Larger than max_batch_size, but never split or merged
+    assert batches == [["a"], ["g0", "g1", "g2", "g3", "g4"], ["b"]]
@@ -0,0 +1,101 @@
+"""
+Tests for the durable local submission spool
+"""
+
+import asyncio
+import os
+import threading
+import time
+from unittest.mock import MagicMock
+
+import pytest
+
+from publisher import BatchingPublisher
+from spool import SegmentSpool
+
+
+def drain(spool, batch_size=10):
+    replayed = []
+    while True:
+        records, position = spool.read_batch(batch_size)
+        if not records:
+            return replayed
+        replayed.extend(records)
+        spool.commit(position)
+
+
+def test_replays_in_append_order_across_segments(tmp_path):
+    spool = SegmentSpool(str(tmp_path), segment_max_bytes=200)
+    for i in range(10):
+        spool.append_batch([[{"id": str(i)}, str(i)]])
+    
+    assert spool.pending() == 10
+    assert len(os.listdir(tmp_path)) > 1
+    assert [record[1] for record in drain(spool, batch_size=3)] == [str(i) for i in range(10)]
+    assert spool.pending() == 0
+    assert not [name for name in os.listdir(tmp_path) if name.startswith("segment-")]
+
+
+def test_pending_records_survive_restart(tmp_path):
+    spool = SegmentSpool(str(tmp_path))
+    spool.append_batch([[{"id": str(i)}, str(i)] for i in range(5)])
+    records, position = spool.read_batch(2)
+    spool.commit(position)
+    spool.close()
+    
+    reopened = SegmentSpool(str(tmp_path))
+    assert reopened.pending() == 3
+    assert [record[1] for record in drain(reopened)] == ["2", "3", "4"]
+
+
+def test_torn_tail_is_discarded(tmp_path):
+    spool = SegmentSpool(str(tmp_path))
+    spool.append_batch([[{"id": "a"}, "a"], [{"id": "b"}, "b"]])
+    spool.close()
+    
+    segment = next(name for name in os.listdir(tmp_path) if name.startswith("segment-"))
+    with open(tmp_path / segment, "ab") as f:
+        f.write(b"\x00\x00\x01\x00partial")
+    
+    reopened = SegmentSpool(str(tmp_path))
+    assert reopened.pending() == 2
+    assert [record[1] for record in drain(reopened)] == ["a", "b"]
+
+
+@pytest.mark.asyncio
+async def test_publisher_spools_while_broker_down_and_replays_in_order(tmp_path):
+    broker_up = threading.Event()
+    sent = []
+    
+    def send_task(name, args, queue, retry):
+        if not broker_up.is_set():
+            raise ConnectionError("broker unreachable")
+        sent.extend(submission_id for _, submission_id in args[0])
+    
+    celery_app = MagicMock()
+    celery_app.send_task.side_effect = send_task
+    spool = SegmentSpool(str(tmp_path))
+    publisher = BatchingPublisher(
+        celery_app,
+        max_batch_size=5,
+        max_linger_ms=5,
+        retry_delay_seconds=0.05,
+        spool=spool
+    )
+    publisher.start()
+    
+    for i in range(10):
+        await publisher.publish({"id": str(i)}, str(i))
+    await asyncio.sleep(0.1)
+    assert sent == []
+    assert spool.pending() == 10
+    
+    broker_up.set()
+    await publisher.publish({"id": "10"}, "10")
+    deadline = time.monotonic() + 2
+    while len(sent) < 11 and time.monotonic() < deadline:
+        await asyncio.sleep(0.02)
+    publisher.stop()
+    
+    assert sent == [str(i) for i in range(11)]
+    assert spool.pending() == 0
@@ -0,0 +1,81 @@
+"""
+Tests for the worker's webhook subscription index
+"""
+
+import time
+
+import fakeredis
+
+from subscription_index import INDEX_KEY, SUBSCRIPTIONS_CHANNEL, VERSION_KEY, SubscriptionIndex, wants
+
+HOOK = {"id": "w-1", "url": "https://example.com/hook", "secret": "s", "headers_json": None,
+        "events": None, "include_partials": False}
+
+
+class Loader:
+    def __init__(self, subscriptions, during_load=None):
+        self.subscriptions = subscriptions
+        self.during_load = during_load
+        self.calls = 0
+
+    def __call__(self, organization_id):
+        self.calls += 1
+        if self.during_load:
+            self.during_load()
+        return self.subscriptions
+
+
+def invalidate_like_the_api(client, organization_id):
+    client.incr(VERSION_KEY.format(organization_id=organization_id))
+    client.delete(INDEX_KEY.format(organization_id=organization_id))
+    client.publish(SUBSCRIPTIONS_CHANNEL, organization_id)
+
+
+def test_database_is_read_once_across_processes():
+    client = fakeredis.FakeRedis()
+    loader = Loader([HOOK])
+
+    first = SubscriptionIndex(client, loader)
+    assert first.get("org-1") == [HOOK]
+    assert first.get("org-1") == [HOOK]
+    # Another worker process finds the Redis copy
+    assert SubscriptionIndex(client, loader).get("org-1") == [HOOK]
+    assert loader.calls == 1
+
+
+def test_rows_read_before_an_invalidation_are_not_cached_in_redis():
+    client = fakeredis.FakeRedis()
+    index = SubscriptionIndex(client, Loader([HOOK], during_load=lambda: invalidate_like_the_api(client, "org-1")))
+
+    index.get("org-1")
+
+    assert client.get(INDEX_KEY.format(organization_id="org-1")) is None
+
+
+def test_published_invalidation_drops_the_local_copy():
+    client = fakeredis.FakeRedis()
+    loader = Loader([HOOK])
+    index = SubscriptionIndex(client, loader)
+    index.start()
+    try:
+        deadline = time.monotonic() + 2
+        while client.pubsub_numsub(SUBSCRIPTIONS_CHANNEL)[0][1] == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        index.get("org-1")
+
+        loader.subscriptions = []
+        invalidate_like_the_api(client, "org-1")
+        while "org-1" in index._entries and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        assert index.get("org-1") == []
+        assert loader.calls == 2
+    finally:
+        index.stop()
+
+
+def test_event_filters_and_partials():
+    assert wants(HOOK, "submission.created", partial=False)
+    assert not wants(HOOK, "submission.partial", partial=True)
+    assert wants({**HOOK, "include_partials": True}, "submission.partial", partial=True)
+    assert not wants({**HOOK, "events": ["submission.partial"]}, "submission.created", partial=False)
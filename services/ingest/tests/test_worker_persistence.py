@@ -0,0 +1,297 @@
+"""
+Tests for the set-based, batched submission write path in the worker
+"""
+
+import json
+import os
+import uuid
+from contextlib import contextmanager
+from uuid import uuid4
+
+import fakeredis
+import pytest
+from sqlalchemy import create_engine, text
+
+import worker
+from answer_validation import BlockTypeCache
+
+SCHEMA = {"blocks": [{"id": "q0", "type": "email"}, {"id": "q1", "type": "number"}]}
+
+
+class RecordingSession:
+    """Fake session: form ids in `unpublished` fail, ids in `stored` conflict"""
+
+    def __init__(self, unpublished=(), stored=(), fail_commit=False):
+        self.statements = []
+        self.schema_lookups = 0
+        self.unpublished = set(unpublished)
+        self.stored = set(stored)
+        self.fail_commit = fail_commit
+        self.savepoints = 0
+        self.commits = 0
+        self.rollbacks = 0
+
+    def execute(self, statement, params):
+        if "forms_formversion" in str(statement):
+            self.schema_lookups += 1
+            row = (SCHEMA,)
+            return type("Result", (), {"fetchone": lambda self: row})()
+        self.statements.append((statement, params))
+        if statement is worker.INSERT_SUBMISSION_QUERY:
+            if params["form_id"] in self.unpublished:
+                row = (None, None)
+            elif params["id"] in self.stored:
+                row = ("org-1", None)
+            else:
+                row = ("org-1", params["id"])
+        else:
+            row = None
+        return type("Result", (), {"fetchone": lambda self: row})()
+
+    @contextmanager
+    def begin_nested(self):
+        self.savepoints += 1
+        yield
+
+    def commit(self):
+        if self.fail_commit:
+            raise RuntimeError("connection lost")
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        pass
+
+
+def submission(submission_id, fields=3, form_id="form-1"):
+    data = {
+        "id": submission_id,
+        "form_id": form_id,
+        "version": 3,
+        "respondent_key": "r-1",
+        "locale": "en",
+        "answers": {f"q{i}": {"value": i} for i in range(fields)},
+        "metadata": {"partial": True},
+    }
+    return [data, submission_id]
+
+
+@pytest.fixture
+def session(monkeypatch):
+    recording = RecordingSession()
+    monkeypatch.setattr(worker, "SessionLocal", lambda: recording)
+    monkeypatch.setattr(worker, "block_type_cache", BlockTypeCache())
+    return recording
+
+
+@pytest.mark.parametrize("fields", [1, 60, 200])
+def test_each_submission_is_two_statements(session, fields):
+    result = worker.save_submissions_to_db([submission("s-1", fields)])
+
+    assert result.stored[0][1] == "s-1"
+    assert [statement for statement, _ in session.statements] == [
+        worker.INSERT_SUBMISSION_QUERY,
+        worker.INSERT_ANSWERS_QUERY,
+    ]
+    assert session.statements[0][1]["partial"] is True
+
+    answer_params = session.statements[1][1]
+    assert answer_params["block_ids"] == [f"q{i}" for i in range(fields)]
+    assert [json.loads(value) for value in answer_params["values"]] == [{"value": i} for i in range(fields)]
+    assert len(set(answer_params["ids"])) == fields
+    assert answer_params["types"] == (["email", "number"] + ["text"] * (fields - 2))[:fields]
+
+
+def test_block_types_are_looked_up_once_per_version(session):
+    worker.save_submissions_to_db([submission(f"s-{i}") for i in range(3)])
+    worker.save_submissions_to_db([submission("s-3")])
+
+    assert session.schema_lookups == 1
+
+
+def test_batch_shares_one_transaction_and_isolates_failures(session):
+    session.unpublished = {"draft-form"}
+    session.stored = {"s-retried"}
+
+    result = worker.save_submissions_to_db([
+        submission("s-1"),
+        submission("s-bad", form_id="draft-form"),
+        submission("s-retried"),
+        submission("s-2"),
+    ])
+
+    assert [db_id for _, db_id in result.stored] == ["s-1", "s-2"]
+    assert result.duplicates == 1
+    assert [(submission_id, type(error)) for _, submission_id, error in result.failed] == [("s-bad", ValueError)]
+    assert session.commits == 1 and session.savepoints == 4
+    # Answers are not written again for a submission a retry finds stored
+    answer_writes = [params for statement, params in session.statements if statement is worker.INSERT_ANSWERS_QUERY]
+    assert [params["submission_id"] for params in answer_writes] == ["s-1", "s-2"]
+
+
+def test_analytics_event_uses_the_stored_organization(session):
+    data, submission_id = submission("s-1")
+    data["organization_id"] = None
+    data["metadata"]["submitted_at"] = "2026-01-01T00:00:00"
+
+    [(stored, _)] = worker.save_submissions_to_db([[data, submission_id]]).stored
+
+    assert worker.build_analytics_event(stored) == {
+        "event_type": "partial_save",
+        "form_id": "form-1",
+        "organization_id": "org-1",
+        "respondent_id": "r-1",
+        "session_id": "r-1",
+        "timestamp": "2026-01-01T00:00:00",
+        "submission_id": "s-1",
+        "is_partial": True,
+    }
+
+
+def test_transactions_are_capped_by_item_count(session, monkeypatch):
+    monkeypatch.setattr(worker.settings, "submission_txn_max_items", 2)
+
+    result = worker.save_submissions_to_db([submission(f"s-{i}") for i in range(5)])
+
+    assert len(result.stored) == 5
+    assert session.commits == 3
+
+
+def test_failed_commit_fails_every_pending_item(session):
+    session.fail_commit = True
+
+    result = worker.save_submissions_to_db([submission("s-1"), submission("s-2")])
+
+    assert result.stored == []
+    assert [submission_id for _, submission_id, _ in result.failed] == ["s-1", "s-2"]
+    assert session.rollbacks == 1
+
+
+def test_batch_task_requeues_failures_and_dispatches_stored(session, monkeypatch):
+    session.unpublished = {"draft-form"}
+    dispatched, requeued = [], []
+    monkeypatch.setattr(worker, "report_worker_lag", lambda submissions: None)
+    monkeypatch.setattr(worker, "dispatch_side_effects", dispatched.extend)
+    monkeypatch.setattr(worker.process_submission, "apply_async", lambda args, countdown: requeued.append(args[1]))
+
+    result = worker.process_submission_batch.run([submission("s-1"), submission("s-bad", form_id="draft-form")])
+
+    assert result == {"status": "success", "processed": 1, "duplicates": 0, "requeued": 1}
+    assert [db_id for _, db_id in dispatched] == ["s-1"]
+    assert requeued == ["s-bad"]
+
+
+class RecordingBuffer:
+    def __init__(self):
+        self.events = []
+
+    def add(self, event):
+        self.events.append(event)
+
+
+def test_analytics_task_queued_before_deploy_looks_up_the_organization(monkeypatch):
+    # Shaped like the payloads the previous release queued: no organization_id
+    data, _ = submission("s-1")
+    data["metadata"] = {"submitted_at": "2026-01-01T00:00:00", "partial": False, "client_ip": "1.2.3.4"}
+    buffer = RecordingBuffer()
+    monkeypatch.setattr(worker, "get_analytics_buffer", lambda: buffer)
+    monkeypatch.setattr(worker, "lookup_organization_id", lambda form_id: f"org-of-{form_id}")
+
+    assert worker.send_analytics.run(data) == {"status": "buffered"}
+    [event] = buffer.events
+    assert event["organization_id"] == "org-of-form-1"
+    assert event["event_type"] == "form_submit" and event["submission_id"] == "s-1"
+
+
+class StaticIndex:
+    def __init__(self, subscriptions):
+        self.subscriptions = subscriptions
+
+    def get(self, organization_id):
+        return self.subscriptions
+
+
+def test_webhooks_are_queued_for_the_delivery_engine(session, monkeypatch):
+    client = fakeredis.FakeRedis()
+    monkeypatch.setattr(worker, "get_redis_client", lambda: client)
+    monkeypatch.setattr(worker, "get_subscription_index", lambda: StaticIndex([
+        {"id": "w-1", "events": None, "include_partials": True},
+        {"id": "w-2", "events": ["submission.created"], "include_partials": True},
+        {"id": "w-3", "events": None, "include_partials": False},
+    ]))
+    data, _ = submission("s-1")
+    data["organization_id"] = "org-1"
+
+    worker.trigger_webhooks.run(data, "s-1")
+
+    [(statement, params)] = session.statements
+    assert statement is worker.INSERT_DELIVERIES_QUERY
+    assert params["webhook_ids"] == ["w-1"]
+    assert params["event"] == "submission.partial" and params["submission_id"] == "s-1"
+    assert session.commits == 1
+    assert [raw.decode() for raw in client.lrange(worker.DELIVERY_QUEUE_KEY, 0, -1)] == params["ids"]
+
+
+# The statements themselves, against PostgreSQL (skipped without TEST_DATABASE_URL).
+# Temporary tables shadow the real ones and everything is rolled back.
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+
+SCRATCH_TABLES = """
+    CREATE TEMP TABLE forms_form (id uuid PRIMARY KEY, organization_id uuid NOT NULL, status varchar(20) NOT NULL);
+    CREATE TEMP TABLE core_submission (
+        id uuid PRIMARY KEY, form_id uuid NOT NULL, version integer NOT NULL,
+        respondent_key varchar(255), locale varchar(10), started_at timestamptz,
+        completed_at timestamptz, metadata_json jsonb
+    );
+    CREATE TEMP TABLE core_answer (
+        id uuid PRIMARY KEY, submission_id uuid NOT NULL, block_id varchar(255),
+        type varchar(50), value_json jsonb, created_at timestamptz, updated_at timestamptz
+    );
+"""
+
+
+@pytest.fixture
+def postgres():
+    engine = create_engine(TEST_DATABASE_URL)
+    with engine.connect() as connection:
+        transaction = connection.begin()
+        try:
+            for statement in SCRATCH_TABLES.split(";"):
+                if statement.strip():
+                    connection.execute(text(statement))
+            yield connection
+        finally:
+            transaction.rollback()
+    engine.dispose()
+
+
+@pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL is not set")
+def test_insert_statements_run_on_postgres(postgres):
+    form_id, organization_id, draft_id = str(uuid4()), str(uuid4()), str(uuid4())
+    postgres.execute(
+        text("INSERT INTO forms_form VALUES (:id, :organization_id, 'published'), (:draft_id, :organization_id, 'draft')"),
+        {"id": form_id, "draft_id": draft_id, "organization_id": organization_id},
+    )
+    data, submission_id = submission(str(uuid4()), form_id=form_id)
+
+    assert worker.insert_submission(postgres, data) == uuid.UUID(submission_id)
+    assert data["organization_id"] == organization_id
+    # A retry conflicts instead of writing the submission twice
+    assert worker.insert_submission(postgres, dict(data)) is None
+
+    worker.insert_answers(postgres, submission_id, data["answers"], {"q0": "email"})
+    rows = postgres.execute(
+        text("SELECT block_id, type, value_json FROM core_answer WHERE submission_id = :id ORDER BY block_id"),
+        {"id": submission_id},
+    ).fetchall()
+    assert [tuple(row) for row in rows] == [
+        ("q0", "email", {"value": 0}),
+        ("q1", "text", {"value": 1}),
+        ("q2", "text", {"value": 2}),
+    ]
+
+    draft, _ = submission(str(uuid4()), form_id=draft_id)
+    with pytest.raises(ValueError):
+        worker.insert_submission(postgres, draft)
@@ -1,7 +1,7 @@
 """
 Celery worker for processing form submissions
 - Save submissions to database
-- Trigger webhooks
+- Queue webhook deliveries for the API's delivery engine
 - Send to analytics service
 """
 
@@ -9,16 +9,23 @@ import asyncio
 import json
 import time
 from datetime import datetime
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, NamedTuple, Optional, Tuple
 from uuid import uuid4
 
-import httpx
+import redis
 import structlog
 from celery import Celery
+from celery.signals import worker_process_init, worker_process_shutdown, worker_shutdown
 from pydantic_settings import BaseSettings
 from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker
 
+from analytics_buffer import AnalyticsBuffer
+from answer_validation import DEFAULT_ANSWER_TYPE, BlockTypeCache
+from http_clients import HTTPClientRegistry
+from load_shedding import WORKER_LAG_KEY
+from subscription_index import SUBSCRIPTIONS_QUERY, SubscriptionIndex, wants
+
 # Logging setup
 logger = structlog.get_logger()
 
@@ -30,10 +37,36 @@ class WorkerSettings(BaseSettings):
     celery_broker_url: str = "redis://localhost:6379/0"
     celery_result_backend: str = "redis://localhost:6379/0"
     
+    # Submissions per transaction: commit after N items or T ms, whichever first
+    submission_txn_max_items: int = 100
+    submission_txn_max_ms: int = 500
+    
+    # Block type maps compiled from FormVersion.schema
+    block_type_cache_max_entries: int = 10000
+    block_type_cache_ttl_seconds: int = 3600
+    
     # External services
     api_base_url: str = "http://localhost:8000"
     analytics_base_url: str = "http://localhost:8002"
     
+    # Outbound HTTP pools (one per origin, per worker process)
+    http2_enabled: bool = False
+    http_max_connections_per_host: int = 10
+    http_keepalive_expiry_seconds: float = 30.0
+    http_connect_timeout_seconds: float = 3.0
+    
+    # Analytics forwarding: POST /events/batch by count or age
+    analytics_batch_max_events: int = 500
+    analytics_batch_max_age_ms: int = 1000
+    analytics_retry_list_max_batches: int = 10000
+    # A spilled batch the service answers with 5xx this many times is dropped
+    analytics_retry_max_attempts: int = 10
+    
+    # Webhook subscription index (per organization, invalidated by the API)
+    webhook_subscriptions_max_entries: int = 10000
+    webhook_subscriptions_local_ttl_seconds: float = 60.0
+    webhook_subscriptions_redis_ttl_seconds: int = 3600
+    
     # Security
     internal_api_key: str = "internal-worker-key"
     
@@ -58,7 +91,7 @@ celery_app.conf.update(
     enable_utc=True,
     task_routes={
         "process_submission": {"queue": "submissions"},
-        "send_webhook": {"queue": "webhooks"},
+        "process_submission_batch": {"queue": "submissions"},
         "send_analytics": {"queue": "analytics"},
     },
     task_default_retry_delay=60,
@@ -69,6 +102,138 @@ celery_app.conf.update(
 engine = create_engine(settings.database_url)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Answer types per form version, shared by every task in the process
+block_type_cache = BlockTypeCache(
+    max_entries=settings.block_type_cache_max_entries,
+    ttl_seconds=settings.block_type_cache_ttl_seconds,
+)
+
+# Pooled HTTP clients, created per worker process (after the prefork fork)
+http_clients: Dict[str, HTTPClientRegistry] = {}
+
+def create_http_clients() -> Dict[str, HTTPClientRegistry]:
+    common = dict(
+        http2=settings.http2_enabled,
+        max_connections_per_host=settings.http_max_connections_per_host,
+        max_keepalive_per_host=settings.http_max_connections_per_host,
+        keepalive_expiry_seconds=settings.http_keepalive_expiry_seconds,
+        connect_timeout_seconds=settings.http_connect_timeout_seconds,
+    )
+    return {
+        # A single internal origin
+        "analytics": HTTPClientRegistry("analytics", timeout_seconds=10.0, max_hosts=1, **common),
+    }
+
+def get_http_client(name: str) -> HTTPClientRegistry:
+    # Lazily created when tasks run outside a prefork child (solo pool, eager)
+    if not http_clients:
+        http_clients.update(create_http_clients())
+    return http_clients[name]
+
+def close_http_clients():
+    registries = list(http_clients.values())
+    http_clients.clear()
+    for registry in registries:
+        registry.close()
+
+# Broker connection for worker lag reports and spilled analytics batches
+_redis_client = None
+
+def get_redis_client() -> redis.Redis:
+    global _redis_client
+    if _redis_client is None:
+        _redis_client = redis.from_url(settings.celery_broker_url)
+    return _redis_client
+
+# Analytics events coalesced across tasks, per worker process
+analytics_buffer: Optional[AnalyticsBuffer] = None
+
+def get_analytics_buffer() -> AnalyticsBuffer:
+    global analytics_buffer
+    if analytics_buffer is None:
+        analytics_buffer = AnalyticsBuffer(
+            get_http_client("analytics").post,
+            f"{settings.analytics_base_url}/events/batch",
+            headers={"Authorization": f"Bearer {settings.internal_api_key}"},
+            redis_client=get_redis_client(),
+            max_events=settings.analytics_batch_max_events,
+            max_age_ms=settings.analytics_batch_max_age_ms,
+            retry_list_max_batches=settings.analytics_retry_list_max_batches,
+            retry_max_attempts=settings.analytics_retry_max_attempts,
+        )
+        analytics_buffer.start()
+    return analytics_buffer
+
+def load_subscriptions(organization_id: str) -> List[Dict[str, Any]]:
+    """Active webhooks of an organization, as stored in the subscription index"""
+    db = SessionLocal()
+    try:
+        rows = db.execute(text(SUBSCRIPTIONS_QUERY), {"organization_id": organization_id}).fetchall()
+    finally:
+        db.close()
+    return [
+        {
+            "id": str(webhook_id),
+            "url": url,
+            "secret": secret,
+            "headers_json": headers_json,
+            "events": events,
+            "include_partials": bool(include_partials),
+        }
+        for webhook_id, url, secret, headers_json, events, include_partials in rows
+    ]
+
+# Webhook subscriptions per organization, so fan-out needs no SQL
+subscription_index: Optional[SubscriptionIndex] = None
+
+def get_subscription_index() -> SubscriptionIndex:
+    global subscription_index
+    if subscription_index is None:
+        subscription_index = SubscriptionIndex(
+            get_redis_client(),
+            load_subscriptions,
+            max_entries=settings.webhook_subscriptions_max_entries,
+            local_ttl_seconds=settings.webhook_subscriptions_local_ttl_seconds,
+            redis_ttl_seconds=settings.webhook_subscriptions_redis_ttl_seconds,
+        )
+        subscription_index.start()
+    return subscription_index
+
+@worker_process_init.connect
+def init_worker_process(**kwargs):
+    global _redis_client, analytics_buffer, subscription_index
+    # Connections and threads are not inherited usefully across fork
+    http_clients.clear()
+    _redis_client = None
+    analytics_buffer = None
+    subscription_index = None
+    http_clients.update(create_http_clients())
+    get_analytics_buffer()
+    get_subscription_index()
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def shutdown_worker_process(**kwargs):
+    global analytics_buffer, subscription_index
+    if subscription_index is not None:
+        subscription_index.stop()
+        subscription_index = None
+    # Flush before the pools it sends through are closed
+    if analytics_buffer is not None:
+        analytics_buffer.close()
+        analytics_buffer = None
+    close_http_clients()
+
+def report_worker_lag(submissions: List[List[Any]]):
+    """Publish how far behind the oldest submission in this batch was"""
+    try:
+        submitted_at = submissions[0][0]["metadata"]["submitted_at"]
+        lag_ms = int((datetime.utcnow() - datetime.fromisoformat(submitted_at)).total_seconds() * 1000)
+        # Expires so a stopped worker pool does not pin a stale lag
+        get_redis_client().set(WORKER_LAG_KEY, max(0, lag_ms), px=30000)
+    except Exception as e:
+        logger.warning("Failed to report worker lag", error=str(e))
+
 @celery_app.task(bind=True, name="process_submission")
 def process_submission(self, submission_data: Dict[str, Any], submission_id: str):
     """
@@ -78,21 +243,21 @@ def process_submission(self, submission_data: Dict[str, Any], submission_id: str
     
     try:
         # Save submission to database
-        db_submission_id = save_submission_to_db(submission_data)
-        
-        # Send to analytics (non-blocking)
-        send_analytics.delay(submission_data)
+        result = save_submissions_to_db([[submission_data, submission_id]])
+        if result.failed:
+            raise result.failed[0][2]
         
-        # Trigger webhooks (if any)
-        trigger_webhooks.delay(submission_data, db_submission_id)
+        # Already stored by an earlier attempt: its side effects went out then
+        if result.stored:
+            dispatch_side_effects(result.stored)
         
         logger.info(
             "Submission processed successfully",
             submission_id=submission_id,
-            db_submission_id=db_submission_id
+            duplicate=not result.stored
         )
         
-        return {"status": "success", "submission_id": db_submission_id}
+        return {"status": "success", "submission_id": submission_data["id"]}
         
     except Exception as e:
         logger.error(
@@ -103,113 +268,227 @@ def process_submission(self, submission_data: Dict[str, Any], submission_id: str
         # Retry with exponential backoff
         raise self.retry(exc=e, countdown=60 * (2 ** self.request.retries))
 
-def save_submission_to_db(submission_data: Dict[str, Any]) -> str:
-    """Save submission to PostgreSQL database"""
+@celery_app.task(bind=True, name="process_submission_batch")
+def process_submission_batch(self, submissions: List[List[Any]]):
+    """
+    Process a batch of submissions published by the ingest batching publisher.
+    Each item is a [submission_data, submission_id] pair. The batch is written
+    with one session in as few transactions as the size/time caps allow; items
+    that fail are re-queued individually so they get their own retries.
+    """
+    logger.info("Processing submission batch", batch_size=len(submissions))
+    if submissions:
+        report_worker_lag(submissions)
+    
+    result = save_submissions_to_db(submissions)
+    dispatch_side_effects(result.stored)
+    
+    for submission_data, submission_id, error in result.failed:
+        logger.error(
+            "Failed to process submission from batch, requeueing",
+            submission_id=submission_id,
+            error=str(error)
+        )
+        process_submission.apply_async(args=[submission_data, submission_id], countdown=60)
+    
+    logger.info(
+        "Submission batch processed",
+        batch_size=len(submissions),
+        processed=len(result.stored),
+        duplicates=result.duplicates,
+        requeued=len(result.failed)
+    )
+    
+    return {
+        "status": "success",
+        "processed": len(result.stored),
+        "duplicates": result.duplicates,
+        "requeued": len(result.failed)
+    }
+
+def dispatch_side_effects(stored: List[Tuple[Dict[str, Any], str]]):
+    """Buffer analytics events and queue webhooks for newly committed submissions"""
+    for submission_data, db_submission_id in stored:
+        get_analytics_buffer().add(build_analytics_event(submission_data))
+        trigger_webhooks.delay(submission_data, db_submission_id)
+
+# Form check and submission insert in one statement. Returns the form's
+# organization (NULL when it is not published) and the inserted id, which is NULL when a previous attempt
+# already stored this submission (ingest assigns the id, so retries conflict).
+INSERT_SUBMISSION_QUERY = text("""
+    WITH form AS (
+        SELECT id, organization_id FROM forms_form
+        WHERE id = :form_id AND status = 'published'
+    ), inserted AS (
+        INSERT INTO core_submission (
+            id, form_id, version, respondent_key, locale,
+            started_at, completed_at, metadata_json
+        )
+        SELECT
+            CAST(:id AS uuid), form.id, :version, :respondent_key, :locale,
+            now(), CASE WHEN :partial THEN NULL ELSE now() END, CAST(:metadata_json AS jsonb)
+        FROM form
+        ON CONFLICT (id) DO NOTHING
+        RETURNING id
+    )
+    SELECT (SELECT organization_id FROM form), (SELECT id FROM inserted)
+""")
+
+# All answers of a submission in one statement, whatever the field count.
+# Arrays keep the statement text (and its cached plan) the same for every form.
+INSERT_ANSWERS_QUERY = text("""
+    INSERT INTO core_answer (
+        id, submission_id, block_id, type, value_json,
+        created_at, updated_at
+    )
+    SELECT
+        answer.id, CAST(:submission_id AS uuid), answer.block_id, answer.type, answer.value_json,
+        now(), now()
+    FROM unnest(
+        CAST(:ids AS uuid[]),
+        CAST(:block_ids AS varchar[]),
+        CAST(:types AS varchar[]),
+        CAST(:values AS jsonb[])
+    ) AS answer(id, block_id, type, value_json)
+""")
+
+def insert_submission(db, submission_data: Dict[str, Any]) -> Optional[str]:
+    """
+    Insert the submission row and return its id, or None if it was already
+    stored. Raises ValueError if the form is not published.
+    """
+    organization_id, submission_id = db.execute(INSERT_SUBMISSION_QUERY, {
+        "id": submission_data["id"],
+        "form_id": submission_data["form_id"],
+        "version": submission_data["version"],
+        "respondent_key": submission_data["respondent_key"],
+        "locale": submission_data["locale"],
+        "partial": bool(submission_data["metadata"].get("partial")),
+        "metadata_json": json.dumps(submission_data["metadata"])
+    }).fetchone()
+    
+    if organization_id is None:
+        raise ValueError(f"Form {submission_data['form_id']} not found or not published")
+    # Ingest leaves it empty when its form registry failed open
+    if not submission_data.get("organization_id"):
+        submission_data["organization_id"] = str(organization_id)
+    return submission_id
+
+def insert_answers(db, submission_id: str, answers: Dict[str, Any], block_types: Dict[str, str]):
+    """Insert every answer of a submission with one round trip, typed by block"""
+    if not answers:
+        return
+    
+    db.execute(INSERT_ANSWERS_QUERY, {
+        "submission_id": submission_id,
+        "ids": [str(uuid4()) for _ in answers],
+        "block_ids": list(answers),
+        "types": [block_types.get(block_id, DEFAULT_ANSWER_TYPE) for block_id in answers],
+        "values": [json.dumps(value) for value in answers.values()]
+    })
+
+class SaveResult(NamedTuple):
+    # (submission_data, db_submission_id) committed by this call
+    stored: List[Tuple[Dict[str, Any], str]]
+    # Submissions a previous attempt already committed
+    duplicates: int
+    # (submission_data, submission_id, error) to be retried on their own
+    failed: List[Tuple[Dict[str, Any], str, Exception]]
+
+def save_submissions_to_db(submissions: List[List[Any]]) -> SaveResult:
+    """
+    Save submissions to PostgreSQL with one session. Each item runs in its own
+    savepoint so a bad submission only rolls back itself; the transaction is
+    committed every submission_txn_max_items items or submission_txn_max_ms.
+    """
+    stored: List[Tuple[Dict[str, Any], str]] = []
+    failed: List[Tuple[Dict[str, Any], str, Exception]] = []
+    duplicates = 0
+    
     db = SessionLocal()
+    # Items written since the last commit; only final once it succeeds
+    pending: List[Tuple[Dict[str, Any], str, Optional[str]]] = []
+    txn_started = time.monotonic()
+    
+    def commit():
+        nonlocal duplicates, pending, txn_started
+        try:
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error("Failed to commit submission batch", error=str(e), batch_size=len(pending))
+            failed.extend((submission_data, submission_id, e) for submission_data, submission_id, _ in pending)
+        else:
+            for submission_data, submission_id, db_submission_id in pending:
+                if db_submission_id is None:
+                    duplicates += 1
+                else:
+                    stored.append((submission_data, db_submission_id))
+        pending = []
+        txn_started = time.monotonic()
+    
     try:
-        # Get form to validate it exists
-        form_query = text("""
-            SELECT id, organization_id FROM forms_form 
-            WHERE id = :form_id AND status = 'published'
-        """)
-        form_result = db.execute(form_query, {"form_id": submission_data["form_id"]}).fetchone()
-        
-        if not form_result:
-            raise ValueError(f"Form {submission_data['form_id']} not found or not published")
-        
-        form_id, organization_id = form_result
-        
-        # Insert submission
-        submission_query = text("""
-            INSERT INTO core_submission (
-                id, form_id, version, respondent_key, locale,
-                started_at, completed_at, metadata_json
-            ) VALUES (
-                :id, :form_id, :version, :respondent_key, :locale,
-                :started_at, :completed_at, :metadata_json
-            ) RETURNING id
-        """)
-        
-        completed_at = None if submission_data["metadata"].get("partial") else datetime.utcnow()
-        
-        submission_result = db.execute(submission_query, {
-            "id": submission_data["id"],
-            "form_id": form_id,
-            "version": submission_data["version"],
-            "respondent_key": submission_data["respondent_key"],
-            "locale": submission_data["locale"],
-            "started_at": datetime.utcnow(),
-            "completed_at": completed_at,
-            "metadata_json": json.dumps(submission_data["metadata"])
-        }).fetchone()
-        
-        db_submission_id = submission_result[0]
-        
-        # Insert answers
-        for block_id, value in submission_data["answers"].items():
-            answer_query = text("""
-                INSERT INTO core_answer (
-                    id, submission_id, block_id, type, value_json,
-                    created_at, updated_at
-                ) VALUES (
-                    :id, :submission_id, :block_id, :type, :value_json,
-                    :created_at, :updated_at
-                )
-            """)
+        for submission_data, submission_id in submissions:
+            try:
+                with db.begin_nested():
+                    db_submission_id = insert_submission(db, submission_data)
+                    if db_submission_id is not None:
+                        insert_answers(
+                            db,
+                            db_submission_id,
+                            submission_data["answers"],
+                            block_type_cache.get(db, submission_data["form_id"], submission_data["version"])
+                        )
+            except Exception as e:
+                logger.error("Failed to save submission to database", submission_id=submission_id, error=str(e))
+                failed.append((submission_data, submission_id, e))
+                continue
             
-            db.execute(answer_query, {
-                "id": str(uuid4()),
-                "submission_id": db_submission_id,
-                "block_id": block_id,
-                "type": "text",  # Default type, could be inferred from form schema
-                "value_json": json.dumps(value),
-                "created_at": datetime.utcnow(),
-                "updated_at": datetime.utcnow()
-            })
-        
-        db.commit()
-        logger.info("Submission saved to database", submission_id=db_submission_id)
-        return db_submission_id
-        
-    except Exception as e:
-        db.rollback()
-        logger.error("Failed to save submission to database", error=str(e))
-        raise
+            pending.append((submission_data, submission_id, db_submission_id))
+            if (
+                len(pending) >= settings.submission_txn_max_items
+                or (time.monotonic() - txn_started) * 1000 >= settings.submission_txn_max_ms
+            ):
+                commit()
+        
+        if pending:
+            commit()
     finally:
         db.close()
+    
+    logger.info(
+        "Submissions saved to database",
+        stored=len(stored),
+        duplicates=duplicates,
+        failed=len(failed)
+    )
+    return SaveResult(stored, duplicates, failed)
+
+def build_analytics_event(submission_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Shape a stored submission as an analytics service Event"""
+    metadata = submission_data["metadata"]
+    partial = bool(metadata.get("partial", False))
+    return {
+        "event_type": "partial_save" if partial else "form_submit",
+        "form_id": submission_data["form_id"],
+        # Tasks queued before submissions carried it look the organization up
+        "organization_id": submission_data.get("organization_id") or lookup_organization_id(submission_data["form_id"]),
+        "respondent_id": submission_data["respondent_key"],
+        "session_id": metadata.get("session_id") or submission_data["respondent_key"],
+        "timestamp": metadata["submitted_at"],
+        "submission_id": submission_data["id"],
+        "is_partial": partial,
+    }
 
 @celery_app.task(bind=True, name="send_analytics")
 def send_analytics(self, submission_data: Dict[str, Any]):
-    """Send submission data to analytics service"""
+    """Buffer a submission's analytics event (kept for tasks already queued)"""
     try:
-        analytics_payload = {
-            "event_type": "submission",
-            "form_id": submission_data["form_id"],
-            "submission_id": submission_data["id"],
-            "timestamp": submission_data["metadata"]["submitted_at"],
-            "partial": submission_data["metadata"].get("partial", False),
-            "metadata": {
-                "locale": submission_data["locale"],
-                "client_ip": submission_data["metadata"].get("client_ip"),
-                "user_agent": submission_data["metadata"].get("user_agent"),
-            }
-        }
-        
-        # Send to analytics service (async)
-        with httpx.Client() as client:
-            response = client.post(
-                f"{settings.analytics_base_url}/events",
-                json=analytics_payload,
-                headers={"Authorization": f"Bearer {settings.internal_api_key}"},
-                timeout=10
-            )
-            response.raise_for_status()
-        
-        logger.info("Analytics event sent", submission_id=submission_data["id"])
-        
+        get_analytics_buffer().add(build_analytics_event(submission_data))
+        return {"status": "buffered"}
     except Exception as e:
         logger.error(
-            "Failed to send analytics event",
+            "Failed to buffer analytics event",
             submission_id=submission_data["id"],
             error=str(e)
         )
@@ -218,36 +497,24 @@ def send_analytics(self, submission_data: Dict[str, Any]):
 
 @celery_app.task(bind=True, name="trigger_webhooks")
 def trigger_webhooks(self, submission_data: Dict[str, Any], db_submission_id: str):
-    """Trigger webhooks for the form"""
-    db = SessionLocal()
+    """Trigger webhooks for the form's organization from the subscription index"""
     try:
-        # Get webhooks for the form's organization
-        webhook_query = text("""
-            SELECT w.id, w.url, w.secret, w.headers_json, w.active
-            FROM webhooks_webhook w
-            JOIN forms_form f ON f.organization_id = w.organization_id
-            WHERE f.id = :form_id AND w.active = true
-        """)
-        
-        webhooks = db.execute(webhook_query, {"form_id": submission_data["form_id"]}).fetchall()
-        
-        for webhook in webhooks:
-            webhook_id, url, secret, headers_json, active = webhook
-            
-            # Queue individual webhook delivery
-            send_webhook.delay(
-                webhook_id,
-                url,
-                secret,
-                headers_json,
-                submission_data,
-                db_submission_id
-            )
+        organization_id = submission_data.get("organization_id") or lookup_organization_id(submission_data["form_id"])
+        partial = bool(submission_data["metadata"].get("partial"))
+        event = "submission.partial" if partial else "submission.created"
+        
+        subscriptions = [
+            subscription
+            for subscription in get_subscription_index().get(organization_id)
+            if wants(subscription, event, partial)
+        ]
+        # The API's delivery engine builds, signs and sends the payload
+        queue_deliveries(db_submission_id, event, [subscription["id"] for subscription in subscriptions])
         
         logger.info(
             "Webhooks queued",
             submission_id=db_submission_id,
-            webhook_count=len(webhooks)
+            webhook_count=len(subscriptions)
         )
         
     except Exception as e:
@@ -256,151 +523,57 @@ def trigger_webhooks(self, submission_data: Dict[str, Any], db_submission_id: st
             submission_id=db_submission_id,
             error=str(e)
         )
-    finally:
-        db.close()
 
-@celery_app.task(bind=True, name="send_webhook", max_retries=5)
-def send_webhook(
-    self,
-    webhook_id: str,
-    url: str,
-    secret: str,
-    headers_json: Optional[str],
-    submission_data: Dict[str, Any],
-    db_submission_id: str
-):
-    """Send webhook with retry logic"""
-    import hmac
-    import hashlib
-    
-    try:
-        # Prepare webhook payload
-        payload = {
-            "event": "submission.created" if not submission_data["metadata"].get("partial") else "submission.partial",
-            "submission": {
-                "id": db_submission_id,
-                "form_id": submission_data["form_id"],
-                "respondent_key": submission_data["respondent_key"],
-                "locale": submission_data["locale"],
-                "answers": submission_data["answers"],
-                "metadata": submission_data["metadata"],
-                "created_at": submission_data["metadata"]["submitted_at"]
-            }
-        }
-        
-        payload_json = json.dumps(payload, separators=(",", ":"))
-        payload_bytes = payload_json.encode("utf-8")
-        
-        # Generate HMAC signature
-        signature = hmac.new(
-            secret.encode("utf-8"),
-            payload_bytes,
-            hashlib.sha256
-        ).hexdigest()
-        
-        # Prepare headers
-        headers = {
-            "Content-Type": "application/json",
-            "X-Forms-Signature": f"sha256={signature}",
-            "X-Forms-Delivery": str(uuid4()),
-            "User-Agent": "Forms-Webhooks/1.0"
-        }
-        
-        # Add custom headers
-        if headers_json:
-            custom_headers = json.loads(headers_json)
-            headers.update(custom_headers)
-        
-        # Send webhook
-        with httpx.Client() as client:
-            response = client.post(
-                url,
-                data=payload_bytes,
-                headers=headers,
-                timeout=30
-            )
-            response.raise_for_status()
-        
-        # Log successful delivery
-        logger.info(
-            "Webhook delivered successfully",
-            webhook_id=webhook_id,
-            submission_id=db_submission_id,
-            status_code=response.status_code
-        )
-        
-        # Record delivery in database
-        record_webhook_delivery(
-            webhook_id,
-            db_submission_id,
-            "success",
-            response.status_code,
-            None,
-            self.request.retries + 1
-        )
-        
-    except Exception as e:
-        logger.error(
-            "Webhook delivery failed",
-            webhook_id=webhook_id,
-            submission_id=db_submission_id,
-            error=str(e),
-            retry_count=self.request.retries
-        )
-        
-        # Record failed delivery
-        record_webhook_delivery(
-            webhook_id,
-            db_submission_id,
-            "failed",
-            None,
-            str(e),
-            self.request.retries + 1
-        )
-        
-        # Retry with exponential backoff
-        countdown = 60 * (2 ** self.request.retries)
-        raise self.retry(exc=e, countdown=countdown, max_retries=5)
-
-def record_webhook_delivery(
-    webhook_id: str,
-    submission_id: str,
-    status: str,
-    status_code: Optional[int],
-    error: Optional[str],
-    attempt: int
-):
-    """Record webhook delivery attempt in database"""
+# Shared with services/api/webhooks/queue.py
+DELIVERY_QUEUE_KEY = "webhooks:deliveries"
+
+# Pending webhooks_delivery rows for the delivery engine, one per webhook
+INSERT_DELIVERIES_QUERY = text("""
+    INSERT INTO webhooks_delivery (
+        id, webhook_id, submission_id, event, status, attempt,
+        error, payload_size, created_at
+    )
+    SELECT
+        delivery.id, delivery.webhook_id, CAST(:submission_id AS uuid), :event, 'pending', 1,
+        '', 0, now()
+    FROM unnest(
+        CAST(:ids AS uuid[]),
+        CAST(:webhook_ids AS uuid[])
+    ) AS delivery(id, webhook_id)
+""")
+
+def queue_deliveries(submission_id: str, event: str, webhook_ids: List[str]) -> List[str]:
+    """Create pending deliveries and hand their ids to the delivery engine"""
+    if not webhook_ids:
+        return []
+    delivery_ids = [str(uuid4()) for _ in webhook_ids]
     db = SessionLocal()
     try:
-        delivery_query = text("""
-            INSERT INTO webhooks_webhookdelivery (
-                id, webhook_id, submission_id, status, attempt,
-                status_code, error, sent_at, created_at, updated_at
-            ) VALUES (
-                :id, :webhook_id, :submission_id, :status, :attempt,
-                :status_code, :error, :sent_at, :created_at, :updated_at
-            )
-        """)
-        
-        db.execute(delivery_query, {
-            "id": str(uuid4()),
-            "webhook_id": webhook_id,
+        db.execute(INSERT_DELIVERIES_QUERY, {
+            "ids": delivery_ids,
+            "webhook_ids": webhook_ids,
             "submission_id": submission_id,
-            "status": status,
-            "attempt": attempt,
-            "status_code": status_code,
-            "error": error,
-            "sent_at": datetime.utcnow(),
-            "created_at": datetime.utcnow(),
-            "updated_at": datetime.utcnow()
+            "event": event,
         })
-        
         db.commit()
-        
+    finally:
+        db.close()
+    
+    try:
+        get_redis_client().lpush(DELIVERY_QUEUE_KEY, *delivery_ids)
     except Exception as e:
-        logger.error("Failed to record webhook delivery", error=str(e))
-        db.rollback()
+        # The rows stay pending; the API's run_webhook_scheduler --rebuild queues them again
+        logger.warning("Failed to queue webhook deliveries", submission_id=submission_id, error=str(e))
+    return delivery_ids
+
+def lookup_organization_id(form_id: str) -> str:
+    """Organization of a form, for tasks queued before submissions carried it"""
+    db = SessionLocal()
+    try:
+        return str(db.execute(
+            text("SELECT organization_id FROM forms_form WHERE id = :form_id"),
+            {"form_id": form_id}
+        ).scalar_one())
     finally:
         db.close()
 